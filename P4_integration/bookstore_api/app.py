@@ -4,19 +4,65 @@ Bookstore API
 
 A RESTful Flask application that provides endpoints to manage books.
 """
-from flask import Flask, jsonify, request, abort
+from flask import (
+    Flask, Response, jsonify, request, abort, g, stream_with_context
+)
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import json
+import atexit
+from datetime import datetime, timezone
 import os
 import time
+from urllib.parse import urlencode
 import uuid
 
+from cache import CachedResponse, ResponseCache, SearchCache
+import changes as change_feed
+import idempotency
+from indexes import CatalogIndex, cursor_key, parse_query
+from latency import LatencyInjector
+import metrics
+from pagination import (
+    DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, parse_fields, parse_limit,
+    project
+)
+from profiling import TRUE_VALUES, Profiler
+from records import Book
+from search import SearchIndex
+import streaming
+from suggest import MAX_SUGGESTIONS, SuggestIndex
+from storage import open_storage
+from store import BookStore, ConflictError, DuplicateIdError, fingerprint
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider for book records that counts encoding time as serialization."""
+
+    @staticmethod
+    def default(value):
+        """Serialize records as dicts, and anything else as usual."""
+        if isinstance(value, Book):
+            return value.to_dict()
+        return DefaultJSONProvider.default(value)
+
+    def dumps(self, obj, **kwargs):
+        with metrics.phase('serialization'):
+            return super().dumps(obj, **kwargs)
+
+
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 CORS(app)  # Enable Cross-Origin Resource Sharing
 
 # Data file to persist books
 DATA_FILE = os.path.join(os.path.dirname(__file__), 'books.json')
 
+# Where the catalog is stored: a JSON file path or sqlite:///path/to/books.db
+STORAGE_LOCATION = os.environ.get('BOOKSTORE_STORAGE', DATA_FILE)
+
+# Whether /api/books/changes is served; its log is numbered per process, so
+# serve.py turns it off when running several workers
+CHANGE_FEED = os.environ.get('BOOKSTORE_CHANGE_FEED', 'on').lower() in TRUE_VALUES
+
 # Initialize with some sample books if the file doesn't exist
 SAMPLE_BOOKS = [
     {
@@ -43,143 +89,983 @@ SAMPLE_BOOKS = [
 ]
 
 
+store = None
+search_index = None
+catalog_index = None
+suggest_index = None
+search_cache = None
+change_log = None
+response_cache = None
+
+
+def init_store(new_store):
+    """Install the book store and attach the indexes and caches that follow it."""
+    global store, search_index, catalog_index, suggest_index, search_cache, change_log
+    global response_cache
+    search_index = SearchIndex()
+    catalog_index = CatalogIndex()
+    suggest_index = SuggestIndex()
+    search_cache = SearchCache()
+    change_log = change_feed.ChangeLog()
+    response_cache = ResponseCache()
+    new_store.add_index('search', search_index)
+    new_store.add_listener(catalog_index.on_change)
+    new_store.add_listener(suggest_index.on_change)
+    new_store.add_listener(search_cache.on_change)
+    if CHANGE_FEED:
+        new_store.add_listener(change_log.on_change)
+    new_store.add_listener(response_cache.on_change)
+    metrics.instrument_storage(new_store.storage)
+    store = new_store
+    return store
+
+
+# Resident catalog: loaded once, served from memory, flushed in the background
+init_store(BookStore(
+    open_storage(STORAGE_LOCATION, default_books=SAMPLE_BOOKS),
+    flush_interval=float(os.environ.get('BOOKSTORE_FLUSH_INTERVAL', 0.5)),
+    reload_interval=float(os.environ.get('BOOKSTORE_RELOAD_INTERVAL', 1.0)),
+))
+atexit.register(lambda: store.close())
+
+# Responses to POST /api/books, replayed to retries that send the same
+# Idempotency-Key; kept beside the catalog so every worker process shares
+# them, and across store changes. The file is only created once a key is used
+idempotency_keys = idempotency.SqliteIdempotencyStore(f"{store.storage.path}.keys")
+atexit.register(lambda: idempotency_keys.close())
+
+# Artificial delay, off unless BOOKSTORE_LATENCY is set (e.g. to "legacy")
+latency = LatencyInjector(os.environ.get('BOOKSTORE_LATENCY'))
+
+
+# Per-request profiling, off unless BOOKSTORE_PROFILE is set
+profiler = Profiler(os.environ.get('BOOKSTORE_PROFILE'),
+                    directory=os.environ.get('BOOKSTORE_PROFILE_DIR'))
+
+
+# Request instrumentation, served at /metrics
+registry = metrics.Registry()
+REQUESTS = registry.counter(
+    'bookstore_requests_total', "Requests handled, by endpoint and status.",
+    ('endpoint', 'method', 'status'))
+REQUEST_DURATION = registry.histogram(
+    'bookstore_request_duration_seconds', "Time to produce a response, by endpoint.",
+    ('endpoint', 'method'))
+REQUEST_PHASES = registry.histogram(
+    'bookstore_request_phase_seconds',
+    "Time per request spent in storage, handler, serialization and injected delay.",
+    ('endpoint', 'phase'))
+registry.gauge('bookstore_catalog_books', "Books in the catalog.",
+               lambda: len(store))
+registry.gauge('bookstore_response_cache_hit_ratio', "Response cache hit ratio.",
+               lambda: response_cache.stats()['hit_ratio'])
+registry.gauge('bookstore_response_cache_hits_total', "Response cache hits.",
+               lambda: response_cache.stats()['hits'], kind='counter')
+registry.gauge('bookstore_response_cache_misses_total', "Response cache misses.",
+               lambda: response_cache.stats()['misses'], kind='counter')
+registry.gauge('bookstore_response_cache_entries', "Responses held in the cache.",
+               lambda: response_cache.stats()['entries'])
+registry.gauge('bookstore_response_cache_bytes', "Bytes held in the response cache.",
+               lambda: response_cache.stats()['bytes'])
+registry.gauge('bookstore_search_cache_hit_ratio', "Search cache hit ratio.",
+               lambda: search_cache.stats()['hit_ratio'])
+registry.gauge('bookstore_search_cache_hits_total', "Search cache hits.",
+               lambda: search_cache.stats()['hits'], kind='counter')
+registry.gauge('bookstore_search_cache_misses_total', "Search cache misses.",
+               lambda: search_cache.stats()['misses'], kind='counter')
+registry.gauge('bookstore_search_cache_invalidations_total',
+               "Searches dropped from the cache by catalog changes.",
+               lambda: search_cache.stats()['invalidations'], kind='counter')
+registry.gauge('bookstore_search_cache_entries', "Searches held in the cache.",
+               lambda: search_cache.stats()['entries'])
+registry.gauge('bookstore_idempotent_replays_total',
+               "Retried requests answered with a remembered response.",
+               lambda: idempotency_keys.stats()['replays'], kind='counter')
+registry.gauge('bookstore_injected_latency_seconds_total',
+               "Artificial delay injected, by endpoint.",
+               lambda: {(endpoint,): stats['seconds']
+                        for endpoint, stats in latency.stats().items()},
+               labels=('endpoint',), kind='counter')
+
+PHASES = ('storage', 'serialization', 'injected')
+
+
+@app.before_request
+def start_timing():
+    """Start timing the request and its phases."""
+    g.request_started = time.perf_counter()
+    metrics.start_request()
+
+
+@app.after_request
+def record_metrics(response):
+    """
+    Record the request's latency, split into phases.
+
+    Registered before the other hooks, so it runs after them and includes
+    their time.
+    """
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    timings = metrics.finish_request()
+    timings['injected'] = g.get('injected_latency', 0.0)
+
+    endpoint = request.endpoint or 'unmatched'
+    REQUESTS.inc(endpoint=endpoint, method=request.method,
+                 status=str(response.status_code))
+    REQUEST_DURATION.observe(elapsed, endpoint=endpoint, method=request.method)
+    for name in PHASES:
+        REQUEST_PHASES.observe(timings.get(name, 0.0), endpoint=endpoint, phase=name)
+    handler = elapsed - sum(timings.get(name, 0.0) for name in PHASES)
+    REQUEST_PHASES.observe(max(0.0, handler), endpoint=endpoint, phase='handler')
+    return response
+
+
+@app.before_request
+def inject_latency():
+    """Simulate network delay for realistic API behavior, if configured."""
+    g.injected_latency = latency.inject(request.endpoint)
+
+
+@app.after_request
+def report_latency(response):
+    """Report injected delay separately from real processing time."""
+    injected = g.get('injected_latency', 0.0)
+    if injected:
+        response.headers.add('Server-Timing', f"injected;dur={injected * 1000:.1f}")
+    return response
+
+
 def load_books():
-    """Load books from the data file."""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            return json.load(f)
-    else:
-        # Initialize with sample books if file doesn't exist
-        save_books(SAMPLE_BOOKS)
-        return SAMPLE_BOOKS
+    """Load books from the in-memory store."""
+    return store.all()
 
 
 def save_books(books):
-    """Save books to the data file."""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(books, f, indent=2)
+    """Replace the catalog and persist it."""
+    store.replace(books)
+
+
+# Largest number of items accepted by the bulk endpoints
+MAX_BULK_ITEMS = 10000
+
+
+def parse_price(value):
+    """Convert a price from request data to a float."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError("Price must be a number")
+
+
+def new_book_id():
+    """Generate an ID for a new book, random enough not to repeat in practice."""
+    return uuid.uuid4().hex[:16]
+
+
+def add_new_book(book):
+    """Add a book with a generated ID, choosing another if it is taken."""
+    while True:
+        try:
+            return store.add(book)
+        except DuplicateIdError:
+            book = book.replace(id=new_book_id())
+
+
+def parse_text(data, field):
+    """Return a required text field from request data."""
+    value = data[field]
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"{field.capitalize()} must be a non-empty string")
+    return value
+
+
+def new_book_from(data):
+    """
+    Build a new book record from request data.
+
+    Raises:
+        ValueError: If the data is not a valid book
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Book must be a JSON object")
+    
+    # Validate required fields
+    if not all(k in data for k in ('title', 'author', 'price')):
+        raise ValueError("Missing required fields: title, author, price")
+    
+    return Book(
+        id=new_book_id(),
+        title=parse_text(data, 'title'),
+        author=parse_text(data, 'author'),
+        price=parse_price(data['price']),
+        in_stock=data.get('in_stock', True)
+    )
+
+
+def book_changes(data):
+    """
+    Work out the field changes an update request makes to a book.
+
+    Only the fields given are returned, so concurrent updates of other
+    fields are not overwritten with stale values.
+
+    Raises:
+        ValueError: If the data is not a valid update
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Update must be a JSON object")
+    
+    # Update book fields if provided
+    changes = {field: parse_text(data, field) for field in ('title', 'author')
+               if field in data}
+    if 'in_stock' in data:
+        changes['in_stock'] = data['in_stock']
+    if 'price' in data:
+        changes['price'] = parse_price(data['price'])
+    return changes
+
+
+def listing_args(args):
+    """
+    Parse the listing query parameters.
+
+    Returns:
+        tuple: (fields, limit, after) for project() and store.page()
+
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    fields = parse_fields(args.get('fields'))
+    limit = parse_limit(args.get('limit'))
+    cursor = args.get('cursor')
+    after = str(decode_cursor(cursor)[-1]) if cursor else None
+    return fields, limit, after
+
+
+def next_page_headers(books, more, args, path, query=None):
+    """
+    Return X-Next-Cursor and Link headers if another page follows.
+
+    Parameters:
+        query (dict): The parsed filters and sort order, if any, which the
+            cursor has to carry the sort value for
+    """
+    if not more:
+        return {}
+    last = books[-1]
+    next_cursor = encode_cursor(cursor_key(last, query) if query else [last['id']])
+    query = urlencode(dict(args.items(), cursor=next_cursor))
+    return {
+        'X-Next-Cursor': next_cursor,
+        'Link': f'<{path}?{query}>; rel="next"'
+    }
+
+
+def bulk_items(data, key):
+    """
+    Return the list of items in a bulk request body.
+
+    Raises:
+        ValueError: If the body is not a list of at most MAX_BULK_ITEMS items
+    """
+    if isinstance(data, dict):
+        data = data.get(key)
+    if not isinstance(data, list):
+        raise ValueError(f"Request must be a JSON list (or an object with a '{key}' list)")
+    if len(data) > MAX_BULK_ITEMS:
+        raise ValueError(f"Bulk requests are limited to {MAX_BULK_ITEMS} items")
+    return data
+
+
+def bulk_add(items):
+    """Add many books, persisted together; returns per-item results."""
+    results = []
+    with store.batch():
+        for index, data in enumerate(items):
+            try:
+                new_book = new_book_from(data)
+            except ValueError as e:
+                results.append({'index': index, 'status': 400, 'error': str(e)})
+                continue
+            new_book = add_new_book(new_book)
+            results.append({'index': index, 'status': 201, 'book': new_book})
+    return results
+
+
+def bulk_update(items):
+    """Update many books, persisted together; returns per-item results."""
+    results = []
+    with store.batch():
+        for index, data in enumerate(items):
+            book_id = data.get('id') if isinstance(data, dict) else None
+            book = store.get(book_id) if isinstance(book_id, str) else None
+            if book is None:
+                results.append({'index': index, 'id': book_id, 'status': 404,
+                                'error': "Book not found"})
+                continue
+            try:
+                changes = book_changes(data)
+            except ValueError as e:
+                results.append({'index': index, 'id': book_id, 'status': 400,
+                                'error': str(e)})
+                continue
+            book = store.update(book_id, changes)
+            results.append({'index': index, 'id': book_id, 'status': 200, 'book': book})
+    return results
+
+
+def bulk_delete(ids):
+    """Delete many books, persisted together; returns per-item results."""
+    results = []
+    with store.batch():
+        for index, book_id in enumerate(ids):
+            book = store.delete(book_id) if isinstance(book_id, str) else None
+            if book is None:
+                results.append({'index': index, 'id': book_id, 'status': 404,
+                                'error': "Book not found"})
+            else:
+                results.append({'index': index, 'id': book_id, 'status': 200})
+    return results
+
+
+def bulk_summary(results):
+    """Summarize per-item results of a bulk request."""
+    failed = sum(1 for result in results if result['status'] >= 400)
+    return {
+        'results': results,
+        'succeeded': len(results) - failed,
+        'failed': failed
+    }
+
+
+def validators(state, etag=None):
+    """
+    Return the (ETag, Last-Modified) for a catalog or book version.
+
+    Books pass their content fingerprint as the ETag, which is the same in
+    every process, so it can be used with If-Match for conditional writes.
+    Otherwise the catalog's tag is used, which is also the same in every
+    worker once writes are stored (see BookStore.catalog_tag()).
+
+    Last-Modified only has whole seconds, so another write in the same
+    second would leave it unchanged. It is None until the second of the
+    last change is over: a client can then only hold a Last-Modified once
+    no more writes can share it, and If-Modified-Since is safe to honor.
+    """
+    version, modified_at = state
+    if etag is None:
+        etag = store.catalog_tag(version)
+    second = int(modified_at)
+    if time.time() < second + 1:
+        return etag, None
+    return etag, datetime.fromtimestamp(second, timezone.utc)
+
+
+def is_fresh(req, etag, last_modified):
+    """Whether a request's If-None-Match / If-Modified-Since match a version."""
+    if req.if_none_match:
+        return req.if_none_match.contains_weak(etag)
+    if req.if_modified_since and last_modified is not None:
+        return last_modified <= req.if_modified_since
+    return False
+
+
+def not_modified(state, etag=None):
+    """
+    Check the request's cache validators against a catalog or book version.
+
+    The ETag and Last-Modified for the version are remembered and added to
+    the response by set_validators().
+
+    Parameters:
+        state (tuple): (version, modified time) from the store
+        etag (str): The ETag to use instead of one derived from the version
+
+    Returns:
+        Response: A 304 response if the client's copy is current, else None
+    """
+    g.validators = validators(state, etag)
+    return Response(status=304) if is_fresh(request, *g.validators) else None
+
+
+@app.after_request
+def set_validators(response):
+    """Add ETag and Last-Modified headers to cacheable GET responses."""
+    validators = g.get('validators')
+    if validators and response.status_code in (200, 304):
+        etag, last_modified = validators
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.vary.add('Accept')
+    return response
+
+
+@app.before_request
+def start_profiling():
+    """Profile the handler if profiling is on and this request was picked."""
+    if profiler.wanted(request.args, request.headers):
+        g.profiling = profiler.start()
+
+
+@app.after_request
+def stop_profiling(response):
+    """Keep the request's profile and tell the client its ID."""
+    started = g.pop('profiling', None)
+    if started:
+        profile = profiler.stop(started, request.endpoint, request.full_path)
+        response.headers['X-Profile-Id'] = profile.id
+    return response
+
+
+def serve_cached(state, build):
+    """
+    Serve a response from the response cache, building it on a miss.
+
+    The cache holds the serialized body (and compressed variants of it) for
+    this endpoint and query string at the given catalog version, and the
+    body is sent in the best encoding the client accepts.
+
+    Parameters:
+        state (tuple): The catalog (version, modified time) read before building
+        build (callable): Returns the Response to cache
+    """
+    key = (request.endpoint, request.query_string, store.epoch, state[0])
+    entry = response_cache.get(key)
+    if entry is None:
+        response = build()
+        headers = [(name, value) for name, value in response.headers.items()
+                   if name not in ('Content-Type', 'Content-Length')]
+        entry = response_cache.put(key, CachedResponse(
+            response.get_data(), response.mimetype, headers
+        ))
+    
+    encoding = entry.negotiate(request.accept_encodings)
+    with metrics.phase('serialization'):
+        body = entry.encoded(encoding)
+    response = Response(body, mimetype=entry.mimetype, headers=entry.headers)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def compact_dumps(value):
+    """Serialize a value as compact JSON."""
+    return app.json.dumps(value, separators=(',', ':'))
+
+
+def requested_stream_format():
+    """Return 'json' or 'ndjson' if the client asked for a streamed response."""
+    try:
+        return streaming.stream_format(request.args.get('stream'),
+                                       request.accept_mimetypes)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+
+def stream_books(books, fmt, fields=None, headers=None):
+    """Stream an iterable of books without building the whole body."""
+    records = (project(book, fields) for book in books if book)
+    body = streaming.generate(fmt, records, compact_dumps)
+    return Response(stream_with_context(body), mimetype=streaming.MIMETYPES[fmt],
+                    headers=headers)
 
 
 @app.route('/api/books', methods=['GET'])
 def get_books():
-    """Get all books endpoint."""
-    # Simulate network delay for realistic API behavior
-    time.sleep(0.2)
+    """
+    Get all books endpoint.
+
+    Optional query parameters:
+        limit: Page size; pages are returned in book ID order
+        cursor: The X-Next-Cursor value of the previous page
+        fields: Comma-separated fields to return, e.g. fields=id,title
+        stream: 'json' or 'ndjson' to stream the listing (also selected by
+            Accept: application/x-ndjson); unpaged streams are in ID order
+        in_stock: 'true' or 'false' to only list books in or out of stock
+        min_price, max_price: Inclusive price bounds
+        author: Only list books by this author (case-insensitive)
+        sort: The field to order by, e.g. sort=price or sort=-price for
+            descending; ties are broken by ID
+    """
+    fmt = requested_stream_format()
+    state = store.catalog_state()
+    cached = not_modified(state)
+    if cached:
+        return cached
+    
+    try:
+        fields, limit, after = listing_args(request.args)
+        query = parse_query(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
+    paged = limit is not None or after is not None
+    
+    def list_books():
+        """Return the requested books and any pagination headers."""
+        if query is not None:
+            books, more = catalog_index.query(
+                limit=limit or (DEFAULT_PAGE_SIZE if paged else None), **query)
+            return books, next_page_headers(books, more, request.args, request.path, query)
+        if not paged:
+            return load_books(), {}
+        books, more = store.page(after, limit or DEFAULT_PAGE_SIZE)
+        return books, next_page_headers(books, more, request.args, request.path)
     
-    books = load_books()
-    return jsonify(books)
+    if fmt:
+        if not paged and query is None:
+            # Full export: walk the catalog page by page as it is sent
+            return stream_books(store.iter_sorted(), fmt, fields)
+        books, headers = list_books()
+        return stream_books(books, fmt, fields, headers)
+    
+    def build():
+        books, headers = list_books()
+        response = jsonify([project(book, fields) for book in books])
+        response.headers.update(headers)
+        return response
+    
+    return serve_cached(state, build)
 
 
 @app.route('/api/books/<book_id>', methods=['GET'])
 def get_book(book_id):
     """Get a specific book by ID."""
-    # Simulate network delay
-    time.sleep(0.2)
-    
-    books = load_books()
-    book = next((b for b in books if b['id'] == book_id), None)
+    state = store.book_state(book_id)
+    book = store.get(book_id)
     
     if book:
-        return jsonify(book)
+        cached = not_modified(state, fingerprint(book))
+        return cached if cached else jsonify(book)
     else:
         abort(404, description="Book not found")
 
 
+def begin_idempotent(key, data):
+    """
+    Start a request sent with an Idempotency-Key.
+
+    Parameters:
+        key: The key, scoped to the request's method and path
+        data: The request body
+
+    Returns:
+        tuple: The remembered (data, status) of an earlier request with the
+            key, to replay, or None if this request should be carried out
+
+    Raises:
+        HTTPException: 409 if a request with the key is still in progress,
+            422 if the key was used for a different request
+    """
+    try:
+        return idempotency_keys.begin(key, fingerprint(data))
+    except idempotency.IdempotencyError as e:
+        abort(e.status, description=str(e))
+
+
 @app.route('/api/books', methods=['POST'])
 def add_book():
-    """Add a new book."""
-    # Simulate network delay
-    time.sleep(0.5)
-    
+    """
+    Add a new book.
+
+    A client that may retry the request sends an Idempotency-Key header
+    with a value unique to the book it is adding. A retry with the same key
+    and body gets the first response again (with Idempotent-Replayed: true)
+    instead of adding the book twice.
+    """
     if not request.json:
         abort(400, description="Request must be JSON")
+    try:
+        key = idempotency.parse_key(request.headers.get('Idempotency-Key'))
+    except ValueError as e:
+        abort(400, description=str(e))
     
-    data = request.json
-    
-    # Validate required fields
-    if not all(k in data for k in ('title', 'author', 'price')):
-        abort(400, description="Missing required fields: title, author, price")
-    
-    # Create new book
-    new_book = {
-        'id': str(uuid.uuid4())[:8],  # Generate a short unique ID
-        'title': data['title'],
-        'author': data['author'],
-        'price': float(data['price']),
-        'in_stock': data.get('in_stock', True)
-    }
+    if key is not None:
+        key = (request.method, request.path, key)
+        replay = begin_idempotent(key, request.json)
+        if replay is not None:
+            data, status = replay
+            return jsonify(data), status, {idempotency.REPLAYED_HEADER: 'true'}
     
-    books = load_books()
-    books.append(new_book)
-    save_books(books)
+    try:
+        try:
+            new_book = new_book_from(request.json)
+        except ValueError as e:
+            abort(400, description=str(e))
+        new_book = add_new_book(new_book)
+    except BaseException:
+        # Nothing was added, so a retry with the key should be carried out
+        if key is not None:
+            idempotency_keys.abandon(key)
+        raise
     
+    if key is not None:
+        idempotency_keys.complete(key, new_book, 201)
     return jsonify(new_book), 201
 
 
+def if_match():
+    """Return the request's If-Match ETags, or None if it has none."""
+    return request.if_match or None
+
+
 @app.route('/api/books/<book_id>', methods=['PUT'])
 def update_book(book_id):
-    """Update an existing book."""
-    # Simulate network delay
-    time.sleep(0.5)
-    
+    """
+    Update an existing book.
+
+    With an If-Match header the update is only made if the book still has
+    one of the given ETags; otherwise 412 Precondition Failed is returned.
+    """
     if not request.json:
         abort(400, description="Request must be JSON")
     
-    books = load_books()
-    book = next((b for b in books if b['id'] == book_id), None)
+    book = store.get(book_id)
     
     if not book:
         abort(404, description="Book not found")
     
-    data = request.json
+    try:
+        changes = book_changes(request.json)
+    except ValueError as e:
+        abort(400, description=str(e))
     
-    # Update book fields if provided
-    book['title'] = data.get('title', book['title'])
-    book['author'] = data.get('author', book['author'])
-    book['price'] = float(data.get('price', book['price']))
-    book['in_stock'] = data.get('in_stock', book['in_stock'])
-    
-    save_books(books)
+    try:
+        book = store.update(book_id, changes, if_match=if_match())
+    except ConflictError as e:
+        abort(412, description=str(e))
+    if not book:
+        abort(404, description="Book not found")
     
+    g.validators = validators(store.book_state(book_id), fingerprint(book))
     return jsonify(book)
 
 
 @app.route('/api/books/<book_id>', methods=['DELETE'])
 def delete_book(book_id):
-    """Delete a book."""
-    # Simulate network delay
-    time.sleep(0.5)
-    
-    books = load_books()
-    book = next((b for b in books if b['id'] == book_id), None)
+    """Delete a book, only if it matches the If-Match header if one is sent."""
+    try:
+        book = store.delete(book_id, if_match=if_match())
+    except ConflictError as e:
+        abort(412, description=str(e))
     
     if not book:
         abort(404, description="Book not found")
     
-    books = [b for b in books if b['id'] != book_id]
-    save_books(books)
-    
     return jsonify({'message': f"Book with ID {book_id} deleted successfully"})
 
 
+# Seconds between checks for changes made by other processes while an
+# event stream is idle, and between keepalive comments
+CHANGE_POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+
+
+def change_args(args, headers):
+    """
+    Parse the parameters of a change feed request.
+
+    Returns:
+        tuple: (since, limit, epoch)
+
+    Raises:
+        ValueError: If a parameter is invalid, or since is given without
+            its epoch
+    """
+    limit = parse_limit(args.get('limit')) or DEFAULT_PAGE_SIZE
+    if 'since' not in args and headers.get('Last-Event-ID'):
+        since, epoch = change_feed.parse_event_id(headers['Last-Event-ID'])
+        return since, limit, epoch
+    since = change_feed.parse_since(args.get('since'))
+    epoch = args.get('epoch') or None
+    if since and epoch is None:
+        raise ValueError("epoch is required with since")
+    return since, limit, epoch
+
+
+@app.route('/api/books/changes', methods=['GET'])
+def get_changes():
+    """
+    Get the changes to the catalog after a sequence number.
+
+    Query parameters:
+        since: The last sequence number the client has seen (default 0)
+        epoch: The epoch `since` came from, required with it; if it isn't
+            this log's, 410
+        limit: The most changes to return (default 100, at most 1000)
+
+    Returns {"epoch", "changes", "last_seq", "more"}, where each change has
+    a "seq", a "type" ('add', 'update' or 'delete'), the book "id", the new
+    "book" (null for deletions) and a "time". Pass last_seq as the next
+    since. If the changes after since are no longer kept, responds 410 Gone
+    and the client should download the catalog again.
+
+    With Accept: text/event-stream the changes are sent as Server-Sent
+    Events instead, and new ones follow as they happen; the Last-Event-ID
+    header of a reconnecting client is used as epoch and since.
+
+    Each server process keeps its own change log, so the feed is only
+    served with a single worker (see changes.py); otherwise 404.
+    """
+    if not CHANGE_FEED:
+        abort(404, description="The change feed is not enabled")
+    try:
+        since, limit, epoch = change_args(request.args, request.headers)
+    except ValueError as e:
+        abort(400, description=str(e))
+    
+    # Reloading picks up (and logs) changes made by other processes
+    store.refresh()
+    try:
+        found, more = change_log.read(since, epoch, limit)
+    except change_feed.ChangeLogGone as e:
+        abort(410, description=str(e))
+    
+    headers = {'X-Change-Log-Epoch': change_log.epoch}
+    if request.accept_mimetypes.best_match(
+            ['application/json', change_feed.EVENT_STREAM]) == change_feed.EVENT_STREAM:
+        return Response(change_events(change_log, since, found, more, limit),
+                        mimetype=change_feed.EVENT_STREAM,
+                        headers=dict(headers, **{'Cache-Control': 'no-cache'}))
+    
+    last_seq = found[-1]['seq'] if found else since
+    return jsonify({'epoch': change_log.epoch, 'changes': found,
+                    'last_seq': last_seq, 'more': more}), 200, headers
+
+
+def change_events(log, since, found, more, limit):
+    """Generate Server-Sent Events for changes, then wait for more."""
+    # With nothing to send yet, a keepalive goes out at once so the
+    # client sees the stream open
+    idle_since = time.monotonic() - KEEPALIVE_INTERVAL
+    while True:
+        for change in found:
+            yield change_feed.format_event(change, log.epoch, compact_dumps)
+        if found:
+            since = found[-1]['seq']
+            idle_since = time.monotonic()
+        elif time.monotonic() - idle_since >= KEEPALIVE_INTERVAL:
+            yield change_feed.keepalive()
+            idle_since = time.monotonic()
+        if not more:
+            log.wait(since, CHANGE_POLL_INTERVAL)
+            store.refresh()
+        try:
+            found, more = log.read(since, log.epoch, limit)
+        except change_feed.ChangeLogGone as e:
+            yield change_feed.gone_event(str(e), compact_dumps)
+            return
+
+
+@app.route('/api/books/bulk', methods=['POST'])
+def bulk_add_books():
+    """Add many books in one request, persisted together."""
+    try:
+        items = bulk_items(request.get_json(silent=True), 'books')
+    except ValueError as e:
+        abort(400, description=str(e))
+    
+    return jsonify(bulk_summary(bulk_add(items)))
+
+
+@app.route('/api/books/bulk', methods=['PATCH'])
+def bulk_update_books():
+    """Update many books in one request; each item must include its id."""
+    try:
+        items = bulk_items(request.get_json(silent=True), 'books')
+    except ValueError as e:
+        abort(400, description=str(e))
+    
+    return jsonify(bulk_summary(bulk_update(items)))
+
+
+@app.route('/api/books/bulk', methods=['DELETE'])
+def bulk_delete_books():
+    """Delete many books in one request, given a list of ids."""
+    try:
+        ids = bulk_items(request.get_json(silent=True), 'ids')
+    except ValueError as e:
+        abort(400, description=str(e))
+    
+    return jsonify(bulk_summary(bulk_delete(ids)))
+
+
+SEARCH_MODES = ('auto', 'substring', 'prefix', 'fuzzy')
+
+
+def parse_search_mode(value):
+    """
+    Parse the search mode= parameter.
+
+    Raises:
+        ValueError: If the mode is unknown
+    """
+    mode = value or 'auto'
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode: {mode}. "
+                         f"Valid modes: {', '.join(SEARCH_MODES)}")
+    return mode
+
+
+def find_books(query, mode):
+    """
+    Search the index in the given mode.
+
+    Returns:
+        tuple: (matching book ids, best first; the mode that found them),
+            where 'auto' tries a substring match and falls back to fuzzy
+    """
+    generation = search_cache.generation
+    if mode != 'auto':
+        return cached_search(query, mode, generation), mode
+    ids = cached_search(query, 'substring', generation)
+    if ids:
+        return ids, 'substring'
+    return cached_search(query, 'fuzzy', generation), 'fuzzy'
+
+
+def cached_search(query, mode, generation):
+    """Run a search in one mode, answering from the search cache if possible."""
+    ids = search_cache.get(query, mode)
+    if ids is None:
+        search = {'substring': search_index.search, 'prefix': search_index.prefix_search,
+                  'fuzzy': search_index.fuzzy_search}[mode]
+        ids = search(query)
+        search_cache.put(query, mode, ids, generation)
+    return ids
+
+
 @app.route('/api/books/search', methods=['GET'])
 def search_books():
-    """Search for books by title or author."""
-    # Simulate network delay
-    time.sleep(0.3)
-    
+    """
+    Search for books by title or author.
+
+    Query parameters:
+        query: The text to look for (required)
+        mode: 'substring' to match the text anywhere, 'prefix' to complete
+            the last word, 'fuzzy' to tolerate typos, or 'auto' (default)
+            for substring matches, falling back to fuzzy ones if there are
+            none. X-Search-Mode says which mode produced the results.
+    """
     query = request.args.get('query', '').lower()
     
     if not query:
         abort(400, description="Search query is required")
+    try:
+        mode = parse_search_mode(request.args.get('mode'))
+    except ValueError as e:
+        abort(400, description=str(e))
+    
+    fmt = requested_stream_format()
+    state = store.catalog_state()
+    cached = not_modified(state)
+    if cached:
+        return cached
+    
+    if fmt:
+        ids, used = find_books(query, mode)
+        return stream_books((store.get(book_id) for book_id in ids), fmt,
+                            headers={'X-Search-Mode': used})
     
-    books = load_books()
-    results = [
-        book for book in books
-        if query in book['title'].lower() or query in book['author'].lower()
-    ]
+    def build():
+        # Answered from the inverted index, best matches first
+        ids, used = find_books(query, mode)
+        results = [store.get(book_id) for book_id in ids]
+        response = jsonify([book for book in results if book])
+        response.headers['X-Search-Mode'] = used
+        return response
     
-    return jsonify(results)
+    return serve_cached(state, build)
+
+
+def suggest_args(args):
+    """
+    Parse the parameters of a suggestion request.
+
+    Returns:
+        tuple: (prefix, limit)
+
+    Raises:
+        ValueError: If the prefix is missing or the limit is invalid
+    """
+    prefix = args.get('prefix', '')
+    if not prefix.strip():
+        raise ValueError("A prefix is required")
+    try:
+        limit = int(args.get('limit') or 10)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        raise ValueError(f"limit must be between 1 and {MAX_SUGGESTIONS}")
+    return prefix, limit
+
+
+@app.route('/api/books/suggest', methods=['GET'])
+def suggest_books():
+    """
+    Suggest titles and authors for a search box as the user types.
+
+    Query parameters:
+        prefix: What has been typed so far (required)
+        limit: The most suggestions to return (default 10, at most 50)
+
+    Returns a list of {"text", "field", "books"} suggestions, the titles
+    and authors shared by the most books first.
+    """
+    try:
+        prefix, limit = suggest_args(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
+    
+    state = store.catalog_state()
+    cached = not_modified(state)
+    if cached:
+        return cached
+    
+    return serve_cached(state, lambda: jsonify(suggest_index.suggest(prefix, limit)))
+
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """List the kept request profiles, most recent first."""
+    if not profiler.enabled:
+        abort(404, description="Profiling is not enabled")
+    return jsonify([profile.summary() for profile in profiler.profiles()])
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Get a request profile.
+
+    Optional query parameters:
+        format: 'text' (default) for the top functions, or 'pstats' for the
+            raw profile to load with pstats or snakeviz
+        sort: pstats sort key for the text report, e.g. tottime
+    """
+    profile = profiler.get(profile_id) if profiler.enabled else None
+    if profile is None:
+        abort(404, description="Profile not found")
+    
+    if request.args.get('format') == 'pstats':
+        return Response(profile.dump(), mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename="{profile_id}.prof"'
+        })
+    try:
+        report = profile.report(sort=request.args.get('sort', 'cumulative'))
+    except KeyError:
+        abort(400, description="Invalid sort key")
+    return Response(report, mimetype='text/plain')
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Expose request, catalog and cache metrics in the Prometheus text format."""
+    return Response(registry.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.errorhandler(400)
@@ -194,6 +1080,30 @@ def not_found(error):
     return jsonify({'error': 'Not Found', 'message': error.description}), 404
 
 
+@app.errorhandler(409)
+def conflict(error):
+    """Handle requests that clash with one in progress."""
+    return jsonify({'error': 'Conflict', 'message': error.description}), 409
+
+
+@app.errorhandler(410)
+def gone(error):
+    """Handle requests for changes the change log no longer has."""
+    return jsonify({'error': 'Gone', 'message': error.description}), 410
+
+
+@app.errorhandler(412)
+def precondition_failed(error):
+    """Handle failed If-Match preconditions."""
+    return jsonify({'error': 'Precondition Failed', 'message': error.description}), 412
+
+
+@app.errorhandler(422)
+def unprocessable(error):
+    """Handle requests that reuse an Idempotency-Key for something else."""
+    return jsonify({'error': 'Unprocessable Entity', 'message': error.description}), 422
+
+
 @app.errorhandler(500)
 def server_error(error):
     """Handle internal server errors."""
@@ -201,12 +1111,8 @@ def server_error(error):
 
 
 if __name__ == '__main__':
-    if not os.path.exists(os.path.dirname(DATA_FILE)):
-        os.makedirs(os.path.dirname(DATA_FILE))
-    
-    # Ensure we have the books.json file
-    if not os.path.exists(DATA_FILE):
-        save_books(SAMPLE_BOOKS)
+    # Ensure we have a catalog to serve
+    store.load()
     
     print("Bookstore API running on http://localhost:5000")
     app.run(debug=True) 
\ No newline at end of file
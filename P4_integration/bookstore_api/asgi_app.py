@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Bookstore API (ASGI)
+
+An async variant of the Flask app in app.py, built on Quart, with the same
+URLs, payloads and error responses. It shares app.py's catalog, search index,
+response cache and latency settings; injected delay awaits instead of
+sleeping, and anything that touches storage (reloads and writes) runs on a
+worker thread, so one process can hold thousands of open connections.
+
+/metrics and /api/profiles are served too, from app.py's registry and
+profiler. Requests are counted and timed, but not split into phases, as
+their storage work runs on other threads. A profile covers the event loop
+while its request is handled, so it can include other requests' work.
+
+Run it under an ASGI server, e.g.:
+
+    hypercorn asgi_app:app --bind 0.0.0.0:5000
+"""
+import asyncio
+import time
+
+from quart import Quart, Response, abort, g, jsonify, request
+from quart.json.provider import DefaultJSONProvider
+
+import app as core
+from cache import CachedResponse
+import changes as change_feed
+import idempotency
+from indexes import parse_query
+import metrics
+from pagination import DEFAULT_PAGE_SIZE, project
+from records import Book
+from store import ConflictError, fingerprint
+import streaming
+
+
+class BookJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes book records."""
+
+    @staticmethod
+    def default(value):
+        """Serialize records as dicts, and anything else as usual."""
+        if isinstance(value, Book):
+            return value.to_dict()
+        return DefaultJSONProvider.default(value)
+
+
+app = Quart(__name__)
+app.json = BookJSONProvider(app)
+
+
+@app.before_request
+async def before_request():
+    """Pick up external catalog changes, then simulate delay if configured."""
+    g.request_started = time.perf_counter()
+    if core.store.refresh_due():
+        await asyncio.to_thread(core.store.refresh)
+    g.injected_latency = await core.latency.inject_async(request.endpoint)
+    if core.profiler.wanted(request.args, request.headers):
+        g.profiling = core.profiler.start()
+
+
+@app.after_request
+async def after_request(response):
+    """Add Server-Timing, cache validator and CORS headers; record metrics."""
+    started = g.pop('profiling', None)
+    if started:
+        profile = core.profiler.stop(started, request.endpoint, request.full_path)
+        response.headers['X-Profile-Id'] = profile.id
+
+    injected = g.get('injected_latency', 0.0)
+    if injected:
+        response.headers.add('Server-Timing', f"injected;dur={injected * 1000:.1f}")
+
+    validators = g.get('validators')
+    if validators and response.status_code in (200, 304):
+        etag, last_modified = validators
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.vary.add('Accept')
+
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    if request.method == 'OPTIONS':
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, PATCH, DELETE'
+        response.headers['Access-Control-Allow-Headers'] = request.headers.get(
+            'Access-Control-Request-Headers', '*')
+
+    started = g.get('request_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        core.REQUESTS.inc(endpoint=endpoint, method=request.method,
+                          status=str(response.status_code))
+        core.REQUEST_DURATION.observe(time.perf_counter() - started,
+                                      endpoint=endpoint, method=request.method)
+    return response
+
+
+def not_modified(state, etag=None):
+    """Return a 304 response if the client's copy of a version is current."""
+    g.validators = core.validators(state, etag)
+    return Response('', status=304) if core.is_fresh(request, *g.validators) else None
+
+
+async def json_body():
+    """Return the request's JSON body, or None if it has none."""
+    return await request.get_json(silent=True)
+
+
+def dumps(value):
+    """Serialize a value as compact JSON."""
+    return app.json.dumps(value, separators=(',', ':'))
+
+
+def serve_cached(state, build):
+    """
+    Serve a response body from app.py's response cache, building it on a miss.
+
+    Parameters:
+        state (tuple): The catalog (version, modified time) read before building
+        build (callable): Returns (data, headers) to serialize and cache
+    """
+    key = ('asgi', request.endpoint, request.query_string, core.store.epoch, state[0])
+    entry = core.response_cache.get(key)
+    if entry is None:
+        data, headers = build()
+        body = (app.json.dumps(data) + '\n').encode()
+        entry = core.response_cache.put(key, CachedResponse(
+            body, 'application/json', headers
+        ))
+
+    encoding = entry.negotiate(request.accept_encodings)
+    response = Response(entry.encoded(encoding), mimetype=entry.mimetype,
+                        headers=entry.headers)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def requested_stream_format():
+    """Return 'json' or 'ndjson' if the client asked for a streamed response."""
+    try:
+        return streaming.stream_format(request.args.get('stream'),
+                                       request.accept_mimetypes)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+
+def stream_books(books, fmt, fields=None, headers=None):
+    """Stream an iterable of books, yielding to the event loop between chunks."""
+    records = (project(book, fields) for book in books if book)
+
+    async def body():
+        for chunk in streaming.generate(fmt, records, dumps):
+            yield chunk.encode()
+            await asyncio.sleep(0)
+
+    return Response(body(), mimetype=streaming.MIMETYPES[fmt], headers=headers)
+
+
+@app.route('/api/books', methods=['GET'])
+async def get_books():
+    """Get all books endpoint; takes the same parameters as app.get_books."""
+    fmt = requested_stream_format()
+    state = core.store.catalog_state()
+    cached = not_modified(state)
+    if cached:
+        return cached
+
+    try:
+        fields, limit, after = core.listing_args(request.args)
+        query = parse_query(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
+    paged = limit is not None or after is not None
+
+    def list_books():
+        """Return the requested books and any pagination headers."""
+        if query is not None:
+            books, more = core.catalog_index.query(
+                limit=limit or (DEFAULT_PAGE_SIZE if paged else None), **query)
+            return books, core.next_page_headers(books, more, request.args,
+                                                 request.path, query)
+        if not paged:
+            return core.store.all(), {}
+        books, more = core.store.page(after, limit or DEFAULT_PAGE_SIZE)
+        return books, core.next_page_headers(books, more, request.args, request.path)
+
+    if fmt:
+        if not paged and query is None:
+            return stream_books(core.store.iter_sorted(), fmt, fields)
+        books, headers = list_books()
+        return stream_books(books, fmt, fields, headers)
+
+    def build():
+        books, headers = list_books()
+        return [project(book, fields) for book in books], headers
+
+    return serve_cached(state, build)
+
+
+@app.route('/api/books/<book_id>', methods=['GET'])
+async def get_book(book_id):
+    """Get a specific book by ID."""
+    state = core.store.book_state(book_id)
+    book = core.store.get(book_id)
+
+    if not book:
+        abort(404, description="Book not found")
+
+    cached = not_modified(state, fingerprint(book))
+    return cached if cached else jsonify(book)
+
+
+@app.route('/api/books', methods=['POST'])
+async def add_book():
+    """Add a new book; honors Idempotency-Key like app.add_book."""
+    data = await json_body()
+    if not data:
+        abort(400, description="Request must be JSON")
+    try:
+        key = idempotency.parse_key(request.headers.get('Idempotency-Key'))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    if key is not None:
+        key = (request.method, request.path, key)
+        try:
+            replay = await asyncio.to_thread(core.idempotency_keys.begin, key,
+                                             fingerprint(data))
+        except idempotency.IdempotencyError as e:
+            abort(e.status, description=str(e))
+        if replay is not None:
+            body, status = replay
+            return jsonify(body), status, {idempotency.REPLAYED_HEADER: 'true'}
+
+    try:
+        try:
+            new_book = core.new_book_from(data)
+        except ValueError as e:
+            abort(400, description=str(e))
+        new_book = await asyncio.to_thread(core.add_new_book, new_book)
+    except BaseException:
+        if key is not None:
+            await asyncio.to_thread(core.idempotency_keys.abandon, key)
+        raise
+
+    if key is not None:
+        await asyncio.to_thread(core.idempotency_keys.complete, key, new_book, 201)
+    return jsonify(new_book), 201
+
+
+@app.route('/api/books/<book_id>', methods=['PUT'])
+async def update_book(book_id):
+    """Update an existing book."""
+    data = await json_body()
+    if not data:
+        abort(400, description="Request must be JSON")
+
+    book = core.store.get(book_id)
+
+    if not book:
+        abort(404, description="Book not found")
+
+    try:
+        changes = core.book_changes(data)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    try:
+        book = await asyncio.to_thread(core.store.update, book_id, changes,
+                                       if_match=request.if_match or None)
+    except ConflictError as e:
+        abort(412, description=str(e))
+    if not book:
+        abort(404, description="Book not found")
+
+    g.validators = core.validators(core.store.book_state(book_id), fingerprint(book))
+    return jsonify(book)
+
+
+@app.route('/api/books/<book_id>', methods=['DELETE'])
+async def delete_book(book_id):
+    """Delete a book, only if it matches the If-Match header if one is sent."""
+    try:
+        book = await asyncio.to_thread(core.store.delete, book_id,
+                                       if_match=request.if_match or None)
+    except ConflictError as e:
+        abort(412, description=str(e))
+
+    if not book:
+        abort(404, description="Book not found")
+
+    return jsonify({'message': f"Book with ID {book_id} deleted successfully"})
+
+
+async def run_bulk(operation, key):
+    """Validate a bulk request body and run the operation on a worker thread."""
+    try:
+        items = core.bulk_items(await json_body(), key)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    results = await asyncio.to_thread(operation, items)
+    return jsonify(core.bulk_summary(results))
+
+
+@app.route('/api/books/bulk', methods=['POST'])
+async def bulk_add_books():
+    """Add many books in one request, persisted together."""
+    return await run_bulk(core.bulk_add, 'books')
+
+
+@app.route('/api/books/bulk', methods=['PATCH'])
+async def bulk_update_books():
+    """Update many books in one request; each item must include its id."""
+    return await run_bulk(core.bulk_update, 'books')
+
+
+@app.route('/api/books/bulk', methods=['DELETE'])
+async def bulk_delete_books():
+    """Delete many books in one request, given a list of ids."""
+    return await run_bulk(core.bulk_delete, 'ids')
+
+
+@app.route('/api/books/search', methods=['GET'])
+async def search_books():
+    """Search for books by title or author; takes the same parameters as app.search_books."""
+    query = request.args.get('query', '').lower()
+
+    if not query:
+        abort(400, description="Search query is required")
+    try:
+        mode = core.parse_search_mode(request.args.get('mode'))
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    fmt = requested_stream_format()
+    state = core.store.catalog_state()
+    cached = not_modified(state)
+    if cached:
+        return cached
+
+    if fmt:
+        ids, used = core.find_books(query, mode)
+        return stream_books((core.store.get(book_id) for book_id in ids), fmt,
+                            headers={'X-Search-Mode': used})
+
+    def build():
+        ids, used = core.find_books(query, mode)
+        results = [core.store.get(book_id) for book_id in ids]
+        return [book for book in results if book], {'X-Search-Mode': used}
+
+    return serve_cached(state, build)
+
+
+@app.route('/api/books/suggest', methods=['GET'])
+async def suggest_books():
+    """Suggest titles and authors; takes the same parameters as app.suggest_books."""
+    try:
+        prefix, limit = core.suggest_args(request.args)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    state = core.store.catalog_state()
+    cached = not_modified(state)
+    if cached:
+        return cached
+
+    return serve_cached(state, lambda: (core.suggest_index.suggest(prefix, limit), {}))
+
+
+# Seconds between checks of the change log while an event stream is idle
+EVENT_POLL_INTERVAL = 0.25
+
+
+@app.route('/api/books/changes', methods=['GET'])
+async def get_changes():
+    """Get the catalog's changes after a sequence number; see app.get_changes."""
+    if not core.CHANGE_FEED:
+        abort(404, description="The change feed is not enabled")
+    try:
+        since, limit, epoch = core.change_args(request.args, request.headers)
+    except ValueError as e:
+        abort(400, description=str(e))
+
+    log = core.change_log
+    try:
+        found, more = log.read(since, epoch, limit)
+    except change_feed.ChangeLogGone as e:
+        abort(410, description=str(e))
+
+    headers = {'X-Change-Log-Epoch': log.epoch}
+    if request.accept_mimetypes.best_match(
+            ['application/json', change_feed.EVENT_STREAM]) == change_feed.EVENT_STREAM:
+        headers['Cache-Control'] = 'no-cache'
+        return Response(change_events(log, since, found, more, limit),
+                        mimetype=change_feed.EVENT_STREAM, headers=headers)
+
+    last_seq = found[-1]['seq'] if found else since
+    return jsonify({'epoch': log.epoch, 'changes': found,
+                    'last_seq': last_seq, 'more': more}), 200, headers
+
+
+async def change_events(log, since, found, more, limit):
+    """Send changes as Server-Sent Events, then poll the log for more."""
+    loop = asyncio.get_running_loop()
+    idle_since = loop.time() - core.KEEPALIVE_INTERVAL
+    while True:
+        for change in found:
+            yield change_feed.format_event(change, log.epoch, dumps).encode()
+        if found:
+            since = found[-1]['seq']
+            idle_since = loop.time()
+        elif loop.time() - idle_since >= core.KEEPALIVE_INTERVAL:
+            yield change_feed.keepalive().encode()
+            idle_since = loop.time()
+        if not more:
+            await asyncio.sleep(EVENT_POLL_INTERVAL)
+            if core.store.refresh_due():
+                await asyncio.to_thread(core.store.refresh)
+        try:
+            found, more = log.read(since, log.epoch, limit)
+        except change_feed.ChangeLogGone as e:
+            yield change_feed.gone_event(str(e), dumps).encode()
+            return
+
+
+@app.route('/api/profiles', methods=['GET'])
+async def list_profiles():
+    """List the kept request profiles, most recent first."""
+    if not core.profiler.enabled:
+        abort(404, description="Profiling is not enabled")
+    return jsonify([profile.summary() for profile in core.profiler.profiles()])
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+async def get_profile(profile_id):
+    """Get a request profile; see app.get_profile."""
+    profiler = core.profiler
+    profile = profiler.get(profile_id) if profiler.enabled else None
+    if profile is None:
+        abort(404, description="Profile not found")
+
+    if request.args.get('format') == 'pstats':
+        return Response(profile.dump(), mimetype='application/octet-stream', headers={
+            'Content-Disposition': f'attachment; filename="{profile_id}.prof"'
+        })
+    try:
+        report = profile.report(sort=request.args.get('sort', 'cumulative'))
+    except KeyError:
+        abort(400, description="Invalid sort key")
+    return Response(report, mimetype='text/plain')
+
+
+@app.route('/metrics', methods=['GET'])
+async def get_metrics():
+    """Expose request, catalog and cache metrics; see app.get_metrics."""
+    return Response(core.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.errorhandler(400)
+async def bad_request(error):
+    """Handle bad request errors."""
+    return jsonify({'error': 'Bad Request', 'message': error.description}), 400
+
+
+@app.errorhandler(404)
+async def not_found(error):
+    """Handle not found errors."""
+    return jsonify({'error': 'Not Found', 'message': error.description}), 404
+
+
+@app.errorhandler(409)
+async def conflict(error):
+    """Handle requests that clash with one in progress."""
+    return jsonify({'error': 'Conflict', 'message': error.description}), 409
+
+
+@app.errorhandler(410)
+async def gone(error):
+    """Handle requests for changes the change log no longer has."""
+    return jsonify({'error': 'Gone', 'message': error.description}), 410
+
+
+@app.errorhandler(412)
+async def precondition_failed(error):
+    """Handle failed If-Match preconditions."""
+    return jsonify({'error': 'Precondition Failed', 'message': error.description}), 412
+
+
+@app.errorhandler(422)
+async def unprocessable(error):
+    """Handle requests that reuse an Idempotency-Key for something else."""
+    return jsonify({'error': 'Unprocessable Entity', 'message': error.description}), 422
+
+
+@app.errorhandler(500)
+async def server_error(error):
+    """Handle internal server errors."""
+    return jsonify({'error': 'Internal Server Error', 'message': str(error)}), 500
+
+
+if __name__ == '__main__':
+    print("Bookstore API (async) running on http://localhost:5000")
+    app.run(port=5000)
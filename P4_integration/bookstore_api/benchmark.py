@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Benchmark
+
+A reproducible load test for the bookstore API. It generates a synthetic
+catalog of any size from a seed, drives the Flask app with a weighted mix of
+requests, either in-process through the test client or over a local socket,
+and reports throughput and p50/p95/p99 latency per operation.
+
+    python benchmark.py --books 100000 --requests 20000 --threads 8 \\
+        --mix get_books=10,get_book=40,search=30,add=10,update=7,delete=3 \\
+        --transport http --json results.json
+
+Pass --baseline with an earlier --json file to fail (exit status 1) when
+throughput drops, or p95 latency grows, by more than --tolerance.
+"""
+import argparse
+from collections import deque
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote
+
+from pagination import encode_cursor
+
+TITLE_WORDS = (
+    'shadow', 'river', 'garden', 'winter', 'empire', 'silent', 'glass', 'stone',
+    'night', 'ocean', 'crown', 'forest', 'letter', 'secret', 'house', 'storm',
+    'summer', 'memory', 'island', 'golden', 'broken', 'hidden', 'last', 'wild',
+    'iron', 'paper', 'city', 'light', 'north', 'queen', 'fire', 'journey',
+)
+FIRST_NAMES = (
+    'Ada', 'Boris', 'Clara', 'Dmitri', 'Elena', 'Farid', 'Grace', 'Hiro',
+    'Ines', 'Jonas', 'Kemi', 'Lars', 'Maya', 'Nikolai', 'Olga', 'Pablo',
+)
+LAST_NAMES = (
+    'Abbott', 'Brennan', 'Castillo', 'Dvorak', 'Eriksen', 'Fontaine', 'Gupta',
+    'Hartmann', 'Ivanova', 'Jansen', 'Kowalski', 'Lindqvist', 'Moreau',
+    'Nakamura', 'Okafor', 'Petrov',
+)
+
+DEFAULT_MIX = 'get_books=10,get_book=40,search=30,add=10,update=7,delete=3'
+
+
+def generate_catalog(size, seed=0):
+    """Return `size` synthetic books, the same for the same seed."""
+    rng = random.Random(seed)
+    return [
+        {
+            'id': f"b{i:07d}",
+            'title': ' '.join(rng.choice(TITLE_WORDS).capitalize()
+                              for _ in range(rng.randint(1, 4))),
+            'author': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'price': round(rng.uniform(2, 60), 2),
+            'in_stock': rng.random() < 0.8,
+        }
+        for i in range(size)
+    ]
+
+
+def parse_mix(value):
+    """
+    Parse a request mix such as 'get_book=3,search=1' into {op: weight}.
+
+    Raises:
+        ValueError: If an operation is unknown or a weight is invalid
+    """
+    mix = {}
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise ValueError(f"Invalid weight for {name}: {weight!r}")
+        if mix[name] < 0:
+            raise ValueError(f"Invalid weight for {name}: {weight!r}")
+    if not any(mix.values()):
+        raise ValueError("The request mix is empty")
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values))))
+    return sorted_values[index - 1]
+
+
+class Workload:
+    """Picks requests from a weighted mix against a known catalog."""
+
+    def __init__(self, books, mix, seed=0):
+        self.ids = [book['id'] for book in books]
+        self.mix = mix
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.seed = seed
+        # Books added during the run, which are the only ones deleted, so the
+        # catalog stays the same size and gets and updates always find theirs
+        self._added = deque()
+        self._lock = threading.Lock()
+
+    def rng(self, worker, phase='run'):
+        """Return the random generator for one worker thread in a phase."""
+        return random.Random(f"{self.seed}-{phase}-{worker}")
+
+    def next_request(self, rng):
+        """Return (operation, method, path, body) for the next request."""
+        name = rng.choices(self.names, self.weights)[0]
+        return (name,) + OPERATIONS[name](self, rng)
+
+    def added(self, book_id):
+        """Remember a book added by the run."""
+        with self._lock:
+            self._added.append(book_id)
+
+    def take_added(self):
+        """Return a book added by the run to delete, or None."""
+        with self._lock:
+            return self._added.popleft() if self._added else None
+
+
+def _get_books(workload, rng):
+    """A page of 100 books from a random point in the catalog."""
+    after = rng.choice(workload.ids)
+    return 'GET', f"/api/books?limit=100&cursor={encode_cursor([after])}", None
+
+
+def _get_book(workload, rng):
+    """A random book."""
+    return 'GET', f"/api/books/{rng.choice(workload.ids)}", None
+
+
+def _search(workload, rng):
+    """A search for a random title word or author name."""
+    return 'GET', f"/api/books/search?query={quote(rng.choice(TITLE_WORDS + LAST_NAMES))}", None
+
+
+def _add(workload, rng):
+    """A new book."""
+    book = {'title': f"{rng.choice(TITLE_WORDS).capitalize()} Benchmark",
+            'author': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'price': round(rng.uniform(2, 60), 2)}
+    return 'POST', '/api/books', book
+
+
+def _update(workload, rng):
+    """A price change to a random book."""
+    return 'PUT', f"/api/books/{rng.choice(workload.ids)}", {'price': round(rng.uniform(2, 60), 2)}
+
+
+def _delete(workload, rng):
+    """Deletion of a book added earlier in the run."""
+    book_id = workload.take_added()
+    if book_id is None:
+        # Nothing of ours to delete yet; keep the request rate up with a read
+        return _get_book(workload, rng)
+    return 'DELETE', f"/api/books/{book_id}", None
+
+
+OPERATIONS = {
+    'get_books': _get_books,
+    'get_book': _get_book,
+    'search': _search,
+    'add': _add,
+    'update': _update,
+    'delete': _delete,
+}
+
+
+class InProcessTransport:
+    """Sends requests straight to the WSGI app through Flask's test client."""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+
+    def connect(self):
+        """Return a per-thread send(method, path, body) -> (status, data)."""
+        client = self.app.test_client()
+
+        def send(method, path, body):
+            response = client.open(path, method=method, json=body)
+            return response.status_code, response.get_data()
+        return send
+
+    def close(self):
+        """Nothing to stop."""
+
+
+class HttpTransport:
+    """Sends requests over HTTP/1.1 keep-alive connections to a local server."""
+
+    def __init__(self, flask_app=None, url=None):
+        """
+        Parameters:
+            flask_app: An app to serve on a free local port for the run
+            url (str): An already running server, e.g. http://localhost:5000
+        """
+        self._server = None
+        if url is None:
+            from werkzeug.serving import WSGIRequestHandler, make_server
+
+            class QuietHandler(WSGIRequestHandler):
+                """Keep-alive request handler that does not log every request."""
+                protocol_version = 'HTTP/1.1'
+
+                def log_request(self, *args, **kwargs):
+                    pass
+
+            self._server = make_server('127.0.0.1', 0, flask_app, threaded=True,
+                                       request_handler=QuietHandler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{self._server.server_port}"
+        host, _, port = url.split('://', 1)[-1].rstrip('/').partition(':')
+        self.host = host
+        self.port = int(port or 80)
+
+    def connect(self):
+        """Return a per-thread send(method, path, body) -> (status, data)."""
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+        def send(method, path, body):
+            headers = {}
+            data = None
+            if body is not None:
+                data = json.dumps(body).encode()
+                headers['Content-Type'] = 'application/json'
+            connection.request(method, path, body=data, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        return send
+
+    def close(self):
+        """Stop the local server, if one was started."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def run(transport, workload, requests, threads=1, phase='run'):
+    """
+    Drive the transport with requests from the workload.
+
+    Each phase (e.g. warmup, then the measured run) draws its own requests,
+    so the measured run doesn't replay the warmup's and find them cached.
+
+    Returns:
+        dict: Overall and per-operation results; see summarize()
+    """
+    latencies = {name: [] for name in workload.mix}
+    errors = {name: 0 for name in workload.mix}
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(index):
+        rng = workload.rng(index, phase)
+        send = transport.connect()
+        local = []
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                break
+            name, method, path, body = workload.next_request(rng)
+            start = time.perf_counter()
+            status, data = send(method, path, body)
+            elapsed = time.perf_counter() - start
+            if name == 'add' and status == 201:
+                workload.added(json.loads(data)['id'])
+            local.append((name, elapsed, status >= 400))
+        with lock:
+            for name, elapsed, failed in local:
+                latencies[name].append(elapsed)
+                errors[name] += failed
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    duration = time.perf_counter() - started
+    return summarize(latencies, errors, duration)
+
+
+def summarize(latencies, errors, duration):
+    """Compute throughput and latency percentiles, overall and per operation."""
+    def stats(values, failed):
+        values = sorted(values)
+        return {
+            'requests': len(values),
+            'errors': failed,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': (values[-1] if values else 0.0) * 1000,
+        }
+
+    everything = [value for values in latencies.values() for value in values]
+    result = stats(everything, sum(errors.values()))
+    result['duration_s'] = duration
+    result['throughput_rps'] = len(everything) / duration if duration else 0.0
+    result['operations'] = {name: stats(latencies[name], errors[name])
+                            for name in latencies if latencies[name]}
+    return result
+
+
+def compare(result, baseline, tolerance):
+    """Return descriptions of regressions beyond the tolerance (a fraction)."""
+    regressions = []
+    if result['throughput_rps'] < baseline['throughput_rps'] * (1 - tolerance):
+        regressions.append(
+            f"throughput {result['throughput_rps']:.0f} rps < "
+            f"baseline {baseline['throughput_rps']:.0f} rps"
+        )
+    for name, stats in result['operations'].items():
+        before = baseline.get('operations', {}).get(name)
+        if before and stats['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name} p95 {stats['p95_ms']:.2f} ms > baseline {before['p95_ms']:.2f} ms"
+            )
+    return regressions
+
+
+def format_report(result):
+    """Format results as a plain text table."""
+    lines = [
+        f"{'operation':<10} {'requests':>9} {'errors':>7} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    ]
+    rows = list(result['operations'].items()) + [('all', result)]
+    for name, stats in rows:
+        lines.append(
+            f"{name:<10} {stats['requests']:>9} {stats['errors']:>7} "
+            f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+            f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}"
+        )
+    lines.append(f"throughput: {result['throughput_rps']:.0f} requests/s "
+                 f"over {result['duration_s']:.2f} s")
+    return '\n'.join(lines)
+
+
+def setup_app(books, storage, flush_interval, directory):
+    """Point the app at a fresh catalog of the given books; returns the app module."""
+    from storage import open_storage
+
+    if storage == 'sqlite':
+        location = 'sqlite:///' + os.path.join(directory, 'books.db')
+    elif storage == 'snapshot':
+        location = os.path.join(directory, 'books.snap')
+    else:
+        location = os.path.join(directory, 'books.json')
+    backend = open_storage(location)
+    backend.save(books)
+    backend.close()
+
+    # Importing the app opens its storage (and the lock, change counter and
+    # key files beside it), which must not be the real catalog
+    previous = os.environ.get('BOOKSTORE_STORAGE')
+    os.environ['BOOKSTORE_STORAGE'] = location
+    try:
+        import app as api
+    finally:
+        if previous is None:
+            del os.environ['BOOKSTORE_STORAGE']
+        else:
+            os.environ['BOOKSTORE_STORAGE'] = previous
+    from latency import LatencyInjector
+    from store import BookStore
+
+    api.init_store(BookStore(open_storage(location), flush_interval=flush_interval))
+    api.latency = LatencyInjector()
+    api.store.refresh()
+    return api
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bookstore API.")
+    parser.add_argument('--books', type=int, default=10000, help="Catalog size")
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--transport', choices=('inprocess', 'http'), default='inprocess')
+    parser.add_argument('--url', help="Benchmark a running server instead (implies http)")
+    parser.add_argument('--storage', choices=('json', 'snapshot', 'sqlite'), default='json')
+    parser.add_argument('--flush-interval', type=float, default=0.5)
+    parser.add_argument('--json', dest='json_path', help="Write results to this file")
+    parser.add_argument('--baseline', help="Results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    books = generate_catalog(args.books, args.seed)
+    workload = Workload(books, mix, args.seed)
+    directory = tempfile.mkdtemp(prefix='bookstore-bench-')
+    try:
+        if args.url:
+            transport = HttpTransport(url=args.url)
+        else:
+            api = setup_app(books, args.storage, args.flush_interval, directory)
+            if args.transport == 'http':
+                transport = HttpTransport(api.app)
+            else:
+                transport = InProcessTransport(api.app)
+        try:
+            if args.warmup:
+                run(transport, workload, args.warmup, args.threads, phase='warmup')
+            result = run(transport, workload, args.requests, args.threads)
+        finally:
+            transport.close()
+            if not args.url:
+                api.store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    result['config'] = {key: value for key, value in vars(args).items()
+                        if key not in ('json_path', 'baseline')}
+    print(format_report(result))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""
+Response Cache
+
+An LRU cache of already-serialized response bodies. Entries are keyed on the
+endpoint, its query string and the catalog version, so a write makes every
+older entry unreachable; the cache is also cleared on writes to free the
+memory straight away. Compressed variants of a body (gzip, and brotli when
+the optional ``brotli`` package is installed) are produced on first use and
+kept alongside, so a hot response costs neither serialization nor
+compression.
+
+Below the response cache sits the search cache, which keeps the result ids
+of recent searches. Because it is invalidated precisely (see SearchCache)
+rather than on every write, hot searches skip the index even while the
+catalog is being edited.
+"""
+from collections import OrderedDict, defaultdict
+import gzip
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+from search import FIELD_WEIGHTS, max_edits, normalize, words
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+COMPRESSORS = {'gzip': lambda body: gzip.compress(body, compresslevel=6, mtime=0)}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=5)
+
+# Preferred first when a client accepts several
+ENCODINGS = [encoding for encoding in ('br', 'gzip') if encoding in COMPRESSORS]
+
+
+class CachedResponse:
+    """A serialized response body and its compressed variants."""
+
+    def __init__(self, body, mimetype, headers=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = dict(headers or {})
+        self._encoded = {'identity': body}
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """Bytes held by this entry, including compressed variants."""
+        return sum(len(body) for body in self._encoded.values())
+
+    def encoded(self, encoding):
+        """Return the body in the given content encoding, compressing once."""
+        body = self._encoded.get(encoding)
+        if body is None:
+            with self._lock:
+                body = self._encoded.get(encoding)
+                if body is None:
+                    body = COMPRESSORS[encoding](self.body)
+                    self._encoded[encoding] = body
+        return body
+
+    def negotiate(self, accept_encodings):
+        """
+        Pick the content encoding to send for a request.
+
+        Parameters:
+            accept_encodings: The request's parsed Accept-Encoding header
+
+        Returns:
+            str: 'br', 'gzip' or 'identity'
+        """
+        if len(self.body) < MIN_COMPRESS_SIZE or not ENCODINGS:
+            return 'identity'
+        return accept_encodings.best_match(ENCODINGS) or 'identity'
+
+
+class ResponseCache:
+    """Bounded LRU cache of CachedResponse entries."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the entry for a key, or None, counting the hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """Store an entry, evicting the least recently used ones if full."""
+        if len(entry.body) > self.max_bytes:
+            return entry
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries or self._total_size() > self.max_bytes:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _total_size(self):
+        """Bytes held by every entry."""
+        return sum(entry.size for entry in self._entries.values())
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+
+    def on_change(self, event, books):
+        """BookStore listener: any change makes every cached body stale."""
+        self.clear()
+
+    def stats(self):
+        """Return hit/miss counts and current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._total_size(),
+            }
+
+
+def text_tokens(text):
+    """Return the tokens of normalized text: its characters and bigrams."""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def book_tokens(book):
+    """Return the tokens of a book's searchable fields."""
+    tokens = set()
+    for field, _ in FIELD_WEIGHTS:
+        tokens |= text_tokens(normalize(book.get(field, '')))
+    return tokens
+
+
+def search_key(query, mode):
+    """Return the text a search is cached under; equal keys give equal results."""
+    query = normalize(query)
+    return query if mode == 'substring' else ' '.join(words(query))
+
+
+def query_tokens(key, mode):
+    """
+    Work out which changed books can affect a cached search.
+
+    Every book the search matches shares at least `needed` of the returned
+    tokens with it: a substring or an exact or prefix word contains all of
+    its own tokens, and each typo in a fuzzy word breaks at most three of
+    its bigrams. A book sharing fewer cannot match before or after a change.
+
+    Returns:
+        tuple: (tokens, needed), with needed 0 if any change can matter
+    """
+    terms = [key] if mode == 'substring' else words(key)
+    best = (set(), 0)
+    for term in terms:
+        tokens = text_tokens(term) if len(term) < 2 else text_tokens(term) - set(term)
+        needed = len(tokens)
+        if mode == 'fuzzy':
+            needed -= 3 * max_edits(term)
+        if needed > best[1]:
+            best = (tokens, needed)
+    return best
+
+
+class SearchCache:
+    """
+    Bounded LRU cache of search results, with a time to live.
+
+    A write only evicts the searches it can change. When a book's title or
+    author changes, the cache looks up the searches registered under the
+    book's old and new tokens and drops those sharing enough of them to
+    match (see query_tokens); edits to other fields drop nothing. Searches
+    whose results can't be tied to tokens, such as very short fuzzy ones,
+    are dropped on any such change.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        # (mode, key) -> (ids, expiry time, tokens, needed)
+        self._entries = OrderedDict()
+        # token -> set of entry keys to check when a book with it changes
+        self._watchers = defaultdict(set)
+        # book id -> book, as last seen by the cache
+        self._books = {}
+        # Bumped on every invalidation, so results computed before it
+        # aren't stored after it
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def generation(self):
+        """The current invalidation count; pass it to put()."""
+        return self._generation
+
+    def get(self, query, mode):
+        """Return the cached result ids of a search, or None, counting the hit or miss."""
+        key = (mode, search_key(query, mode))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self._clock():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query, mode, ids, generation):
+        """
+        Store the result ids of a search.
+
+        Parameters:
+            generation (int): The generation read before searching; if the
+                catalog has changed since, the result is not stored
+        """
+        key = (mode, search_key(query, mode))
+        tokens, needed = query_tokens(key[1], mode)
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (ids, self._clock() + self.ttl, tokens, needed)
+            # A book sharing `needed` tokens shares one of any
+            # len(tokens) - needed + 1 of them
+            watched = sorted(tokens)[:len(tokens) - needed + 1] if needed else [None]
+            for token in watched:
+                self._watchers[token].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        """Remove an entry and stop watching its tokens."""
+        _, _, tokens, needed = self._entries.pop(key)
+        watched = sorted(tokens)[:len(tokens) - needed + 1] if needed else [None]
+        for token in watched:
+            keys = self._watchers[token]
+            keys.discard(key)
+            if not keys:
+                del self._watchers[token]
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._watchers.clear()
+            self._generation += 1
+
+    def on_change(self, event, books):
+        """BookStore listener dropping the searches a change can affect."""
+        with self._lock:
+            if event == 'reload':
+                self._books = {book['id']: book for book in books}
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                self._watchers.clear()
+                self._generation += 1
+                return
+
+            changed = set()
+            for book in books:
+                old = self._books.pop(book['id'], None)
+                new = None if event == 'delete' else book
+                if new is not None:
+                    self._books[book['id']] = new
+                if old is not None and new is not None and all(
+                        old.get(field) == new.get(field) for field, _ in FIELD_WEIGHTS):
+                    continue
+                for version in (old, new):
+                    if version is not None:
+                        changed.add(frozenset(book_tokens(version)))
+            if not changed:
+                return
+
+            self._generation += 1
+            for tokens in changed:
+                candidates = set(self._watchers.get(None, ()))
+                for token in tokens:
+                    candidates.update(self._watchers.get(token, ()))
+                for key in candidates:
+                    entry = self._entries.get(key)
+                    if entry is not None and len(entry[2] & tokens) >= entry[3]:
+                        self._drop(key)
+                        self.invalidations += 1
+
+    def stats(self):
+        """Return hit/miss and invalidation counts and current size."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+            }
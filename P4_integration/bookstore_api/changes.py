@@ -0,0 +1,179 @@
+"""
+Change Feed
+
+A sequenced log of changes to the catalog, so that mirrors and caches can
+follow it incrementally instead of re-downloading every book. Each added,
+updated or deleted book gets the next sequence number; a client remembers
+the last number it has seen and asks for the changes after it, either by
+polling or over a Server-Sent Events stream.
+
+The log follows the book store as a listener. When the catalog is reloaded
+because another process changed the stored data, the reloaded catalog is
+compared with the previous one and the differences are logged like any
+other change. Only the most recent changes are kept; a client that falls
+further behind has to download the catalog again.
+
+Sequence numbers are only meaningful within one log, so a client has to
+send back the log's epoch, returned with every response, along with the
+last sequence number it saw; numbers from another log (after a restart, or
+from another worker process) are refused rather than misread. Each server
+process keeps its own log, so the feed is only served by a server with a
+single worker process: serve.py turns it off (BOOKSTORE_CHANGE_FEED=off)
+when it runs several workers, and refuses to if it is turned on.
+Event ids on a Server-Sent Events stream are ``<epoch>:<seq>``, so a
+reconnecting client's Last-Event-ID carries both.
+"""
+from collections import deque
+import threading
+import time
+import uuid
+
+EVENT_STREAM = 'text/event-stream'
+
+# Changes kept for clients that are catching up
+MAX_CHANGES = 10000
+
+
+class ChangeLogGone(Exception):
+    """Raised when the changes asked for are no longer (or not) in the log."""
+
+
+class ChangeLog:
+    """Bounded, sequenced log of book additions, updates and deletions."""
+
+    def __init__(self, max_changes=MAX_CHANGES):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._changes = deque(maxlen=max_changes)
+        self._last_seq = 0
+        # book id -> book, as last seen by the log; None until first loaded
+        self._books = None
+        self._changed = threading.Condition()
+
+    @property
+    def last_seq(self):
+        """The sequence number of the latest change, or 0 if there is none."""
+        return self._last_seq
+
+    def on_change(self, event, books):
+        """BookStore listener recording every change to the catalog."""
+        with self._changed:
+            if event == 'reload':
+                previous, self._books = self._books, {book['id']: book for book in books}
+                if previous is not None:
+                    self._diff(previous, self._books)
+            else:
+                for book in books:
+                    if event == 'delete':
+                        self._books.pop(book['id'], None)
+                    else:
+                        self._books[book['id']] = book
+                    self._append(event, book['id'], None if event == 'delete' else book)
+            self._changed.notify_all()
+
+    def _diff(self, old, new):
+        """Log the changes that turn one catalog into another."""
+        for book_id, book in new.items():
+            before = old.get(book_id)
+            if before is None:
+                self._append('add', book_id, book)
+            elif before is not book and before != book:
+                self._append('update', book_id, book)
+        for book_id in old:
+            if book_id not in new:
+                self._append('delete', book_id, None)
+
+    def _append(self, event, book_id, book):
+        """Add a change with the next sequence number."""
+        self._last_seq += 1
+        self._changes.append((self._last_seq, event, book_id, book, time.time()))
+
+    def read(self, since, epoch, limit=None):
+        """
+        Return the changes after a sequence number, oldest first.
+
+        Parameters:
+            since (int): The last sequence number the client has seen, or 0
+                to start from the oldest change kept
+            epoch (str): The epoch the client's sequence number came from;
+                may be None when starting from 0
+            limit (int): The most changes to return
+
+        Returns:
+            tuple: (changes as dicts, whether more follow)
+
+        Raises:
+            ChangeLogGone: If changes after `since` have been dropped from
+                the log, or `since` is from another log
+        """
+        with self._changed:
+            if (since or epoch is not None) and epoch != self.epoch:
+                raise ChangeLogGone("Sequence numbers are from another change log")
+            if since > self._last_seq:
+                raise ChangeLogGone(f"No change {since} in this change log")
+            first = self._changes[0][0] if self._changes else self._last_seq + 1
+            if since < first - 1:
+                raise ChangeLogGone(f"Changes after {since} are no longer available")
+
+            # Sequence numbers are contiguous, so the start is found by offset
+            start = since - first + 1
+            end = len(self._changes) if limit is None else min(len(self._changes), start + limit)
+            changes = [self._changes[i] for i in range(start, end)]
+            more = end < len(self._changes)
+
+        return [{'seq': seq, 'type': event, 'id': book_id, 'book': book, 'time': changed}
+                for seq, event, book_id, book, changed in changes], more
+
+    def wait(self, since, timeout):
+        """Wait until there are changes after `since`; returns whether there are."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._last_seq > since, timeout)
+
+
+def parse_since(value):
+    """
+    Parse a since= parameter.
+
+    Raises:
+        ValueError: If it is not a non-negative integer
+    """
+    if value is None or value == '':
+        return 0
+    try:
+        since = int(value)
+    except ValueError:
+        raise ValueError("since must be an integer")
+    if since < 0:
+        raise ValueError("since must not be negative")
+    return since
+
+
+def parse_event_id(value):
+    """
+    Parse a Last-Event-ID header, as sent by format_event().
+
+    Returns:
+        tuple: (since, epoch)
+
+    Raises:
+        ValueError: If it is not ``<epoch>:<seq>``
+    """
+    epoch, sep, seq = value.rpartition(':')
+    if not sep or not epoch:
+        raise ValueError("Last-Event-ID must be <epoch>:<seq>")
+    return parse_since(seq), epoch
+
+
+def format_event(change, epoch, dumps):
+    """Format a change as a Server-Sent Event."""
+    return (f"id: {epoch}:{change['seq']}\nevent: {change['type']}\n"
+            f"data: {dumps(change)}\n\n")
+
+
+def gone_event(message, dumps):
+    """Format the event that ends a stream whose client fell too far behind."""
+    return f"event: gone\ndata: {dumps({'error': 'Gone', 'message': message})}\n\n"
+
+
+def keepalive():
+    """Return an SSE comment that keeps an idle connection open."""
+    return ": keepalive\n\n"
@@ -0,0 +1,218 @@
+"""
+Idempotency Keys
+
+Lets a client retry a request that creates something without creating it
+twice. The client sends an ``Idempotency-Key`` header, unique to the
+operation it is attempting, and the same key with every retry of it. The
+first request with a key is carried out and its response remembered; a
+retry gets the remembered response back, marked with an
+``Idempotent-Replayed: true`` header, and nothing is written.
+
+A key may only be reused with the same request body. A retry that arrives
+while the first request is still being handled is refused with 409 rather
+than run twice. Only successful responses are remembered, so a request
+that failed can be retried with the same key.
+
+Keys are remembered for a limited time (24 hours by default) and only the
+most recent ones are kept, so a storm of retries can't grow storage without
+bound. SqliteIdempotencyStore keeps them in a database file, shared by every
+worker process serving the same catalog (see serve.py), so a retry handled
+by another worker is still recognized.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from records import json_default
+
+# Longest Idempotency-Key value accepted
+MAX_KEY_LENGTH = 255
+
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyError(Exception):
+    """Raised when a request can't be run or replayed under its key."""
+
+
+class KeyInUse(IdempotencyError):
+    """Raised when a request with the same key is still being handled."""
+
+    status = 409
+
+
+class KeyReused(IdempotencyError):
+    """Raised when a key is sent again with a different request."""
+
+    status = 422
+
+
+def parse_key(value):
+    """
+    Validate an Idempotency-Key header value.
+
+    Returns:
+        str: The key, or None if the header was not sent
+
+    Raises:
+        ValueError: If the key is empty or too long
+    """
+    if value is None:
+        return None
+    key = value.strip()
+    if not key:
+        raise ValueError("Idempotency-Key must not be empty")
+    if len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+    return key
+
+
+class SqliteIdempotencyStore:
+    """
+    Idempotency keys kept in a SQLite database shared between processes.
+
+    Each call is one transaction, so checking and claiming a key is atomic
+    across processes. Keys are kept in the order they were first used; when
+    the store is full the oldest are dropped. A key whose request is still
+    running is only held for ``running_ttl`` seconds, so a worker that dies
+    mid-request doesn't block retries for the whole ``ttl``. The database is
+    opened on first use, so a process that never sees a key never creates it.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            seq INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            fingerprint TEXT NOT NULL,
+            expires REAL NOT NULL,
+            response TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idempotency_keys_expires
+            ON idempotency_keys (expires);
+    """
+
+    def __init__(self, path, max_keys=10000, ttl=24 * 3600, running_ttl=60,
+                 clock=time.time):
+        self.path = path
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.running_ttl = running_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self.replays = 0
+
+    def _connection(self):
+        """Return the database connection, opening it on first use."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def __len__(self):
+        with self._lock:
+            if self._conn is None and not os.path.exists(self.path):
+                return 0
+            return self._connection().execute(
+                'SELECT COUNT(*) FROM idempotency_keys').fetchone()[0]
+
+    @staticmethod
+    def _key(key):
+        """Serialize a key, which may be a tuple, to a string."""
+        return json.dumps(key)
+
+    def _transaction(self, work):
+        """Run work(connection) in one transaction that excludes other writers."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+
+    def begin(self, key, request_fingerprint):
+        """
+        Start handling a request under a key.
+
+        Parameters:
+            key: The idempotency key, scoped as the caller sees fit
+            request_fingerprint (str): Identifies the request's content
+
+        Returns:
+            tuple: The remembered (data, status) to send again, or None if
+                the request should be carried out; then call complete() or
+                abandon()
+
+        Raises:
+            KeyInUse: If a request with this key is still being handled
+            KeyReused: If the key was used for a different request
+        """
+        def work(conn):
+            now = self._clock()
+            conn.execute('DELETE FROM idempotency_keys WHERE expires <= ?', (now,))
+            row = conn.execute(
+                'SELECT fingerprint, response FROM idempotency_keys WHERE key = ?',
+                (self._key(key),)
+            ).fetchone()
+            if row is not None:
+                if row[0] != request_fingerprint:
+                    raise KeyReused("Idempotency-Key was already used for a different request")
+                if row[1] is None:
+                    raise KeyInUse("A request with this Idempotency-Key is in progress")
+                data, status = json.loads(row[1])
+                return data, status
+
+            conn.execute(
+                'INSERT INTO idempotency_keys (key, fingerprint, expires) VALUES (?, ?, ?)',
+                (self._key(key), request_fingerprint, now + self.running_ttl)
+            )
+            conn.execute(
+                'DELETE FROM idempotency_keys WHERE seq IN '
+                '(SELECT seq FROM idempotency_keys ORDER BY seq DESC LIMIT -1 OFFSET ?)',
+                (self.max_keys,)
+            )
+            return None
+
+        replay = self._transaction(work)
+        if replay is not None:
+            self.replays += 1
+        return replay
+
+    def complete(self, key, data, status):
+        """Remember the response to a request started with begin()."""
+        response = json.dumps([data, status], default=json_default)
+        self._transaction(lambda conn: conn.execute(
+            'UPDATE idempotency_keys SET response = ?, expires = ? WHERE key = ?',
+            (response, self._clock() + self.ttl, self._key(key))
+        ))
+
+    def abandon(self, key):
+        """Forget a request that failed, so it can be retried under its key."""
+        self._transaction(lambda conn: conn.execute(
+            'DELETE FROM idempotency_keys WHERE key = ? AND response IS NULL',
+            (self._key(key),)
+        ))
+
+    def stats(self):
+        """Return the number of replays (by this process) and of remembered keys."""
+        return {'replays': self.replays, 'keys': len(self)}
+
+    def close(self):
+        """Close the database connection, if it was opened."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
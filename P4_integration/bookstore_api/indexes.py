@@ -0,0 +1,339 @@
+"""
+Catalog Indexes
+
+Secondary indexes for filtering and sorting the book listing without
+scanning the catalog. For every sortable field the index keeps a list of
+(sort value, book id) entries in order; the price list doubles as the range
+index for price filters. Alongside are an author -> ids index and the sets
+of in-stock and out-of-stock ids.
+
+A query narrows the candidates with whichever index is most selective. If
+few books can match, they are sorted directly; otherwise the index of the
+sort field is walked in order from the cursor, skipping books that fail a
+filter, until the page is full. A price range that isn't the most
+selective filter is checked on each book as it is reached rather than
+collected into a set. Like the search index it is kept up to date by
+listening to the book store.
+"""
+import bisect
+from collections import defaultdict
+from operator import itemgetter
+import threading
+
+from pagination import BOOK_FIELDS, decode_cursor
+from profiling import TRUE_VALUES
+from search import normalize
+
+SORT_FIELDS = BOOK_FIELDS
+
+# Sort candidates directly when at most this fraction of the catalog can match
+SELECTIVE_FRACTION = 1 / 8
+
+FALSE_VALUES = ('0', 'false', 'no', 'off')
+
+
+def sort_value(book, field):
+    """Return the value a book is ordered by for a field."""
+    value = book.get(field)
+    if field == 'price':
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    if field == 'in_stock':
+        return bool(value)
+    if field == 'id':
+        return value
+    return normalize(value if value is not None else '')
+
+
+def _parse_bool(name, value):
+    """Parse a true/false query parameter."""
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValueError(f"{name} must be true or false")
+
+
+def _parse_number(name, value):
+    """Parse a numeric query parameter."""
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def parse_sort(value):
+    """
+    Parse a sort= parameter: a field name, prefixed with '-' for descending.
+
+    Returns:
+        tuple: (field, descending)
+
+    Raises:
+        ValueError: If the field cannot be sorted by
+    """
+    value = (value or 'id').strip()
+    descending = value.startswith('-')
+    field = value.lstrip('-')
+    if field not in SORT_FIELDS:
+        raise ValueError(
+            f"Cannot sort by {field!r}. Valid fields: {', '.join(SORT_FIELDS)}"
+        )
+    return field, descending
+
+
+def sort_spec(query):
+    """Return the sort= spelling of a parsed query's order."""
+    return ('-' if query['descending'] else '') + query['sort']
+
+
+def cursor_key(book, query):
+    """Return the cursor key of a book in a filtered or sorted listing."""
+    return [sort_spec(query), sort_value(book, query['sort']), book['id']]
+
+
+def _after(cursor, query):
+    """Decode a cursor into the (sort value, id) entry to continue after."""
+    key = decode_cursor(cursor)
+    if len(key) != 3 or key[0] != sort_spec(query):
+        raise ValueError("Cursor does not match the sort order")
+    value, book_id = key[1], key[2]
+    field = query['sort']
+    if field == 'price':
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif field == 'in_stock':
+        valid = isinstance(value, bool)
+    else:
+        valid = isinstance(value, str)
+    if not valid or not isinstance(book_id, str):
+        raise ValueError("Invalid cursor")
+    return (float(value) if field == 'price' else value), book_id
+
+
+def parse_query(args):
+    """
+    Parse the filter and sort parameters of a listing.
+
+    Parameters:
+        args: The request's query parameters
+
+    Returns:
+        dict: Keyword arguments for CatalogIndex.query(), or None if the
+            listing is neither filtered nor sorted
+
+    Raises:
+        ValueError: If a parameter is invalid
+    """
+    if not any(name in args for name in
+               ('in_stock', 'min_price', 'max_price', 'author', 'sort')):
+        return None
+
+    field, descending = parse_sort(args.get('sort'))
+    query = {'sort': field, 'descending': descending}
+    if 'in_stock' in args:
+        query['in_stock'] = _parse_bool('in_stock', args['in_stock'])
+    for name in ('min_price', 'max_price'):
+        if name in args:
+            query[name] = _parse_number(name, args[name])
+    if args.get('author'):
+        query['author'] = args['author']
+    if args.get('cursor'):
+        query['after'] = _after(args['cursor'], query)
+    return query
+
+
+class PriceRange:
+    """Tests book ids for a price within inclusive bounds, like a set would."""
+
+    def __init__(self, books, min_price, max_price):
+        self._books = books
+        self.min_price = min_price
+        self.max_price = max_price
+
+    def __contains__(self, book_id):
+        price = sort_value(self._books[book_id], 'price')
+        return ((self.min_price is None or price >= self.min_price)
+                and (self.max_price is None or price <= self.max_price))
+
+
+class CatalogIndex:
+    """Sorted field indexes plus author and stock indexes over the catalog."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # book id -> book, as last seen by the index
+        self._books = {}
+        # field -> sorted [(sort value, book id), ...]
+        self._sorted = {field: [] for field in SORT_FIELDS}
+        # normalized author -> set of book ids
+        self._authors = defaultdict(set)
+        self._stock = {True: set(), False: set()}
+
+    def __len__(self):
+        return len(self._books)
+
+    # Maintenance
+
+    def on_change(self, event, books):
+        """BookStore listener keeping the indexes in sync with the catalog."""
+        if event == 'reload':
+            self.rebuild(books)
+        elif event == 'delete':
+            for book in books:
+                self.remove(book['id'])
+        else:
+            for book in books:
+                self.add(book)
+
+    def rebuild(self, books):
+        """Discard the indexes and build them again from a list of books."""
+        with self._lock:
+            self._books = {book['id']: book for book in books}
+            for field in SORT_FIELDS:
+                self._sorted[field] = sorted(
+                    (sort_value(book, field), book['id']) for book in self._books.values()
+                )
+            self._authors.clear()
+            self._stock = {True: set(), False: set()}
+            for book_id, book in self._books.items():
+                self._authors[sort_value(book, 'author')].add(book_id)
+                self._stock[sort_value(book, 'in_stock')].add(book_id)
+
+    def add(self, book):
+        """Index a book, replacing any previous version of it."""
+        with self._lock:
+            if book['id'] in self._books:
+                self.remove(book['id'])
+            book_id = book['id']
+            self._books[book_id] = book
+            for field in SORT_FIELDS:
+                bisect.insort(self._sorted[field], (sort_value(book, field), book_id))
+            self._authors[sort_value(book, 'author')].add(book_id)
+            self._stock[sort_value(book, 'in_stock')].add(book_id)
+
+    def remove(self, book_id):
+        """Drop a book from the indexes."""
+        with self._lock:
+            book = self._books.pop(book_id, None)
+            if book is None:
+                return
+            for field in SORT_FIELDS:
+                entries = self._sorted[field]
+                del entries[bisect.bisect_left(entries, (sort_value(book, field), book_id))]
+            author = sort_value(book, 'author')
+            self._authors[author].discard(book_id)
+            if not self._authors[author]:
+                del self._authors[author]
+            self._stock[sort_value(book, 'in_stock')].discard(book_id)
+
+    # Querying
+
+    def query(self, sort='id', descending=False, in_stock=None, min_price=None,
+              max_price=None, author=None, after=None, limit=None):
+        """
+        Find the books matching every given filter, in order.
+
+        Parameters:
+            sort (str): The field to order by; ties are broken by ID
+            descending (bool): Order from highest to lowest
+            in_stock (bool): Only books that are (or are not) in stock
+            min_price, max_price (float): Inclusive price bounds
+            author (str): Only books by this author (case-insensitive)
+            after (tuple): The (sort value, id) of the last book on the
+                previous page
+            limit (int): The maximum number of books to return
+
+        Returns:
+            tuple: (books, more) where more is True if matches follow
+        """
+        with self._lock:
+            filters = []
+            if author is not None:
+                filters.append(self._authors.get(normalize(author), set()))
+            if in_stock is not None:
+                filters.append(self._stock[in_stock])
+
+            prices = self._sorted['price']
+            low, high = 0, len(prices)
+            if min_price is not None:
+                low = bisect.bisect_left(prices, min_price, key=itemgetter(0))
+            if max_price is not None:
+                high = bisect.bisect_right(prices, max_price, key=itemgetter(0))
+            priced = min_price is not None or max_price is not None
+
+            if sort == 'price':
+                # The price index covers the range exactly, in order
+                ids = self._walk(prices, low, high, filters, descending, after, limit)
+            else:
+                sizes = [len(ids) for ids in filters] + ([high - low] if priced else [])
+                if sizes and min(sizes) <= len(self._books) * SELECTIVE_FRACTION:
+                    ids = self._sort_candidates(filters, (low, high) if priced else None,
+                                                PriceRange(self._books, min_price, max_price),
+                                                sort, descending, after, limit)
+                else:
+                    if priced:
+                        # Checked last, after the cheaper set lookups
+                        filters.append(PriceRange(self._books, min_price, max_price))
+                    entries = self._sorted[sort]
+                    ids = self._walk(entries, 0, len(entries), filters, descending,
+                                     after, limit)
+
+            more = limit is not None and len(ids) > limit
+            return [self._books[book_id] for book_id in ids[:limit]], more
+
+    @staticmethod
+    def _walk(entries, low, high, filters, descending, after, limit):
+        """
+        Walk entries[low:high] in order from the cursor, keeping matches.
+
+        Returns up to limit + 1 ids, so the caller can tell if more follow.
+        """
+        if descending:
+            if after is not None:
+                high = min(high, bisect.bisect_left(entries, after))
+            positions = range(high - 1, low - 1, -1)
+        else:
+            if after is not None:
+                low = max(low, bisect.bisect_right(entries, after))
+            positions = range(low, high)
+
+        ids = []
+        for position in positions:
+            book_id = entries[position][1]
+            if all(book_id in members for members in filters):
+                ids.append(book_id)
+                if limit is not None and len(ids) > limit:
+                    break
+        return ids
+
+    def _sort_candidates(self, filters, price_span, price_range, sort, descending,
+                         after, limit):
+        """
+        Sort the few books that pass every filter; returns up to limit + 1 ids.
+
+        price_span is the (low, high) slice of the price index in range, or
+        None; the range is only collected into a set when it is the most
+        selective filter, and otherwise checked on the other candidates.
+        """
+        filters = sorted(filters, key=len)
+        if price_span is not None and (not filters or
+                                       price_span[1] - price_span[0] < len(filters[0])):
+            prices = self._sorted['price']
+            candidates = {prices[position][1] for position in range(*price_span)}
+            candidates.intersection_update(*filters)
+        else:
+            candidates = set(filters[0]).intersection(*filters[1:])
+            if price_span is not None:
+                candidates = {book_id for book_id in candidates if book_id in price_range}
+
+        entries = sorted(((sort_value(self._books[book_id], sort), book_id)
+                          for book_id in candidates), reverse=descending)
+        if after is not None:
+            entries = [entry for entry in entries
+                       if (entry < after if descending else entry > after)]
+        if limit is not None:
+            entries = entries[:limit + 1]
+        return [book_id for _, book_id in entries]
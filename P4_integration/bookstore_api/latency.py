@@ -0,0 +1,166 @@
+"""
+Latency Injection
+
+Artificial delay for the bookstore API, used to simulate a realistic network
+in test environments. Delay is configured per endpoint and is off unless
+configured, so production runs with no sleeps at all.
+
+A configuration is a dict (or its JSON text, or a path to a JSON file):
+
+    {
+        "default": 0.1,
+        "endpoints": {
+            "get_books": {"distribution": "uniform", "low": 0.1, "high": 0.3},
+            "search_books": {"distribution": "normal", "mean": 0.3, "stddev": 0.05},
+            "add_book": {"distribution": "exponential", "mean": 0.5},
+            "delete_book": null
+        }
+    }
+
+Each value is either a number of seconds (fixed delay), a distribution spec,
+or null/0 for no delay. The string "legacy" selects the delays the API used
+to hard-code; "off" or an empty string disables injection.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+# The fixed delays every handler used to sleep for
+LEGACY_CONFIG = {
+    'endpoints': {
+        'get_books': 0.2,
+        'get_book': 0.2,
+        'add_book': 0.5,
+        'update_book': 0.5,
+        'delete_book': 0.5,
+        'search_books': 0.3,
+    }
+}
+
+DISTRIBUTIONS = {
+    'fixed': lambda rng, spec: spec['seconds'],
+    'uniform': lambda rng, spec: rng.uniform(spec['low'], spec['high']),
+    'normal': lambda rng, spec: rng.gauss(spec['mean'], spec['stddev']),
+    'exponential': lambda rng, spec: rng.expovariate(1.0 / spec['mean']),
+}
+
+
+def parse_config(value):
+    """
+    Turn a latency setting into a configuration dict.
+
+    Parameters:
+        value (str|dict|None): "off", "legacy", JSON text, a JSON file path,
+            or an already parsed configuration
+
+    Returns:
+        dict: The configuration
+    """
+    if isinstance(value, dict):
+        return value
+    if value is None:
+        return {}
+
+    value = value.strip()
+    if value.lower() in ('', 'off', 'none', '0'):
+        return {}
+    if value.lower() == 'legacy':
+        return LEGACY_CONFIG
+    if os.path.exists(value):
+        with open(value) as f:
+            return json.load(f)
+    try:
+        return json.loads(value)
+    except ValueError:
+        raise ValueError(f"Invalid latency configuration: {value!r}")
+
+
+def _normalize_spec(spec):
+    """Validate a delay spec, returning a distribution dict or None."""
+    if spec is None:
+        return None
+    if isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        return {'distribution': 'fixed', 'seconds': float(spec)} if spec > 0 else None
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    distribution = spec.get('distribution', 'fixed')
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {distribution!r}")
+    try:
+        DISTRIBUTIONS[distribution](random.Random(0), spec)
+    except (KeyError, ValueError, ZeroDivisionError) as e:
+        raise ValueError(f"Invalid {distribution} latency spec {spec!r}: {e}")
+    return dict(spec, distribution=distribution)
+
+
+class LatencyInjector:
+    """Sleeps for a configured amount of time before handling a request."""
+
+    def __init__(self, config=None, sleep=time.sleep, rng=None):
+        config = parse_config(config)
+        self._default = _normalize_spec(config.get('default'))
+        self._endpoints = {
+            endpoint: _normalize_spec(spec)
+            for endpoint, spec in config.get('endpoints', {}).items()
+        }
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        # endpoint -> [requests delayed, total seconds injected]
+        self._stats = {}
+
+    @property
+    def enabled(self):
+        """Whether any endpoint has a delay configured."""
+        return self._default is not None or any(self._endpoints.values())
+
+    def delay_for(self, endpoint):
+        """Draw the delay, in seconds, for one request to an endpoint."""
+        spec = self._endpoints.get(endpoint, self._default)
+        if spec is None:
+            return 0.0
+        return max(0.0, DISTRIBUTIONS[spec['distribution']](self._rng, spec))
+
+    def inject(self, endpoint):
+        """
+        Sleep for the endpoint's configured delay.
+
+        Returns:
+            float: The number of seconds slept
+        """
+        seconds = self.delay_for(endpoint)
+        if seconds <= 0:
+            return 0.0
+
+        self._sleep(seconds)
+        self._record(endpoint, seconds)
+        return seconds
+
+    async def inject_async(self, endpoint):
+        """Like inject(), but yields to the event loop instead of blocking."""
+        seconds = self.delay_for(endpoint)
+        if seconds <= 0:
+            return 0.0
+
+        await asyncio.sleep(seconds)
+        self._record(endpoint, seconds)
+        return seconds
+
+    def _record(self, endpoint, seconds):
+        """Add injected delay to the per-endpoint totals."""
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+
+    def stats(self):
+        """Return {endpoint: {'count': n, 'seconds': total}} of injected delay."""
+        with self._lock:
+            return {
+                endpoint: {'count': count, 'seconds': seconds}
+                for endpoint, (count, seconds) in self._stats.items()
+            }
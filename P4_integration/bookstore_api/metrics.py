@@ -0,0 +1,235 @@
+"""
+Metrics
+
+Request instrumentation for the bookstore API, exposed in the Prometheus
+text format. Histograms and counters are kept in memory per process; gauges
+are read from a callback when the metrics are scraped.
+
+Time inside a request is split into phases (storage, serialization, injected
+delay) by timing the code that does each; whatever is left over is counted
+as handler time. Phases are tracked per thread, and time spent outside a
+request (such as background flushes) is not attributed to any request.
+"""
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    """Escape a label value for the text format."""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    """Format a {name="value",...} label set, or '' if there are none."""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    """Format a sample value."""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count, per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add to the count for a label set."""
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        """Yield the text format lines for every label set."""
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_labels(self.labels, key)} {_number(value)}"
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, per label set."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record one observation for a label set."""
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self):
+        """Yield the text format lines for every label set."""
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            for bound, count in zip(self.buckets, counts):
+                labels = _labels(self.labels, key, [('le', _number(float(bound)))])
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _labels(self.labels, key, [('le', '+Inf')])
+            yield f"{self.name}_bucket{labels} {counts[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {_number(counts[-2])}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {counts[-1]}"
+
+
+class Gauge:
+    """A value read from a callback at scrape time."""
+
+    def __init__(self, name, help, read, labels=(), kind='gauge'):
+        """
+        Parameters:
+            read (callable): Returns a number, or a {label values: number}
+                dict when labels are given
+            kind (str): 'gauge', or 'counter' for totals kept elsewhere
+        """
+        self.name = name
+        self.help = help
+        self.read = read
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self):
+        """Yield the text format lines for the current value(s)."""
+        value = self.read()
+        if not self.labels:
+            yield f"{self.name} {_number(value)}"
+            return
+        for key, sample in sorted(value.items()):
+            yield f"{self.name}{_labels(self.labels, key)} {_number(sample)}"
+
+
+class Registry:
+    """A set of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """Add a metric and return it."""
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        """Create and register a Counter."""
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        """Create and register a Histogram."""
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read, labels=(), kind='gauge'):
+        """Create and register a Gauge."""
+        return self.register(Gauge(name, help, read, labels, kind))
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# Per-thread phase timings of the request being handled
+_local = threading.local()
+
+
+def start_request():
+    """Start tracking phase timings for a request on this thread."""
+    _local.timings = {}
+    _local.active = set()
+
+
+def finish_request():
+    """Stop tracking and return {phase: seconds} for this thread's request."""
+    timings = getattr(_local, 'timings', None) or {}
+    _local.timings = None
+    return timings
+
+
+def add_phase(name, seconds):
+    """Attribute time measured elsewhere to a phase of the current request."""
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to a phase of the current request."""
+    timings = getattr(_local, 'timings', None)
+    if timings is None or name in _local.active:
+        # Not in a request, or nested inside the same phase already
+        yield
+        return
+
+    _local.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.active.discard(name)
+        add_phase(name, time.perf_counter() - start)
+
+
+def timed(name, func):
+    """Wrap a callable so the time spent in it counts towards a phase."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# Storage methods that read or write the stored catalog
+STORAGE_METHODS = ('load', 'save', 'apply', 'version', 'position', 'changes_since',
+                   'checkpoint', 'load_extra')
+
+
+def instrument_storage(storage):
+    """
+    Count time spent in a storage backend's reads and writes as 'storage'.
+
+    This includes catching up with writes made by other processes
+    (changes_since) and reading or writing saved indexes.
+    """
+    for name in STORAGE_METHODS:
+        setattr(storage, name, timed('storage', getattr(storage, name)))
+    return storage
@@ -0,0 +1,89 @@
+"""
+Pagination
+
+Helpers for paging through and projecting book listings. Pages are keyed on
+book ID (keyset pagination): the cursor is an opaque token holding the sort
+key of the last book on the previous page, so pages stay stable while books
+are added or removed and fetching page N costs the same as fetching page 1.
+"""
+import base64
+import binascii
+import json
+
+BOOK_FIELDS = ('id', 'title', 'author', 'price', 'in_stock')
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(key):
+    """Encode a sort key (a list of values) as an opaque cursor."""
+    raw = json.dumps(key, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or not key:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def parse_limit(value):
+    """
+    Parse a page size query parameter.
+
+    Returns:
+        int: The page size, or None if not given
+
+    Raises:
+        ValueError: If it is not an integer between 1 and MAX_PAGE_SIZE
+    """
+    if value is None or value == '':
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def parse_fields(value):
+    """
+    Parse a comma-separated fields= projection.
+
+    Returns:
+        list: The requested fields, or None to return whole books
+
+    Raises:
+        ValueError: If an unknown field is requested
+    """
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in BOOK_FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}. "
+            f"Valid fields: {', '.join(BOOK_FIELDS)}"
+        )
+    return fields or None
+
+
+def project(book, fields):
+    """Return only the requested fields of a book."""
+    if fields is None:
+        return book
+    return {field: book[field] for field in fields}
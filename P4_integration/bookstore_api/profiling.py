@@ -0,0 +1,163 @@
+"""
+Request Profiling
+
+Opt-in cProfile profiling of individual requests, for finding out why a
+particular search or listing is slow. Profiling is off unless configured:
+
+    BOOKSTORE_PROFILE=on     profile requests that ask for it, with an
+                             X-Profile: 1 header or a ?profile=1 parameter
+    BOOKSTORE_PROFILE=0.01   also profile a random 1% of all requests
+
+A profiled response carries an X-Profile-Id header. The profile is kept in
+memory (the most recent ``keep`` of them) and, if BOOKSTORE_PROFILE_DIR is
+set, written there as ``<id>.prof`` for pstats or snakeviz. Only the handler
+is profiled: injected delay is not, and neither is the body of a streamed
+response, which is produced after the handler returns.
+"""
+from collections import OrderedDict
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+
+def parse_setting(value):
+    """
+    Turn a BOOKSTORE_PROFILE setting into (enabled, sample rate).
+
+    Raises:
+        ValueError: If the setting is not recognized
+    """
+    value = (value or '').strip().lower()
+    if value in ('', 'off', 'none', '0', 'false', 'no'):
+        return False, 0.0
+    if value in TRUE_VALUES:
+        return True, 0.0
+    try:
+        rate = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid profiling setting: {value!r}")
+    if not 0 < rate <= 1:
+        raise ValueError(f"Profiling sample rate must be in (0, 1]: {value!r}")
+    return True, rate
+
+
+class _Snapshot:
+    """Hands pstats.Stats a copy of raw profile stats, which it consumes."""
+
+    def __init__(self, stats):
+        self._stats = stats
+
+    def create_stats(self):
+        """Called by pstats.Stats to collect the stats."""
+        self.stats = dict(self._stats)
+
+
+class Profile:
+    """The profile of one request."""
+
+    def __init__(self, profile_id, endpoint, path, duration, stats):
+        """
+        Parameters:
+            stats (dict): Raw cProfile stats, as in cProfile.Profile.stats
+        """
+        self.id = profile_id
+        self.endpoint = endpoint
+        self.path = path
+        self.duration = duration
+        self.created_at = time.time()
+        self.stats = stats
+
+    def summary(self):
+        """Return a JSON-serializable description of the profile."""
+        return {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'path': self.path,
+            'duration_ms': round(self.duration * 1000, 3),
+            'created_at': self.created_at,
+        }
+
+    def dump(self):
+        """Return the profile in the binary format pstats and snakeviz read."""
+        return marshal.dumps(self.stats)
+
+    def report(self, sort='cumulative', limit=40):
+        """Return the top functions as pstats' text report."""
+        out = io.StringIO()
+        stats = pstats.Stats(_Snapshot(self.stats), stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+class Profiler:
+    """Decides which requests to profile, profiles them and keeps the results."""
+
+    def __init__(self, setting=None, directory=None, keep=20, rng=None):
+        self.enabled, self.sample_rate = parse_setting(setting)
+        self.directory = directory
+        self.keep = keep
+        self._rng = rng or random.Random()
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def wanted(self, args, headers):
+        """Whether to profile a request, given its query args and headers."""
+        if not self.enabled:
+            return False
+        if (args.get('profile', '').lower() in TRUE_VALUES
+                or headers.get('X-Profile', '').lower() in TRUE_VALUES):
+            return True
+        return self.sample_rate > 0 and self._rng.random() < self.sample_rate
+
+    def start(self):
+        """
+        Start profiling the current thread.
+
+        Returns:
+            tuple: (profiler, start time) to pass to stop(), or None if
+                another profiler is already active
+        """
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Only one profiler may be active at a time on some Pythons
+            return None
+        return profiler, time.perf_counter()
+
+    def stop(self, started, endpoint, path):
+        """Stop profiling and keep the profile; returns it."""
+        profiler, start = started
+        profiler.disable()
+        duration = time.perf_counter() - start
+
+        profile_id = uuid.uuid4().hex[:12]
+        profiler.create_stats()
+        profile = Profile(profile_id, endpoint, path, duration, profiler.stats)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.directory, f"{profile_id}.prof"))
+
+        with self._lock:
+            self._profiles[profile_id] = profile
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        return profile
+
+    def get(self, profile_id):
+        """Return a kept profile, or None."""
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def profiles(self):
+        """Return the kept profiles, most recent first."""
+        with self._lock:
+            return list(reversed(self._profiles.values()))
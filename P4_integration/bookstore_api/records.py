@@ -0,0 +1,115 @@
+"""
+Book Records
+
+The compact in-memory representation of a book. A catalog of plain dicts
+pays for a hash table per book; a Book keeps its fields in fixed slots
+instead, and author names are interned so that each author's name is held
+once however many books they wrote. Fields can be read as attributes
+(``book.price``), which is what the store's own code does, or by key
+(``book['price']``), so a Book can be used wherever a read-only book dict
+was expected. Books are converted to dicts only when they are written out:
+to JSON responses, storage files and rows.
+
+Records are immutable by convention: a change makes a new record with
+replace(), so a reader holding a book always sees a whole version of it.
+"""
+from collections.abc import Mapping
+import sys
+
+FIELDS = ('id', 'title', 'author', 'price', 'in_stock')
+_FIELD_SET = frozenset(FIELDS)
+
+
+class Book(Mapping):
+    """
+    A book record with slots for its fields.
+
+    Attributes:
+        id (str): The book's unique ID
+        title (str): The title
+        author (str): The author's name, interned
+        price (float): The price
+        in_stock (bool): Whether the book is in stock
+        extra (dict): Any other fields the stored book had, or None
+
+    A field missing from the data the record was built from stays unset,
+    and is missing from the record as a mapping too.
+    """
+
+    __slots__ = FIELDS + ('extra',)
+
+    def __init__(self, id, title, author, price, in_stock=True, extra=None):
+        self.id = id
+        self.title = title
+        self.author = sys.intern(author) if type(author) is str else author
+        self.price = price
+        self.in_stock = in_stock
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a book dict; records are returned as they are."""
+        if isinstance(data, cls):
+            return data
+        book = cls.__new__(cls)
+        extra = None
+        for key, value in data.items():
+            if key in _FIELD_SET:
+                if key == 'author' and type(value) is str:
+                    value = sys.intern(value)
+                setattr(book, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        book.extra = extra
+        return book
+
+    def to_dict(self):
+        """Return the book as a plain dict, for serialization."""
+        return dict(self.items())
+
+    def replace(self, **changes):
+        """Return a new record with some fields changed."""
+        data = self.to_dict()
+        data.update(changes)
+        return Book.from_dict(data)
+
+    # Read-only mapping interface
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for field in FIELDS:
+            if hasattr(self, field):
+                yield field
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def items(self):
+        """Return the (field, value) pairs that are set, in field order."""
+        pairs = [(field, getattr(self, field)) for field in FIELDS if hasattr(self, field)]
+        if self.extra:
+            pairs.extend(self.extra.items())
+        return pairs
+
+    def __repr__(self):
+        return f"Book({self.to_dict()!r})"
+
+
+def json_default(value):
+    """A json ``default=`` hook that serializes records as dicts."""
+    if isinstance(value, Book):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
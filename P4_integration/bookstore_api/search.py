@@ -0,0 +1,464 @@
+"""
+Book Search
+
+An inverted index over book titles and authors. Each field is broken into
+word tokens and character trigrams; a query is answered by intersecting the
+posting lists of its trigrams, so only books that can possibly contain the
+query are looked at. The index is kept up to date incrementally by listening
+to the book store, and can be saved with a snapshot of the catalog and
+restored from it instead of being rebuilt.
+
+Alongside is a sorted vocabulary of every indexed word, with its own
+trigram index. Prefix search (for as-you-type suggestions) finds the words
+starting with the last term by bisecting the vocabulary. Fuzzy search uses
+the vocabulary's trigrams to find words that could be within a few edits of
+each term, then confirms the edit distance of only those words.
+"""
+import bisect
+from collections import Counter, defaultdict
+from itertools import groupby
+import marshal
+from operator import itemgetter
+import re
+import threading
+
+NGRAM_SIZE = 3
+
+# Marks the start and end of a field so that every substring, even of a very
+# short field, is contained in at least one trigram
+PAD = '\x00'
+
+WORD_RE = re.compile(r'\w+')
+
+# How much a match in each field counts towards the ranking
+FIELD_WEIGHTS = (('title', 2), ('author', 1))
+
+# The most completions of a prefix looked at, shortest words first
+MAX_PREFIX_WORDS = 200
+
+
+def normalize(text):
+    """Normalize text for indexing and querying."""
+    return str(text).lower()
+
+
+def words(text):
+    """Split normalized text into word tokens."""
+    return WORD_RE.findall(text)
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """Return the set of character n-grams of a string."""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def field_grams(text):
+    """Return the trigrams indexed for a field, including padded edges."""
+    return ngrams(f"{PAD}{text}{PAD}")
+
+
+def max_edits(term):
+    """The number of typos tolerated in a search term of this length."""
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """
+    Return the edit distance between two strings, counting an insertion,
+    deletion, substitution or swap of adjacent characters as one edit.
+
+    Gives up early and returns limit + 1 once the distance exceeds limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    before = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            value = min(previous[j] + 1, current[j - 1] + 1,
+                        previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SearchIndex:
+    """Inverted word and trigram index over book titles and authors."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # book id -> {'title': ..., 'author': ...} normalized field text
+        self._docs = {}
+        # book id -> position in the catalog, used to break ranking ties
+        self._order = {}
+        self._next_order = 0
+        # trigram -> set of book ids
+        self._grams = defaultdict(set)
+        # word -> set of book ids
+        self._words = defaultdict(set)
+        # Every indexed word, sorted, and trigram -> set of words; the
+        # vocabulary is None while a rebuild is in progress
+        self._vocab = []
+        self._vocab_grams = defaultdict(set)
+
+    def __len__(self):
+        return len(self._docs)
+
+    # Maintenance
+
+    def on_change(self, event, books):
+        """BookStore listener keeping the index in sync with the catalog."""
+        if event == 'reload':
+            self.rebuild(books)
+        elif event == 'delete':
+            for book in books:
+                self.remove(book['id'])
+        else:
+            for book in books:
+                self.add(book)
+
+    def rebuild(self, books):
+        """Discard the index and build it again from a list of books."""
+        with self._lock:
+            self._docs.clear()
+            self._order.clear()
+            self._next_order = 0
+            self._grams.clear()
+            self._words.clear()
+            self._vocab = None
+            for book in books:
+                self.add(book)
+            self._build_vocabulary()
+
+    def _tokens(self, doc):
+        """Return the (trigrams, words) of a document's fields."""
+        grams = set()
+        tokens = set()
+        for field, _ in FIELD_WEIGHTS:
+            grams |= field_grams(doc[field])
+            tokens.update(words(doc[field]))
+        return grams, tokens
+
+    def add(self, book):
+        """Index a book, replacing any previous version of it."""
+        book_id = book['id']
+        doc = {field: normalize(book[field]) for field, _ in FIELD_WEIGHTS}
+
+        with self._lock:
+            old = self._docs.get(book_id)
+            if old == doc:
+                return
+            if old is not None:
+                self._unindex(book_id, old)
+            else:
+                self._order[book_id] = self._next_order
+                self._next_order += 1
+
+            self._docs[book_id] = doc
+            grams, tokens = self._tokens(doc)
+            for gram in grams:
+                self._grams[gram].add(book_id)
+            for token in tokens:
+                if token not in self._words:
+                    self._add_word(token)
+                self._words[token].add(book_id)
+
+    def remove(self, book_id):
+        """Drop a book from the index."""
+        with self._lock:
+            doc = self._docs.pop(book_id, None)
+            if doc is None:
+                return
+            self._order.pop(book_id, None)
+            self._unindex(book_id, doc)
+
+    def _unindex(self, book_id, doc):
+        """Remove a document's tokens from the posting lists."""
+        grams, tokens = self._tokens(doc)
+        for gram in grams:
+            self._discard(self._grams, gram, book_id)
+        for token in tokens:
+            self._discard(self._words, token, book_id)
+            if token not in self._words:
+                self._remove_word(token)
+
+    def _build_vocabulary(self):
+        """Build the vocabulary and its trigram index from the indexed words."""
+        self._vocab = sorted(self._words)
+        self._vocab_grams = defaultdict(set)
+        for word in self._vocab:
+            for gram in field_grams(word):
+                self._vocab_grams[gram].add(word)
+
+    def _add_word(self, word):
+        """Add a newly indexed word to the vocabulary."""
+        if self._vocab is None:
+            return
+        bisect.insort(self._vocab, word)
+        for gram in field_grams(word):
+            self._vocab_grams[gram].add(word)
+
+    def _remove_word(self, word):
+        """Drop a word no book contains any more from the vocabulary."""
+        if self._vocab is None:
+            return
+        del self._vocab[bisect.bisect_left(self._vocab, word)]
+        for gram in field_grams(word):
+            self._discard(self._vocab_grams, gram, word)
+
+    @staticmethod
+    def _discard(postings, token, book_id):
+        """Remove an id from a posting list, dropping the list once empty."""
+        ids = postings.get(token)
+        if ids is None:
+            return
+        ids.discard(book_id)
+        if not ids:
+            del postings[token]
+
+    # Persistence
+
+    def dump(self, books):
+        """
+        Serialize the index, to be stored alongside a snapshot of the catalog.
+
+        Parameters:
+            books (list): The catalog the index covers; books are referred to
+                by their position in it
+
+        Returns:
+            bytes: Data for restore()
+        """
+        positions = {book['id']: row for row, book in enumerate(books)}
+
+        def rows(postings):
+            return {token: [positions[book_id] for book_id in ids]
+                    for token, ids in postings.items()}
+
+        with self._lock:
+            order = sorted(self._order, key=self._order.get)
+            data = {'order': [positions[book_id] for book_id in order],
+                    'grams': rows(self._grams), 'words': rows(self._words)}
+        return marshal.dumps(data)
+
+    def restore(self, data, books):
+        """
+        Load an index saved by dump() for the same list of books.
+
+        Returns:
+            bool: False if the data does not fit the books, in which case
+                the index is left as it was
+        """
+        try:
+            data = marshal.loads(data)
+            ids = [book['id'] for book in books]
+            if len(data['order']) != len(ids):
+                return False
+            order = {ids[row]: position for position, row in enumerate(data['order'])}
+            grams = defaultdict(set, {gram: set(map(ids.__getitem__, rows))
+                                      for gram, rows in data['grams'].items()})
+            tokens = defaultdict(set, {token: set(map(ids.__getitem__, rows))
+                                       for token, rows in data['words'].items()})
+        except (EOFError, IndexError, KeyError, TypeError, ValueError):
+            return False
+        docs = {book['id']: {field: normalize(book[field]) for field, _ in FIELD_WEIGHTS}
+                for book in books}
+
+        with self._lock:
+            self._docs, self._order, self._next_order = docs, order, len(order)
+            self._grams, self._words = grams, tokens
+            self._build_vocabulary()
+        return True
+
+    # Querying
+
+    def _candidates(self, query):
+        """Return the ids of books that may contain the query."""
+        if len(query) >= NGRAM_SIZE:
+            postings = [self._grams.get(gram) for gram in ngrams(query)]
+            if not all(postings):
+                return set()
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for ids in postings[1:]:
+                candidates &= ids
+                if not candidates:
+                    break
+            return candidates
+
+        # Queries shorter than a trigram: union the posting lists of every
+        # trigram that contains them
+        candidates = set()
+        for gram, ids in self._grams.items():
+            if query in gram:
+                candidates |= ids
+        return candidates
+
+    def _score(self, book_id, doc, query):
+        """Rate how well a document matches the query; 0 means no match."""
+        score = 0
+        for field, weight in FIELD_WEIGHTS:
+            text = doc[field]
+            if query not in text:
+                continue
+            if text == query:
+                quality = 4
+            elif book_id in self._words.get(query, ()):
+                quality = 3
+            elif text.startswith(query):
+                quality = 2
+            else:
+                quality = 1
+            score += quality * weight
+        return score
+
+    def search(self, query):
+        """
+        Find books whose title or author contains the query.
+
+        Parameters:
+            query (str): The text to look for (case-insensitive)
+
+        Returns:
+            list: Matching book ids, best matches first
+        """
+        query = normalize(query)
+        if not query:
+            return []
+
+        with self._lock:
+            scored = []
+            for book_id in self._candidates(query):
+                score = self._score(book_id, self._docs[book_id], query)
+                if score:
+                    scored.append((-score, self._order[book_id], book_id))
+
+        scored.sort()
+        return [book_id for _, _, book_id in scored]
+
+    # Prefix and fuzzy search
+
+    def _word_matches(self, term):
+        """Return {word: edits} for the indexed words within max_edits(term)."""
+        limit = max_edits(term)
+        if limit == 0:
+            return {term: 0} if term in self._words else {}
+
+        # A word within `limit` edits shares all but 3 * limit of the term's
+        # trigrams, so only words sharing enough of them are compared
+        grams = field_grams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._vocab_grams.get(gram, ()))
+        needed = max(1, len(grams) - 3 * limit)
+
+        matches = {}
+        for word, count in shared.items():
+            if count >= needed:
+                edits = edit_distance(term, word, limit)
+                if edits <= limit:
+                    matches[word] = edits
+        return matches
+
+    def _prefix_matches(self, prefix):
+        """Return {word: letters beyond the prefix} for words starting with it."""
+        start = bisect.bisect_left(self._vocab, prefix)
+        end = bisect.bisect_right(self._vocab, prefix + '\U0010ffff')
+        found = sorted(self._vocab[start:end], key=len)[:MAX_PREFIX_WORDS]
+        return {word: len(word) - len(prefix) for word in found}
+
+    def _rank(self, matches, limit):
+        """
+        Combine per-term {word: cost} matches into ranked book ids.
+
+        A book must match every term; its cost is the sum of the cheapest
+        match for each, and cheaper books rank first.
+        """
+        if not matches or not all(matches):
+            return []
+        if len(matches) == 1 and limit is not None:
+            return self._rank_one(matches[0], limit)
+        costs = None
+        # Start from the term matching the fewest books
+        matches = sorted(matches, key=lambda words: sum(
+            len(self._words[word]) for word in words))
+        for term_matches in matches:
+            term_costs = {}
+            for word, cost in term_matches.items():
+                for book_id in self._words[word]:
+                    if costs is not None and book_id not in costs:
+                        continue
+                    if cost < term_costs.get(book_id, cost + 1):
+                        term_costs[book_id] = cost
+            if costs is None:
+                costs = term_costs
+            else:
+                costs = {book_id: costs[book_id] + cost
+                         for book_id, cost in term_costs.items()}
+            if not costs:
+                return []
+
+        ranked = sorted((cost, self._order[book_id], book_id)
+                        for book_id, cost in costs.items())
+        return [book_id for _, _, book_id in ranked[:limit]]
+
+    def _rank_one(self, matches, limit):
+        """Rank the books of a single term, stopping once limit are found."""
+        ranked = []
+        seen = set()
+        for _, group in groupby(sorted(matches.items(), key=itemgetter(1)),
+                                key=itemgetter(1)):
+            if len(ranked) >= limit:
+                break
+            level = {book_id for word, _ in group for book_id in self._words[word]}
+            level -= seen
+            seen |= level
+            ranked.extend(sorted((self._order[book_id], book_id) for book_id in level))
+        return [book_id for _, book_id in ranked[:limit]]
+
+    def prefix_search(self, query, limit=None):
+        """
+        Find books containing the query's words, the last one as a prefix.
+
+        Meant for as-you-type suggestions: "great gats" finds The Great Gatsby.
+        Every word but the last must match a whole word.
+
+        Returns:
+            list: Matching book ids, closest completions first
+        """
+        terms = words(normalize(query))
+        if not terms:
+            return []
+        with self._lock:
+            matches = [{term: 0} if term in self._words else {} for term in terms[:-1]]
+            matches.append(self._prefix_matches(terms[-1]))
+            return self._rank(matches, limit)
+
+    def fuzzy_search(self, query, limit=None):
+        """
+        Find books containing every word of the query, allowing typos.
+
+        Each word may be off by max_edits() edits (e.g. "gatsbi" finds
+        "gatsby"); the last may also be an unfinished word.
+
+        Returns:
+            list: Matching book ids, fewest edits first
+        """
+        terms = words(normalize(query))
+        if not terms:
+            return []
+        with self._lock:
+            matches = [self._word_matches(term) for term in terms]
+            # The word being typed may be incomplete
+            for word, extra in self._prefix_matches(terms[-1]).items():
+                matches[-1].setdefault(word, min(extra, max_edits(terms[-1]) + 1))
+            return self._rank(matches, limit)
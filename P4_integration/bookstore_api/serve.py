@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Production Launcher
+
+Serves the bookstore API from several worker processes sharing one listening
+socket. The parent binds the socket, forks the workers and restarts any that
+die; each worker imports the app after the fork, so no storage handles or
+threads are shared between processes.
+
+The workers share the catalog through its storage (SQLite or the journaled
+JSON file). Writes are serialized across workers by the storage's lock, and
+every write bumps the storage's shared change counter, so on their next
+request the other workers apply it to their catalog, search index and
+response cache, reading just the journal entries or rows it changed.
+Writes are flushed synchronously unless BOOKSTORE_FLUSH_INTERVAL says
+otherwise, so once a write is acknowledged every worker serves it. The
+change feed (/api/books/changes) is the exception: each worker numbers its
+own log, so it is turned off with several workers, and asking for it with
+BOOKSTORE_CHANGE_FEED is refused unless --workers is 1.
+
+    python serve.py --workers 4 --port 5000 --storage sqlite:///books.db
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from profiling import TRUE_VALUES
+
+# A worker that exits sooner than this many seconds after it was started is
+# taken to be failing at startup (e.g. misconfigured) rather than crashing
+MIN_UPTIME = 5.0
+
+# Seconds to wait before restarting a worker that failed at startup; doubles
+# with each further failure in a row
+RESTART_BACKOFF = 0.5
+
+# Startup failures in a row after which the launcher gives up
+MAX_STARTUP_FAILURES = 5
+
+
+def run_worker(sock, host, port):
+    """Serve requests on an already bound socket until told to stop."""
+    from werkzeug.serving import make_server
+
+    import app as api
+
+    server = make_server(host, port, api.app, threaded=True, fd=sock.fileno())
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    except SystemExit:
+        pass
+    finally:
+        server.server_close()
+        api.store.close()
+
+
+def spawn(sock, host, port):
+    """Fork a worker process and return its pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+
+    # Don't run the parent's handlers before the worker installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 0
+    try:
+        run_worker(sock, host, port)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        # Never return into the parent's supervision loop
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(code)
+
+
+def serve(host='127.0.0.1', port=5000, workers=2):
+    """
+    Bind the listening socket and supervise the worker processes.
+
+    A worker that dies is restarted, after a growing delay if it died
+    right after starting; if MAX_STARTUP_FAILURES workers in a row do, the
+    launcher stops the others and gives up.
+
+    Parameters:
+        host (str): The address to listen on
+        port (int): The port to listen on; 0 picks a free one
+        workers (int): The number of worker processes
+
+    Returns:
+        int: The exit status, 0 when stopped by a signal and 1 on giving up
+    """
+    if not hasattr(os, 'fork'):
+        raise RuntimeError("serve.py needs os.fork(); run app.py directly instead")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    host, port = sock.getsockname()[:2]
+    print(f"Bookstore API running on http://{host}:{port} with {workers} workers",
+          flush=True)
+
+    # pid -> when the worker was started
+    children = {}
+    stopping = False
+    failures = 0
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        children[spawn(sock, host, port)] = time.monotonic()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid)
+        if stopping:
+            continue
+
+        if time.monotonic() - started >= MIN_UPTIME:
+            failures = 0
+        else:
+            failures += 1
+            if failures >= MAX_STARTUP_FAILURES:
+                print(f"Worker {pid} exited with status {status}; {failures} workers "
+                      f"in a row failed at startup, giving up", file=sys.stderr, flush=True)
+                stop(None, None)
+                continue
+        delay = RESTART_BACKOFF * 2 ** (failures - 1) if failures else 0
+        print(f"Worker {pid} exited with status {status}; restarting"
+              + (f" in {delay:g}s" if delay else ""), file=sys.stderr, flush=True)
+        time.sleep(delay)
+        if not stopping:
+            children[spawn(sock, host, port)] = time.monotonic()
+
+    sock.close()
+    return 1 if failures >= MAX_STARTUP_FAILURES else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the bookstore API with several workers.")
+    parser.add_argument('--host', default=os.environ.get('BOOKSTORE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('BOOKSTORE_PORT', 5000)))
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('BOOKSTORE_WORKERS', os.cpu_count() or 1)))
+    parser.add_argument('--storage', help="Catalog storage (sets BOOKSTORE_STORAGE)")
+    args = parser.parse_args(argv)
+
+    if args.storage:
+        os.environ['BOOKSTORE_STORAGE'] = args.storage
+    if args.workers > 1:
+        # Each worker numbers its own change log, so they can't share a feed
+        if os.environ.get('BOOKSTORE_CHANGE_FEED', 'off').lower() in TRUE_VALUES:
+            parser.error("the change feed (BOOKSTORE_CHANGE_FEED) needs --workers 1")
+        os.environ['BOOKSTORE_CHANGE_FEED'] = 'off'
+    # Write through, so a write is visible to every worker once acknowledged
+    os.environ.setdefault('BOOKSTORE_FLUSH_INTERVAL', '0')
+    return serve(args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
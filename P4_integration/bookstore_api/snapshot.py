@@ -0,0 +1,199 @@
+"""
+Columnar Snapshots
+
+A binary snapshot format for the catalog that loads without parsing. The
+file is memory-mapped and each field is a column:
+
+    id, title     string columns: character offsets (uint32) and the text
+    author        a dictionary of distinct names and a uint32 code per book
+    price         float64 values
+    in_stock      one byte per book
+    irregular     books that don't fit the columns (missing or extra fields,
+                  other types), as {row: JSON text}
+
+Numeric columns are read straight out of the mapping, and a string column
+is decoded once and sliced, so loading costs about one record per book.
+Named extra sections carry other data that belongs with this exact
+catalog, such as persisted indexes.
+
+Layout (little-endian): the magic, a uint32 format version, a uint32 book
+count and a uint32 section count, then per section a 16 byte name and its
+uint64 offset and length, then the sections themselves.
+"""
+from array import array
+import json
+import marshal
+import mmap
+import os
+import struct
+
+from records import Book, json_default
+
+MAGIC = b'BOOKSNAP'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<8sIII')
+_SECTION = struct.Struct('<16sQQ')
+
+# Prefix of the section names that hold extra data
+EXTRA_PREFIX = 'x:'
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is malformed."""
+
+
+def _regular(book):
+    """Whether a book's fields all fit the typed columns."""
+    return (len(book) == 5
+            and type(book.get('id')) is str
+            and type(book.get('title')) is str
+            and type(book.get('author')) is str
+            and type(book.get('price')) is float
+            and type(book.get('in_stock')) is bool)
+
+
+def _string_column(values):
+    """Encode strings as uint32 character offsets followed by UTF-8 text."""
+    offsets = array('I', [0])
+    total = 0
+    for value in values:
+        total += len(value)
+        offsets.append(total)
+    return offsets.tobytes() + ''.join(values).encode('utf-8', 'surrogatepass')
+
+
+def _read_strings(data, count):
+    """Decode a string column of count values."""
+    width = (count + 1) * 4
+    offsets = data[:width].cast('I').tolist()
+    text = bytes(data[width:]).decode('utf-8', 'surrogatepass')
+    return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+
+
+def encode(books, extras=None):
+    """
+    Encode a catalog as a snapshot.
+
+    Parameters:
+        books (list): Book records or dicts, in catalog order
+        extras (dict): Section name -> bytes to store alongside
+
+    Returns:
+        bytes: The snapshot
+    """
+    ids, titles, codes, prices, stock = [], [], array('I'), array('d'), bytearray()
+    authors = {}
+    irregular = {}
+    for row, book in enumerate(books):
+        if _regular(book):
+            ids.append(book['id'])
+            titles.append(book['title'])
+            codes.append(authors.setdefault(book['author'], len(authors)))
+            prices.append(book['price'])
+            stock.append(book['in_stock'])
+        else:
+            irregular[row] = json.dumps(book, default=json_default)
+            ids.append('')
+            titles.append('')
+            codes.append(authors.setdefault('', len(authors)))
+            prices.append(0.0)
+            stock.append(0)
+
+    sections = [
+        ('id', _string_column(ids)),
+        ('title', _string_column(titles)),
+        ('author', struct.pack('<I', len(authors)) + _string_column(list(authors))),
+        ('author_code', codes.tobytes()),
+        ('price', prices.tobytes()),
+        ('in_stock', bytes(stock)),
+        ('irregular', marshal.dumps(irregular)),
+    ]
+    for name, data in (extras or {}).items():
+        sections.append((EXTRA_PREFIX + name, bytes(data)))
+
+    # Sections start on 8 byte boundaries, so numeric columns are aligned
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    table, body = [], []
+    for name, data in sections:
+        padding = -offset % 8
+        offset += padding
+        table.append(_SECTION.pack(name.encode(), offset, len(data)))
+        body += [b'\0' * padding, data]
+        offset += len(data)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(ids), len(sections))
+    return b''.join([header] + table + body)
+
+
+def _sections(data):
+    """Return (book count, {name: memoryview}) for a mapped snapshot."""
+    if len(data) < _HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    magic, version, count, section_count = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("Not a book snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+
+    sections = {}
+    for i in range(section_count):
+        name, offset, length = _SECTION.unpack_from(data, _HEADER.size + i * _SECTION.size)
+        if offset + length > len(data):
+            raise SnapshotError("Snapshot is truncated")
+        sections[name.rstrip(b'\0').decode()] = data[offset:offset + length]
+    return count, sections
+
+
+def decode(data):
+    """
+    Decode a snapshot.
+
+    Parameters:
+        data: The snapshot, as bytes or a memoryview of a mapping
+
+    Returns:
+        tuple: (list of Book records, {extra name: bytes})
+
+    Raises:
+        SnapshotError: If the snapshot is malformed
+    """
+    count, sections = _sections(memoryview(data))
+    try:
+        ids = _read_strings(sections['id'], count)
+        titles = _read_strings(sections['title'], count)
+        author_count = struct.unpack_from('<I', sections['author'])[0]
+        authors = _read_strings(sections['author'][4:], author_count)
+        codes = sections['author_code'].cast('I')
+        prices = sections['price'].cast('d').tolist()
+        stock = [flag == 1 for flag in sections['in_stock']]
+        irregular = marshal.loads(sections['irregular'])
+        if not len(titles) == len(codes) == len(prices) == len(stock) == count:
+            raise ValueError("column lengths differ")
+
+        books = list(map(Book, ids, titles, map(authors.__getitem__, codes), prices, stock))
+        for row, text in irregular.items():
+            books[row] = Book.from_dict(json.loads(text))
+    except (KeyError, IndexError, TypeError, ValueError, EOFError, struct.error) as e:
+        raise SnapshotError(f"Malformed snapshot: {e}")
+
+    extras = {name[len(EXTRA_PREFIX):]: bytes(section)
+              for name, section in sections.items() if name.startswith(EXTRA_PREFIX)}
+    return books, extras
+
+
+def read(path):
+    """
+    Map a snapshot file and decode it; see decode().
+
+    The mapping is released once nothing refers to it any more.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise SnapshotError("Snapshot is empty")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return decode(memoryview(mapped))
+
+
+def write(f, books, extras=None):
+    """Write a snapshot of the catalog to an open binary file."""
+    f.write(encode(books, extras))
@@ -0,0 +1,793 @@
+"""
+Book Storage
+
+Pluggable persistence backends for the book store. A backend loads the whole
+catalog at startup and then persists batches of changes:
+
+    ('put', book)       insert or replace a book
+    ('delete', book_id) remove a book
+
+Backends that can only rewrite everything (plain JSON) do so; the journaled
+JSON backend appends each batch to a log, and row-oriented backends (SQLite)
+apply each change as a single row operation.
+
+Backends also expose a version token that changes when the data is modified
+by someone else, which the store uses to notice external edits, and a lock
+that excludes other writers of the same data, in this process or any other.
+File backends also keep a change counter in a small memory-mapped file that
+every write bumps, so stores in other processes notice a write the moment it
+is made by reading shared memory, without touching the disk. Where the
+backend can tell what was written since a given position (the journal's
+tail, or SQLite's log of changed rows), the store catches up by applying
+just those changes instead of loading everything again.
+
+The snapshot backend keeps a columnar binary snapshot (see snapshot.py)
+instead of JSON. It loads without parsing, and a checkpoint can store extra
+data alongside the catalog, such as a serialized search index.
+"""
+from contextlib import nullcontext
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+
+from records import json_default
+import snapshot as snapshot_format
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+class FileLock:
+    """
+    A reentrant lock shared by every thread and process using a lock file.
+
+    Threads in one process are excluded by an RLock; other processes by an
+    advisory flock() on the lock file, taken when the outermost holder
+    acquires it. Where flock() is unavailable only threads are excluded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                if self._file is None:
+                    directory = os.path.dirname(self.path)
+                    if directory and not os.path.exists(directory):
+                        os.makedirs(directory)
+                    self._file = open(self.path, 'a+b')
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._lock.release()
+
+    def close(self):
+        """Close the lock file."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class ChangeCounter:
+    """
+    A counter in a memory-mapped file, shared by every process mapping it.
+
+    Reads are a plain memory access. Bumps must be made while holding the
+    storage's lock, which makes the read-modify-write safe across processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _mapped(self):
+        """Map the counter file, creating it if needed."""
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    directory = os.path.dirname(self.path)
+                    if directory and not os.path.exists(directory):
+                        os.makedirs(directory)
+                    with open(self.path, 'a+b') as f:
+                        if os.fstat(f.fileno()).st_size < 8:
+                            f.truncate(8)
+                        self._map = mmap.mmap(f.fileno(), 8)
+        return self._map
+
+    def value(self):
+        """Return the current count."""
+        return struct.unpack_from('<Q', self._mapped())[0]
+
+    def bump(self):
+        """Increment the count; call with the storage's lock held."""
+        count = self.value() + 1
+        struct.pack_into('<Q', self._mapped(), 0, count)
+        return count
+
+    def close(self):
+        """Unmap the counter file."""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+
+class RejectedError(ValueError):
+    """Raised when a backend can't store some books; nothing was written."""
+
+    def __init__(self, ids):
+        super().__init__(f"Storage rejected books: {', '.join(map(str, ids))}")
+        self.ids = ids
+
+
+class Storage:
+    """Interface for persisting the book catalog."""
+
+    def load(self):
+        """Return every stored book, in catalog order."""
+        raise NotImplementedError
+
+    def save(self, books):
+        """
+        Replace the stored catalog with the given books.
+
+        Raises:
+            RejectedError: If some books can never be stored as they are
+        """
+        raise NotImplementedError
+
+    def apply(self, changes, snapshot):
+        """
+        Persist a batch of changes.
+
+        Parameters:
+            changes (list): ('put', book) and ('delete', book_id) tuples
+            snapshot (callable): Returns the full catalog, for backends
+                that (sometimes) rewrite everything
+
+        Raises:
+            RejectedError: If some books can never be stored as they are
+        """
+        self.save(snapshot())
+
+    def version(self):
+        """Return a token that changes when the data is modified externally."""
+        return None
+
+    def lock(self):
+        """
+        Return a reentrant context manager excluding other writers.
+
+        The store holds it while it checks for external changes and writes
+        its own, so two writers never work from stale copies of the data.
+        """
+        return nullcontext()
+
+    def change_count(self):
+        """Return a count of writes made through any instance, or None."""
+        return None
+
+    def position(self):
+        """
+        Return the position of the latest write, for changes_since().
+
+        Call it with the lock held, right after loading or writing.
+        """
+        return None
+
+    def changes_since(self, position):
+        """
+        Return the changes written since a position returned by position().
+
+        Returns:
+            tuple: (changes as ('put', book) and ('delete', book_id) tuples,
+                the new position), or None if they can't be told and the
+                catalog has to be loaded again
+        """
+        return None
+
+    # Whether checkpoint() stores extra data that load_extra() can return
+    stores_extras = False
+
+    def checkpoint(self, books, extras):
+        """
+        Replace the stored catalog, with extra data that belongs to it.
+
+        Parameters:
+            books (list): The whole catalog
+            extras (dict): Name -> bytes, e.g. serialized indexes of the books
+        """
+        self.save(books)
+
+    def load_extra(self, name):
+        """
+        Return extra data saved by checkpoint(), or None.
+
+        Only data that still matches the catalog last loaded is returned.
+        """
+        return None
+
+    def close(self):
+        """Release any resources held by the backend."""
+
+
+class JsonStorage(Storage):
+    """Stores the catalog as a single JSON array, rewritten on every save."""
+
+    def __init__(self, path, default_books=None):
+        self.path = path
+        self.default_books = default_books or []
+        self._lock = FileLock(f"{path}.lock")
+        self._changes = ChangeCounter(f"{path}.changes")
+
+    def lock(self):
+        """Return the lock on ``<path>.lock``."""
+        return self._lock
+
+    def change_count(self):
+        """Return the count in ``<path>.changes``."""
+        return self._changes.value()
+
+    def close(self):
+        """Close the lock and change counter files."""
+        self._lock.close()
+        self._changes.close()
+
+    def version(self):
+        """Return the file's modification time, or None if missing."""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """Read the catalog from disk, seeding it with defaults if missing."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                books = [dict(book) for book in self.default_books]
+                self.save(books)
+                return books
+            return self._read()
+
+    def _read(self):
+        """Read the catalog from the data file."""
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _write(self, f, books):
+        """Write the catalog to a new data file, opened for writing."""
+        json.dump(books, f, indent=2, default=json_default)
+
+    # Mode the data file is opened in, 't' or 'b'
+    file_mode = 't'
+
+    def save(self, books):
+        """Atomically replace the data file with the given catalog."""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with self._lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w' + self.file_mode) as f:
+                self._write(f, books)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._changes.bump()
+
+
+class JournalStorage(JsonStorage):
+    """
+    A JSON snapshot plus an append-only journal of changes.
+
+    Each batch of changes is appended to ``<path>.log`` as one JSON line per
+    change and fsync'd, so a write costs one small append instead of a full
+    rewrite. Once the journal holds ``compact_every`` changes it is compacted
+    into a new snapshot, as it also is when first loaded. Loading reads the
+    snapshot and replays the journal; since replaying a put or delete twice
+    has no further effect, a crash at any point (even between writing a
+    snapshot and truncating the journal) leaves a consistent catalog.
+    """
+
+    def __init__(self, path, default_books=None, compact_every=1000):
+        super().__init__(path, default_books)
+        self.log_path = f"{path}.log"
+        self.compact_every = compact_every
+        self._log_entries = 0
+        self._loaded = False
+
+    def version(self):
+        """Return the snapshot's modification time and the journal's size."""
+        try:
+            log_size = os.stat(self.log_path).st_size
+        except FileNotFoundError:
+            log_size = 0
+        return (super().version(), log_size)
+
+    @staticmethod
+    def _read_entries(f):
+        """Read journal entries from a file up to a torn final line.
+
+        Returns:
+            tuple: (entries, number of bytes they take up)
+        """
+        entries = []
+        valid_bytes = 0
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Only the last append can be incomplete; ignore it
+                break
+            if not line.endswith(b'\n'):
+                break
+            entries.append(entry)
+            valid_bytes += len(line)
+        return entries, valid_bytes
+
+    def _read_log(self):
+        """Return the journaled changes, dropping a torn final line."""
+        if not os.path.exists(self.log_path):
+            return []
+
+        with open(self.log_path, 'rb') as f:
+            changes, valid_bytes = self._read_entries(f)
+
+        if valid_bytes != os.path.getsize(self.log_path):
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+        return changes
+
+    def position(self):
+        """Return the snapshot's modification time and the journal's size."""
+        return self.version()
+
+    def changes_since(self, position):
+        """
+        Replay the journal past a position.
+
+        Returns None once the journal has been compacted into a new snapshot
+        since, as the changes in between are no longer in it.
+        """
+        snapshot_version, offset = position
+        with self._lock:
+            if JsonStorage.version(self) != snapshot_version:
+                return None
+            try:
+                with open(self.log_path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size < offset:
+                        return None
+                    f.seek(offset)
+                    entries, valid_bytes = self._read_entries(f)
+            except FileNotFoundError:
+                return None if offset else ([], position)
+            self._log_entries += len(entries)
+
+        changes = [('put', entry['book']) if entry['op'] == 'put' else ('delete', entry['id'])
+                   for entry in entries]
+        return changes, (snapshot_version, offset + valid_bytes)
+
+    def load(self):
+        """
+        Read the snapshot and replay the journal on top of it.
+
+        The journal is compacted on the first load (at startup) or once it
+        is long; otherwise reloading leaves the files alone, so stores in
+        other processes following the journal don't have to reload too.
+        """
+        with self._lock:
+            books = {book['id']: book for book in super().load()}
+            changes = self._read_log()
+            for entry in changes:
+                if entry['op'] == 'put':
+                    books[entry['book']['id']] = entry['book']
+                else:
+                    books.pop(entry['id'], None)
+
+            books = list(books.values())
+            self._log_entries = len(changes)
+            if changes and (not self._loaded or self._log_entries >= self.compact_every):
+                self.save(books)
+            self._loaded = True
+            return books
+
+    def save(self, books):
+        """Write a new snapshot and empty the journal."""
+        with self._lock:
+            super().save(books)
+            with open(self.log_path, 'w'):
+                pass
+            self._log_entries = 0
+
+    def apply(self, changes, snapshot):
+        """Append the changes to the journal, compacting when it is long."""
+        lines = []
+        for op, value in changes:
+            if op == 'put':
+                lines.append(json.dumps({'op': 'put', 'book': value},
+                                        default=json_default))
+            else:
+                lines.append(json.dumps({'op': 'delete', 'id': value}))
+
+        with self._lock:
+            with open(self.log_path, 'a') as f:
+                f.write(''.join(line + '\n' for line in lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_entries += len(lines)
+            self._changes.bump()
+
+            if self._log_entries >= self.compact_every:
+                self.save(snapshot())
+
+
+class SnapshotStorage(JournalStorage):
+    """
+    A columnar binary snapshot plus the append-only journal of changes.
+
+    Works like JournalStorage, with snapshot.py's format in place of JSON.
+    Extra data given to checkpoint() is written into the snapshot itself, so
+    it always describes exactly the books stored with it; once the journal
+    has changes on top, or the snapshot is compacted without it, it is no
+    longer returned.
+    """
+
+    file_mode = 'b'
+    stores_extras = True
+
+    def __init__(self, path, default_books=None, compact_every=1000):
+        super().__init__(path, default_books, compact_every)
+        # Extra data of the snapshot file as last read or written
+        self._extras = {}
+        self._writing_extras = {}
+
+    def _read(self):
+        """Map and decode the snapshot, keeping its extra data."""
+        books, self._extras = snapshot_format.read(self.path)
+        return books
+
+    def _write(self, f, books):
+        """Write a snapshot with the extra data being checkpointed, if any."""
+        snapshot_format.write(f, books, self._writing_extras)
+        self._extras = dict(self._writing_extras)
+
+    def load(self):
+        """Read the snapshot and replay the journal on top of it."""
+        with self._lock:
+            self._extras = {}
+            books = super().load()
+            if self._log_entries:
+                # The saved extra data describes the books before the journal
+                self._extras = {}
+            return books
+
+    def checkpoint(self, books, extras):
+        """Write a new snapshot holding the extra data, and empty the journal."""
+        with self._lock:
+            self._writing_extras = extras
+            try:
+                self.save(books)
+            finally:
+                self._writing_extras = {}
+
+    def apply(self, changes, snapshot):
+        """Journal the changes; the saved extra data no longer applies."""
+        with self._lock:
+            self._extras = {}
+            super().apply(changes, snapshot)
+
+    def changes_since(self, position):
+        """Replay the journal past a position; the saved extra data no longer applies."""
+        with self._lock:
+            result = super().changes_since(position)
+            if result is not None and result[0]:
+                self._extras = {}
+            return result
+
+    def load_extra(self, name):
+        """Return extra data saved with the snapshot, unless changes followed it."""
+        with self._lock:
+            return self._extras.get(name)
+
+
+class SqliteStorage(Storage):
+    """
+    Stores one row per book in SQLite.
+
+    The database runs in WAL mode so readers in other processes are not
+    blocked by writes, and has indexes on id, author and title. Triggers log
+    the id of every changed row, so other processes can catch up by reading
+    just those rows; the log is trimmed to the most recent ``KEEP_CHANGES``
+    entries, and a full save() replaces it with a single entry with no id,
+    meaning everything changed.
+    """
+
+    # Changed-row log entries kept for other processes catching up
+    KEEP_CHANGES = 10000
+
+    # PRAGMA user_version once the database has been seeded
+    SEEDED = 1
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS books (
+            seq INTEGER PRIMARY KEY,
+            id TEXT NOT NULL UNIQUE,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            price REAL NOT NULL,
+            in_stock INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS books_author ON books (author);
+        CREATE INDEX IF NOT EXISTS books_title ON books (title);
+        CREATE TABLE IF NOT EXISTS book_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT
+        );
+        CREATE TRIGGER IF NOT EXISTS book_changes_insert AFTER INSERT ON books BEGIN
+            INSERT INTO book_changes (id) VALUES (new.id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS book_changes_delete AFTER DELETE ON books BEGIN
+            INSERT INTO book_changes (id) VALUES (old.id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS book_changes_update AFTER UPDATE ON books BEGIN
+            INSERT INTO book_changes (id) VALUES (old.id);
+        END;
+    """
+
+    UPSERT = """
+        INSERT INTO books (id, title, author, price, in_stock)
+        VALUES (:id, :title, :author, :price, :in_stock)
+        ON CONFLICT (id) DO UPDATE SET
+            title = excluded.title,
+            author = excluded.author,
+            price = excluded.price,
+            in_stock = excluded.in_stock
+    """
+
+    def __init__(self, path, default_books=None):
+        self.path = path
+        self.default_books = default_books or []
+        self._lock = threading.Lock()
+        self._write_lock = FileLock(f"{path}.lock")
+        self._changes = ChangeCounter(f"{path}.changes")
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+
+    @staticmethod
+    def _row(book):
+        """
+        Convert a book record or dict to query parameters.
+
+        Raises:
+            TypeError, ValueError: If the book doesn't fit the schema
+        """
+        if not all(isinstance(book[field], str) for field in ('id', 'title', 'author')):
+            raise TypeError("id, title and author must be strings")
+        return {
+            'id': book['id'],
+            'title': book['title'],
+            'author': book['author'],
+            'price': float(book['price']),
+            'in_stock': 1 if book.get('in_stock', True) else 0,
+        }
+
+    @staticmethod
+    def _book(row):
+        """Convert a result row to a book dict."""
+        book_id, title, author, price, in_stock = row
+        return {'id': book_id, 'title': title, 'author': author,
+                'price': price, 'in_stock': bool(in_stock)}
+
+    def lock(self):
+        """Return the lock on ``<path>.lock``."""
+        return self._write_lock
+
+    def change_count(self):
+        """Return the count in ``<path>.changes``."""
+        return self._changes.value()
+
+    def version(self):
+        """Return SQLite's data version, which changes on external commits."""
+        with self._lock:
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def _seed(self):
+        """
+        Seed a newly created database with the default books, once.
+
+        PRAGMA user_version records that the database was set up, so a
+        catalog whose books were all deleted stays empty.
+        """
+        # Another process may be seeding it at the same time
+        with self._write_lock:
+            with self._lock:
+                if self._conn.execute('PRAGMA user_version').fetchone()[0] >= self.SEEDED:
+                    return
+                empty = self._conn.execute('SELECT 1 FROM books LIMIT 1').fetchone() is None
+            if empty and self.default_books:
+                self.save([dict(book) for book in self.default_books])
+            with self._lock:
+                self._conn.execute(f'PRAGMA user_version = {self.SEEDED}')
+
+    def load(self):
+        """Read every book, seeding a new database with defaults."""
+        with self._lock:
+            seeded = self._conn.execute('PRAGMA user_version').fetchone()[0] >= self.SEEDED
+        if not seeded:
+            self._seed()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, title, author, price, in_stock FROM books ORDER BY seq'
+            ).fetchall()
+        return [self._book(row) for row in rows]
+
+    def _transaction(self, statements):
+        """Run (sql, params) statements in a single transaction."""
+        with self._write_lock, self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+            self._changes.bump()
+
+    def _rows(self, books):
+        """Convert books to query parameters, rejecting any that don't fit."""
+        rows, rejected = [], []
+        for book in books:
+            try:
+                rows.append(self._row(book))
+            except (TypeError, ValueError):
+                rejected.append(book['id'])
+        if rejected:
+            raise RejectedError(rejected)
+        return rows
+
+    def save(self, books):
+        """Replace every row with the given books."""
+        statements = [('DELETE FROM books', ())]
+        statements += [(self.UPSERT, row) for row in self._rows(books)]
+        # Every row changed; one entry says so instead of one per row
+        statements += [('DELETE FROM book_changes', ()),
+                       ('INSERT INTO book_changes (id) VALUES (NULL)', ())]
+        self._transaction(statements)
+
+    def apply(self, changes, snapshot):
+        """Apply each change as a single row upsert or delete."""
+        rows = iter(self._rows([value for op, value in changes if op == 'put']))
+        statements = []
+        for op, value in changes:
+            if op == 'put':
+                statements.append((self.UPSERT, next(rows)))
+            else:
+                statements.append(('DELETE FROM books WHERE id = ?', (value,)))
+        statements.append(('DELETE FROM book_changes WHERE seq <= '
+                           '(SELECT MAX(seq) FROM book_changes) - ?', (self.KEEP_CHANGES,)))
+        self._transaction(statements)
+
+    def position(self):
+        """Return the sequence number of the latest changed-row log entry."""
+        with self._lock:
+            return self._conn.execute('SELECT MAX(seq) FROM book_changes').fetchone()[0] or 0
+
+    def changes_since(self, position):
+        """
+        Read the rows changed since a position.
+
+        Returns None if the log no longer goes back that far, or the table
+        was rewritten since.
+        """
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                first, last = self._conn.execute(
+                    'SELECT MIN(seq), MAX(seq) FROM book_changes'
+                ).fetchone()
+                if (last or 0) == position:
+                    return [], position
+                # Entries after the position were trimmed, or the log is new
+                if last is None or last < position or first > position + 1:
+                    return None
+                ids = [row[0] for row in self._conn.execute(
+                    'SELECT DISTINCT id FROM book_changes WHERE seq > ?', (position,)
+                )]
+                if None in ids:
+                    return None
+                rows = {}
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    rows.update((row[0], row) for row in self._conn.execute(
+                        'SELECT id, title, author, price, in_stock FROM books '
+                        f"WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                    ))
+            finally:
+                self._conn.execute('COMMIT')
+
+        changes = [('put', self._book(rows[book_id])) if book_id in rows else ('delete', book_id)
+                   for book_id in ids]
+        return changes, last
+
+    def close(self):
+        """Close the database connection, lock and change counter files."""
+        with self._lock:
+            self._conn.close()
+        self._write_lock.close()
+        self._changes.close()
+
+
+def open_storage(location, default_books=None):
+    """
+    Open a storage backend from a location string.
+
+    Parameters:
+        location (str): 'sqlite:///path/to/books.db', a path ending in
+            .db/.sqlite/.sqlite3, a path ending in .snap for a columnar
+            snapshot, or a path to a JSON snapshot (all journaled)
+        default_books (list): Books to seed a new, empty catalog with
+
+    Returns:
+        Storage: The backend
+    """
+    if location.startswith('sqlite:///'):
+        return SqliteStorage(location[len('sqlite:///'):], default_books)
+    if location.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SqliteStorage(location, default_books)
+    if location.endswith('.snap'):
+        return SnapshotStorage(location, default_books)
+    return JournalStorage(location, default_books)
+
+
+def copy_catalog(source, target):
+    """Copy every book from one storage location to another."""
+    source_storage = open_storage(source)
+    target_storage = open_storage(target)
+    try:
+        books = source_storage.load()
+        target_storage.save(books)
+        return len(books)
+    finally:
+        source_storage.close()
+        target_storage.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python storage.py <source> <target>")
+        print("Example: python storage.py books.json sqlite:///books.db")
+        print("         python storage.py books.json books.snap")
+        sys.exit(1)
+    count = copy_catalog(sys.argv[1], sys.argv[2])
+    print(f"Copied {count} books from {sys.argv[1]} to {sys.argv[2]}")
@@ -0,0 +1,659 @@
+"""
+Book Store
+
+A resident, in-memory repository for the bookstore catalog. The catalog is
+loaded from storage once, reads are served from memory and writes are
+persisted by a background flusher. If the stored data is changed by someone
+else it is picked up again on the next read.
+
+Writes are tracked as pending per-book changes, so row-oriented storage
+backends (see storage.py) persist only what changed.
+
+Books are kept as compact Book records (see records.py) in a dict keyed by
+ID; books given to the store as dicts are converted on the way in. Dicts
+preserve insertion order, so the same structure serves as both the ordered
+catalog and an O(1) ID index. A sorted list of IDs is kept alongside for
+keyset pagination.
+
+Every change bumps a catalog version number, and each book remembers the
+version and time of its last change, so callers can tell cheaply whether a
+copy they handed out earlier is still current (e.g. for HTTP ETags).
+
+Other structures that follow the catalog (such as the search index) register
+a listener, which is called as ``listener(event, books)`` after every change:
+``event`` is 'add', 'update' or 'delete' with the affected books, or 'reload'
+with the whole catalog. Indexes registered with add_index() are also saved
+with the catalog by checkpoint(), where the storage can hold them, and are
+restored from storage on load rather than rebuilt.
+
+Writers hold a write lock and the storage's lock (which also excludes other
+processes), and catch up with changes made elsewhere before making their
+own, so concurrent writers never work from a stale copy. Readers take
+neither. Where the storage keeps a shared change counter, a write made by
+another process is noticed on the next read, however long the reload
+interval; otherwise it is picked up by the periodic check. Where the storage
+can tell what was written since (see Storage.changes_since()), just those
+changes are applied; otherwise the catalog is loaded again. Books are
+replaced rather than modified in place, so a reader always sees a whole
+version of a book. Conditional writes compare a content fingerprint of the
+book, which is the same in every process.
+"""
+import bisect
+from contextlib import contextmanager
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+
+from records import Book, json_default
+from storage import JournalStorage, RejectedError, Storage
+
+logger = logging.getLogger(__name__)
+
+
+class ConflictError(Exception):
+    """Raised when a conditional write finds the book has changed."""
+
+
+class DuplicateIdError(Exception):
+    """Raised when adding a book whose ID is already taken."""
+
+
+def fingerprint(book):
+    """Return a short hash of a book's content, the same in every process."""
+    raw = json.dumps(book, sort_keys=True, separators=(',', ':'),
+                     default=json_default).encode()
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+class BookStore:
+    """In-memory book catalog with write-behind persistence."""
+
+    def __init__(self, storage, default_books=None, flush_interval=0.5,
+                 reload_interval=1.0):
+        """
+        Create a store on top of a storage backend.
+
+        Parameters:
+            storage (Storage|str): The backend, or the path of a journaled
+                JSON snapshot
+            default_books (list): Books to seed a JSON snapshot with if it
+                is missing (only used when storage is a path)
+            flush_interval (float): Seconds to coalesce writes before they are
+                flushed to storage; 0 writes through synchronously
+            reload_interval (float): Minimum seconds between checks of the
+                storage for external changes
+        """
+        if not isinstance(storage, Storage):
+            storage = JournalStorage(storage, default_books)
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.reload_interval = reload_interval
+
+        self._books = None
+        self._sorted_ids = []
+        self._lock = threading.RLock()
+        # Held by writers and flushes (with the storage lock); never by readers
+        self._write_lock = threading.RLock()
+        # book id -> ('put', book) or ('delete', book_id), last write wins
+        self._pending = {}
+        self._rewrite = False
+        self._batch_depth = 0
+        self._storage_version = None
+        self._change_count = None
+        # Where in storage to catch up from, see Storage.changes_since()
+        self._position = None
+        # The catalog version that matches what storage holds at _position
+        self._stored_version = None
+        self._last_check = 0.0
+
+        self._listeners = []
+        # name -> index saved with the catalog on checkpoint
+        self._indexes = {}
+
+        # Versions are only comparable within one store instance; the epoch
+        # tells instances (and process restarts) apart
+        self.epoch = uuid.uuid4().hex[:8]
+        self._state = (0, time.time())
+        self._loaded_state = self._state
+        # book id -> (version, modified time) of the book's last change
+        self._book_states = {}
+
+        self._flush_requested = threading.Event()
+        self._flusher = None
+        self._closed = False
+
+    # Listeners
+
+    def add_listener(self, listener):
+        """Register a callable to be notified of catalog changes."""
+        with self._lock:
+            self._listeners.append(listener)
+            if self._books is not None:
+                listener('reload', list(self._books.values()))
+
+    def add_index(self, name, index):
+        """
+        Register an index that follows the catalog and is saved with it.
+
+        The index's on_change() is added as a listener. It must also have
+        dump(books), returning bytes, and restore(data, books), returning
+        whether the data could be used.
+        """
+        with self._lock:
+            self._indexes[name] = index
+        self.add_listener(index.on_change)
+
+    def _restore_indexes(self, books):
+        """Restore indexes saved with the stored catalog; returns their listeners."""
+        restored = set()
+        for name, index in self._indexes.items():
+            data = self.storage.load_extra(name)
+            if data is not None and index.restore(data, books):
+                restored.add(index.on_change)
+        return restored
+
+    def _notify(self, event, books, skip=()):
+        """Record a new catalog version and tell every listener about it."""
+        version = self._state[0] + 1
+        self._state = (version, time.time())
+        if event == 'reload':
+            self._loaded_state = self._state
+            self._book_states = {}
+        elif event == 'delete':
+            for book in books:
+                self._book_states.pop(book.id, None)
+        else:
+            for book in books:
+                self._book_states[book.id] = self._state
+
+        # The change is already made (and queued for storage); a failing
+        # listener must not keep the others from hearing about it
+        for listener in self._listeners:
+            if listener not in skip:
+                try:
+                    listener(event, books)
+                except Exception:
+                    logger.exception("Book store listener %r failed on %s", listener, event)
+
+    # Versions
+
+    def catalog_state(self):
+        """Return (version, modified time) of the catalog as a whole."""
+        self._ensure_fresh()
+        return self._state
+
+    def book_state(self, book_id):
+        """Return (version, modified time) of a book's last change."""
+        self._ensure_fresh()
+        return self._book_states.get(book_id, self._loaded_state)
+
+    def catalog_tag(self, version=None):
+        """
+        Return a tag for a version of the catalog's content, e.g. for ETags.
+
+        Once the version is stored, the tag is derived from where storage
+        is, so every process serving the same stored catalog gives the same
+        tag. Until then it is this store's epoch and the version.
+
+        Parameters:
+            version (int): A version from catalog_state(); the current one
+                if not given
+        """
+        if version is None:
+            version = self.catalog_state()[0]
+        with self._lock:
+            if version != self._stored_version:
+                return f"{self.epoch}-{version}"
+            where = self._position if self._position is not None else self._storage_version
+            raw = repr((getattr(self.storage, 'path', None), self._change_count, where))
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    # Loading
+
+    @property
+    def _dirty(self):
+        """Whether there are writes that have not been flushed yet."""
+        return self._rewrite or bool(self._pending)
+
+    @staticmethod
+    def _index(books):
+        """Build the ID -> record index for a list of books."""
+        records = (Book.from_dict(book) for book in books)
+        return {book.id: book for book in records}
+
+    def load(self):
+        """(Re)load the catalog from storage, keeping writes not flushed yet."""
+        with self.storage.lock(), self._lock:
+            books = self._index(self.storage.load())
+            # Saved indexes describe the stored books, without local writes
+            restored = () if self._pending else self._restore_indexes(list(books.values()))
+            # Unflushed local writes are newer than anything stored
+            for book_id, (op, value) in self._pending.items():
+                if op == 'put':
+                    books[book_id] = value
+                else:
+                    books.pop(book_id, None)
+            self._books = books
+            self._sorted_ids = sorted(self._books)
+            self._rewrite = False
+            self._last_check = time.monotonic()
+            self._notify('reload', list(self._books.values()), skip=restored)
+            self._mark_stored(None if self._pending else self._state[0])
+
+    def _replay(self):
+        """
+        Apply the changes written to storage elsewhere since we last looked.
+
+        Listeners hear about them as ordinary adds, updates and deletes, so
+        a write by another process costs in proportion to its size rather
+        than the catalog's. Returns False if storage can't tell what
+        changed, and the catalog has to be loaded again.
+        """
+        if self._position is None:
+            return False
+        result = self.storage.changes_since(self._position)
+        if result is None:
+            return False
+        changes, self._position = result
+
+        # Last change per book wins; unflushed local writes are newer still
+        latest = {}
+        for op, value in changes:
+            book_id = value['id'] if op == 'put' else value
+            if book_id not in self._pending:
+                latest[book_id] = (op, value)
+
+        events = {'add': [], 'update': [], 'delete': []}
+        for book_id, (op, value) in latest.items():
+            current = self._books.get(book_id)
+            if op == 'put':
+                book = Book.from_dict(value)
+                if current is None:
+                    bisect.insort(self._sorted_ids, book_id)
+                    events['add'].append(book)
+                elif current != book:
+                    events['update'].append(book)
+                else:
+                    continue
+                self._books[book_id] = book
+            elif current is not None:
+                del self._books[book_id]
+                del self._sorted_ids[bisect.bisect_left(self._sorted_ids, book_id)]
+                events['delete'].append(current)
+
+        self._storage_version = self.storage.version()
+        self._change_count = self.storage.change_count()
+        self._last_check = time.monotonic()
+        for event, books in events.items():
+            if books:
+                self._notify(event, books)
+        if not self._dirty:
+            self._stored_version = self._state[0]
+        return True
+
+    def _mark_stored(self, version):
+        """
+        Record where storage is now, after loading or writing.
+
+        Parameters:
+            version (int): The catalog version storage now holds, or None
+                if it holds none of them (there are unflushed writes)
+        """
+        self._storage_version = self.storage.version()
+        self._change_count = self.storage.change_count()
+        self._position = self.storage.position()
+        self._stored_version = version
+
+    def _changed_elsewhere(self):
+        """Whether storage has been written since we last loaded or flushed."""
+        return (self.storage.change_count() != self._change_count
+                or self.storage.version() != self._storage_version)
+
+    def _catch_up(self):
+        """Load the catalog, or catch up with changes made to storage elsewhere."""
+        if self._books is None:
+            self.load()
+        elif not self._rewrite and self._changed_elsewhere():
+            # A pending replace() overwrites any external edit anyway
+            if not self._replay():
+                self.load()
+
+    def _ensure_fresh(self):
+        """Load the catalog on first use and pick up external changes."""
+        if self._books is None:
+            with self.storage.lock(), self._lock:
+                self._catch_up()
+            return
+
+        # Another process's write shows up in the shared counter at once
+        if self.storage.change_count() == self._change_count:
+            now = time.monotonic()
+            if now - self._last_check < self.reload_interval:
+                return
+            self._last_check = now
+            if self.storage.version() == self._storage_version:
+                return
+
+        with self.storage.lock(), self._lock:
+            self._catch_up()
+
+    def refresh_due(self):
+        """Whether the next read may have to touch storage to stay fresh."""
+        return (self._books is None
+                or self.storage.change_count() != self._change_count
+                or time.monotonic() - self._last_check >= self.reload_interval)
+
+    def refresh(self):
+        """Make sure the in-memory catalog is loaded and current."""
+        self._ensure_fresh()
+
+    # Reads
+
+    def all(self):
+        """Return a list of every book in the catalog."""
+        self._ensure_fresh()
+        return list(self._books.values())
+
+    def get(self, book_id):
+        """Return the book with the given ID, or None if it does not exist."""
+        self._ensure_fresh()
+        return self._books.get(book_id)
+
+    def page(self, after=None, limit=None):
+        """
+        Return a page of books in ID order, for keyset pagination.
+
+        Parameters:
+            after (str): Only return books whose ID sorts after this one
+            limit (int): The maximum number of books to return
+
+        Returns:
+            tuple: (books, more) where more is True if books follow the page
+        """
+        self._ensure_fresh()
+        with self._lock:
+            start = 0 if after is None else bisect.bisect_right(self._sorted_ids, after)
+            end = len(self._sorted_ids) if limit is None else start + limit
+            books = [self._books[book_id] for book_id in self._sorted_ids[start:end]]
+            more = end < len(self._sorted_ids)
+        return books, more
+
+    def iter_sorted(self, after=None, chunk_size=1000):
+        """
+        Iterate over books in ID order, a page at a time.
+
+        Holds no lock between pages and never copies the whole catalog, so it
+        is suitable for streaming exports of any size.
+        """
+        while True:
+            books, more = self.page(after, chunk_size)
+            yield from books
+            if not more or not books:
+                return
+            after = books[-1].id
+
+    def __len__(self):
+        self._ensure_fresh()
+        return len(self._books)
+
+    # Writes
+
+    @contextmanager
+    def _writing(self):
+        """
+        Exclude other writers, here and in other processes, for one write.
+
+        The catalog is caught up with changes made elsewhere first, and the
+        write is scheduled to be flushed afterwards unless in a batch.
+        """
+        with self._write_lock, self.storage.lock():
+            with self._lock:
+                self._catch_up()
+            try:
+                yield
+            finally:
+                if self._batch_depth == 0 and self._dirty:
+                    self._schedule_flush()
+
+    @staticmethod
+    def _check(book, if_match):
+        """Raise ConflictError unless the book's fingerprint is in if_match."""
+        if if_match is not None and fingerprint(book) not in if_match:
+            raise ConflictError(f"Book {book.id} has been changed")
+
+    def add(self, book):
+        """
+        Add a new book (a record or a dict) and return its record.
+
+        Raises:
+            DuplicateIdError: If a book with the same ID already exists
+        """
+        book = Book.from_dict(book)
+        with self._writing(), self._lock:
+            if book.id in self._books:
+                raise DuplicateIdError(f"Book {book.id} already exists")
+            bisect.insort(self._sorted_ids, book.id)
+            self._books[book.id] = book
+            self._pending[book.id] = ('put', book)
+            self._notify('add', [book])
+        return book
+
+    def update(self, book_id, changes, if_match=None):
+        """
+        Apply field changes to an existing book.
+
+        Parameters:
+            book_id (str): The book to change
+            changes (dict): The fields to set
+            if_match: If given, fingerprints the book must currently have
+
+        Returns:
+            dict: The updated book, or None if it does not exist
+
+        Raises:
+            ConflictError: If the book does not match if_match
+        """
+        with self._writing(), self._lock:
+            book = self._books.get(book_id)
+            if book is None:
+                return None
+            self._check(book, if_match)
+            book = book.replace(**changes)
+            self._books[book_id] = book
+            self._pending[book_id] = ('put', book)
+            self._notify('update', [book])
+        return book
+
+    def delete(self, book_id, if_match=None):
+        """
+        Remove a book from the catalog.
+
+        Returns:
+            dict: The removed book, or None if it does not exist
+
+        Raises:
+            ConflictError: If the book does not match if_match
+        """
+        with self._writing(), self._lock:
+            book = self._books.get(book_id)
+            if book is None:
+                return None
+            self._check(book, if_match)
+            del self._books[book_id]
+            del self._sorted_ids[bisect.bisect_left(self._sorted_ids, book_id)]
+            self._pending[book_id] = ('delete', book_id)
+            self._notify('delete', [book])
+        return book
+
+    def replace(self, books):
+        """Replace the whole catalog."""
+        with self._writing(), self._lock:
+            self._books = self._index(books)
+            self._sorted_ids = sorted(self._books)
+            self._last_check = time.monotonic()
+            self._pending.clear()
+            self._rewrite = True
+            self._notify('reload', list(self._books.values()))
+
+    @contextmanager
+    def batch(self):
+        """
+        Group several writes so they are persisted in a single flush.
+
+        Other writers wait until the batch is finished; readers do not.
+        """
+        with self._writing():
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+
+    # Flushing
+
+    def _schedule_flush(self):
+        """Flush now when writing through, otherwise wake the flusher."""
+        if self.flush_interval <= 0:
+            self.flush()
+            return
+
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name='bookstore-flusher', daemon=True
+            )
+            self._flusher.start()
+        self._flush_requested.set()
+
+    def _flush_loop(self):
+        """Background thread that coalesces and persists pending writes."""
+        while not self._closed:
+            self._flush_requested.wait()
+            if self._closed:
+                break
+            # Give further writes a chance to land in the same flush
+            time.sleep(self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+    def _snapshot(self):
+        """Return a list of every book, taken under the lock."""
+        with self._lock:
+            return list(self._books.values())
+
+    def flush(self):
+        """
+        Write pending changes to storage immediately.
+
+        The catalog lock is only held while the pending changes are taken,
+        not during storage I/O, so reads carry on meanwhile.
+        """
+        if not self._dirty:
+            return
+        with self._write_lock, self.storage.lock():
+            with self._lock:
+                self._catch_up()
+                if not self._dirty:
+                    return
+                rewrite = self._rewrite
+                pending = self._pending
+                self._pending = {}
+                self._rewrite = False
+                books = list(self._books.values()) if rewrite else None
+                version = self._state[0]
+
+            try:
+                rejected = self._write(pending, books)
+            except BaseException:
+                self._put_back(pending, rewrite)
+                raise
+            with self._lock:
+                self._mark_stored(version)
+            if rejected:
+                # Serve what was stored rather than what was dropped
+                self.load()
+
+    def _write(self, pending, books=None):
+        """
+        Persist pending changes, or the whole catalog if books is given.
+
+        Books the storage rejects would fail every later flush too, so they
+        are logged and left out. Returns the IDs of those books.
+        """
+        rejected = set()
+        while True:
+            try:
+                if books is not None:
+                    self.storage.save(books)
+                else:
+                    self.storage.apply(list(pending.values()), self._snapshot)
+                return rejected
+            except RejectedError as e:
+                if rejected.issuperset(e.ids):
+                    raise
+                logger.error("Dropping changes storage can't hold: %s", e)
+                rejected.update(e.ids)
+                for book_id in e.ids:
+                    pending.pop(book_id, None)
+                if books is not None:
+                    books = [book for book in books if book.id not in rejected]
+
+    def _put_back(self, pending, rewrite):
+        """Restore changes whose write failed, behind any made in the meantime."""
+        with self._lock:
+            self._rewrite = self._rewrite or rewrite
+            for book_id, change in pending.items():
+                self._pending.setdefault(book_id, change)
+
+    def checkpoint(self):
+        """
+        Write the whole catalog to storage along with the saved indexes.
+
+        Pending writes are persisted too. Where the storage can't hold the
+        indexes, this is the same as flush().
+        """
+        if not self.storage.stores_extras:
+            self.flush()
+            return
+        with self._write_lock, self.storage.lock():
+            with self._lock:
+                self._catch_up()
+                books = list(self._books.values())
+                # Listeners run under this lock, so the indexes match the books
+                extras = {name: index.dump(books) for name, index in self._indexes.items()}
+                pending, rewrite = self._pending, self._rewrite
+                self._pending = {}
+                self._rewrite = False
+                version = self._state[0]
+
+            try:
+                self.storage.checkpoint(books, extras)
+            except BaseException:
+                self._put_back(pending, rewrite)
+                raise
+            with self._lock:
+                self._mark_stored(version)
+
+    def _checkpoint_due(self):
+        """Whether the stored catalog or its saved indexes are out of date."""
+        if self._books is None or not self.storage.stores_extras:
+            return False
+        with self.storage.lock(), self._lock:
+            self._catch_up()
+            return self._dirty or any(self.storage.load_extra(name) is None
+                                      for name in self._indexes)
+
+    def close(self):
+        """Persist pending changes and stop the background flusher."""
+        self._closed = True
+        self._flush_requested.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        if self._checkpoint_due():
+            self.checkpoint()
+        else:
+            self.flush()
+        self.storage.close()
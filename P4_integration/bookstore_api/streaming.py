@@ -0,0 +1,80 @@
+"""
+Streaming Responses
+
+Generators that serialize a sequence of records incrementally, either as a
+JSON array or as newline-delimited JSON (NDJSON). The response body is never
+built in full, so memory stays flat and the first bytes go out straight away
+however large the listing is.
+"""
+
+NDJSON = 'application/x-ndjson'
+JSON = 'application/json'
+
+MIMETYPES = {'ndjson': NDJSON, 'json': JSON}
+
+# Records serialized per chunk written to the socket
+CHUNK_SIZE = 100
+
+
+def stream_format(value, accept_mimetypes=None):
+    """
+    Work out which streaming format a request asked for.
+
+    Parameters:
+        value (str): The ?stream= parameter: 'ndjson', 'json' or '1'
+        accept_mimetypes: The request's Accept header, so clients can ask
+            for application/x-ndjson without a query parameter
+
+    Returns:
+        str: 'ndjson', 'json', or None for a regular response
+
+    Raises:
+        ValueError: If the stream parameter is not recognized
+    """
+    if value:
+        value = value.lower()
+        if value in MIMETYPES:
+            return value
+        if value in ('1', 'true', 'yes'):
+            return 'json'
+        raise ValueError("stream must be 'json' or 'ndjson'")
+
+    if accept_mimetypes is not None and accept_mimetypes.best_match([JSON, NDJSON]) == NDJSON:
+        return 'ndjson'
+    return None
+
+
+def _chunks(records, dumps, chunk_size):
+    """Yield lists of serialized records, chunk_size at a time."""
+    chunk = []
+    for record in records:
+        chunk.append(dumps(record))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_ndjson(records, dumps, chunk_size=CHUNK_SIZE):
+    """Serialize records as one JSON document per line."""
+    for chunk in _chunks(records, dumps, chunk_size):
+        yield '\n'.join(chunk) + '\n'
+
+
+def generate_json_array(records, dumps, chunk_size=CHUNK_SIZE):
+    """Serialize records as a single JSON array, a chunk at a time."""
+    yield '['
+    separator = ''
+    for chunk in _chunks(records, dumps, chunk_size):
+        yield separator + ','.join(chunk)
+        separator = ','
+    yield ']'
+
+
+GENERATORS = {'ndjson': generate_ndjson, 'json': generate_json_array}
+
+
+def generate(fmt, records, dumps, chunk_size=CHUNK_SIZE):
+    """Serialize records in the given streaming format."""
+    return GENERATORS[fmt](records, dumps, chunk_size)
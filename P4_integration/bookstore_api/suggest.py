@@ -0,0 +1,249 @@
+"""
+Suggestions
+
+Autocomplete for the search box: the titles and authors that start with
+what has been typed so far, most popular first. A title or author matches
+when the typed text starts at one of its words, so "gat" and "great gat"
+both suggest "The Great Gatsby". Popularity is the number of books in the
+catalog with that title or by that author.
+
+The index counts the catalog's distinct titles and authors and keeps a
+sorted list of their words, each pointing at the titles and authors that
+contain it. The top suggestions for a prefix are worked out the first time
+it is asked for and kept; catalog changes then adjust the kept lists in
+place, so popular prefixes are answered without looking at the catalog.
+After a full reload the index is rebuilt lazily, on the next request.
+"""
+import bisect
+from collections import OrderedDict, defaultdict
+import heapq
+import threading
+
+from search import normalize, words
+
+FIELDS = ('title', 'author')
+
+# The most suggestions returned for a prefix
+MAX_SUGGESTIONS = 50
+
+# Prefixes up to this long have their top suggestions kept; longer ones
+# match few enough words to be worked out on each request
+MAX_KEPT_PREFIX = 12
+
+# The most prefixes whose suggestions are kept, least recently used first out
+MAX_KEPT_PREFIXES = 20000
+
+
+def phrase_key(text):
+    """Return the normalized form of a title or author that suggestions match."""
+    return ' '.join(words(normalize(text)))
+
+
+def _prefixes(key):
+    """Return the kept prefixes a phrase matches: the starts of its words."""
+    found = set()
+    start = 0
+    while start < len(key):
+        end = min(len(key), start + MAX_KEPT_PREFIX)
+        for stop in range(start + 1, end + 1):
+            found.add(key[start:stop])
+        space = key.find(' ', start)
+        if space < 0:
+            break
+        start = space + 1
+    return found
+
+
+class SuggestIndex:
+    """Counts of titles and authors, with kept top suggestions per prefix."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # book id -> book, as last seen by the index
+        self._books = {}
+        # Whether the rest has to be rebuilt from _books before use
+        self._stale = True
+        # (field, phrase key) -> [number of books, display text]
+        self._phrases = {}
+        # Sorted distinct words, and word -> set of (field, phrase key)
+        self._vocab = []
+        self._word_phrases = defaultdict(set)
+        # prefix -> (whether all matches are listed, [(field, phrase key), ...])
+        self._top = OrderedDict()
+
+    # Maintenance
+
+    def on_change(self, event, books):
+        """BookStore listener keeping the counts in sync with the catalog."""
+        with self._lock:
+            if event == 'reload':
+                self._books = {book['id']: book for book in books}
+                self._stale = True
+                return
+            for book in books:
+                old = self._books.pop(book['id'], None)
+                if event != 'delete':
+                    self._books[book['id']] = book
+                if not self._stale:
+                    self._count(old, book if event != 'delete' else None)
+
+    def _rebuild(self):
+        """Count the titles and authors of every book and index their words."""
+        self._phrases = {}
+        self._vocab = []
+        self._word_phrases = defaultdict(set)
+        self._top = OrderedDict()
+        # Many books share an author, so normalize each name once
+        keys = {}
+        for book in self._books.values():
+            for field in FIELDS:
+                text = book.get(field)
+                if not isinstance(text, str):
+                    continue
+                key = keys.get(text)
+                if key is None:
+                    key = keys[text] = phrase_key(text)
+                if not key:
+                    continue
+                phrase = (field, key)
+                entry = self._phrases.get(phrase)
+                if entry is None:
+                    self._phrases[phrase] = [1, text]
+                    for word in key.split(' '):
+                        self._word_phrases[word].add(phrase)
+                else:
+                    entry[0] += 1
+        self._vocab = sorted(self._word_phrases)
+        self._stale = False
+
+    @staticmethod
+    def _book_phrases(book):
+        """Return the (field, phrase key) pairs of a book."""
+        phrases = []
+        for field in FIELDS:
+            value = book.get(field)
+            if isinstance(value, str):
+                key = phrase_key(value)
+                if key:
+                    phrases.append((field, key))
+        return phrases
+
+    def _count(self, old, new):
+        """Move one book's counts from its old version to its new one."""
+        before = set(self._book_phrases(old)) if old else set()
+        after = set(self._book_phrases(new)) if new else set()
+        for phrase in before - after:
+            self._adjust(phrase, -1, None)
+        for phrase in after - before:
+            self._adjust(phrase, 1, new[phrase[0]])
+        for phrase in after & before:
+            # Only the spelling shown can have changed, not the order
+            self._phrases[phrase][1] = new[phrase[0]]
+
+    def _adjust(self, phrase, change, text):
+        """Change a phrase's book count and update the kept suggestions."""
+        entry = self._phrases.get(phrase)
+        if entry is None:
+            entry = self._phrases[phrase] = [0, text]
+            # A word repeated in the phrase is indexed once
+            for word in set(phrase[1].split(' ')):
+                if word not in self._word_phrases:
+                    bisect.insort(self._vocab, word)
+                self._word_phrases[word].add(phrase)
+        entry[0] += change
+        if text is not None:
+            entry[1] = text
+        if entry[0] <= 0:
+            del self._phrases[phrase]
+            for word in set(phrase[1].split(' ')):
+                phrases = self._word_phrases.get(word)
+                if phrases is None:
+                    continue
+                phrases.discard(phrase)
+                if not phrases:
+                    del self._word_phrases[word]
+                    del self._vocab[bisect.bisect_left(self._vocab, word)]
+
+        for prefix in _prefixes(phrase[1]):
+            kept = self._top.get(prefix)
+            if kept is not None:
+                self._update_kept(prefix, kept, phrase, change)
+
+    def _update_kept(self, prefix, kept, phrase, change):
+        """Fix the kept suggestions of a prefix after a phrase's count changed."""
+        complete, top = kept
+        if phrase in top:
+            if change < 0 and not complete:
+                # Something that isn't listed may now rank above it
+                del self._top[prefix]
+                return
+            if phrase not in self._phrases:
+                top.remove(phrase)
+        elif phrase in self._phrases:
+            top.append(phrase)
+        top.sort(key=self._rank_key)
+        if len(top) > MAX_SUGGESTIONS:
+            del top[MAX_SUGGESTIONS:]
+            self._top[prefix] = (False, top)
+
+    def _rank_key(self, phrase):
+        """Order phrases by popularity, then alphabetically."""
+        return -self._phrases[phrase][0], phrase[1], phrase[0]
+
+    # Querying
+
+    def suggest(self, prefix, limit=10):
+        """
+        Suggest titles and authors for the start of a search.
+
+        Parameters:
+            prefix (str): What has been typed; the last word may be partial
+            limit (int): The most suggestions to return, up to MAX_SUGGESTIONS
+
+        Returns:
+            list: Dicts with the suggested 'text', the 'field' it is from
+                and the number of 'books' with it, most books first
+        """
+        query = phrase_key(prefix)
+        if not query:
+            return []
+        limit = min(limit, MAX_SUGGESTIONS)
+        with self._lock:
+            if self._stale:
+                self._rebuild()
+            if len(query) <= MAX_KEPT_PREFIX:
+                top = self._kept(query)
+            else:
+                top = self._find(query)[1]
+            return [{'text': self._phrases[phrase][1], 'field': phrase[0],
+                     'books': self._phrases[phrase][0]} for phrase in top[:limit]]
+
+    def _kept(self, query):
+        """Return the kept suggestions for a short prefix, working them out if needed."""
+        kept = self._top.get(query)
+        if kept is None:
+            kept = self._top[query] = self._find(query)
+            while len(self._top) > MAX_KEPT_PREFIXES:
+                self._top.popitem(last=False)
+        else:
+            self._top.move_to_end(query)
+        return kept[1]
+
+    def _find(self, query):
+        """Work out the top suggestions for a prefix; returns (complete, phrases)."""
+        terms = query.split(' ')
+        if len(terms) > 1:
+            # Start from the rarest of the words typed in full
+            candidates = min((self._word_phrases.get(term, set()) for term in terms[:-1]),
+                             key=len)
+        else:
+            start = bisect.bisect_left(self._vocab, query)
+            end = bisect.bisect_right(self._vocab, query + '\U0010ffff')
+            candidates = set()
+            for word in self._vocab[start:end]:
+                candidates.update(self._word_phrases[word])
+
+        needle = ' ' + query
+        matches = [phrase for phrase in candidates if needle in ' ' + phrase[1]]
+        top = heapq.nsmallest(MAX_SUGGESTIONS, matches, key=self._rank_key)
+        return len(matches) <= MAX_SUGGESTIONS, top
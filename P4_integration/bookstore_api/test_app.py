@@ -0,0 +1,1061 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore API
+
+This script exercises the Flask routes through the test client against a
+temporary catalog file.
+"""
+import unittest
+from unittest.mock import patch, MagicMock, call
+import gzip
+import json
+import marshal
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import app as api
+import cache
+import profiling
+from latency import LatencyInjector, LEGACY_CONFIG
+from storage import JournalStorage
+from idempotency import SqliteIdempotencyStore
+from store import BookStore, DuplicateIdError, fingerprint
+
+
+class BookstoreApiTestCase(unittest.TestCase):
+    """Shared fixtures for Bookstore API tests."""
+
+    def setUp(self):
+        """Point the API at a fresh temporary catalog."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp_dir, 'books.json')
+        self.original_state = (api.store, api.search_index, api.catalog_index,
+                               api.suggest_index, api.search_cache, api.change_log,
+                               api.response_cache, api.latency)
+        api.init_store(BookStore(self.data_file, default_books=api.SAMPLE_BOOKS,
+                                 flush_interval=0, reload_interval=0))
+        self.client = api.app.test_client()
+
+        # Don't wait on simulated network delay
+        api.latency = LatencyInjector()
+
+    def tearDown(self):
+        """Restore the real store and remove the temporary catalog."""
+        api.store.close()
+        (api.store, api.search_index, api.catalog_index,
+         api.suggest_index, api.search_cache, api.change_log,
+         api.response_cache, api.latency) = self.original_state
+        shutil.rmtree(self.tmp_dir)
+
+    def read_data_file(self):
+        """Helper method to read the catalog as persisted on disk."""
+        return JournalStorage(self.data_file).load()
+
+
+class TestBookEndpoints(BookstoreApiTestCase):
+    """Test cases for the book CRUD and search endpoints."""
+
+    def test_get_books(self):
+        """Test listing all books seeds the sample catalog."""
+        response = self.client.get('/api/books')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), api.SAMPLE_BOOKS)
+        self.assertTrue(os.path.exists(self.data_file))
+
+    def test_get_book(self):
+        """Test fetching a single book by ID."""
+        response = self.client.get('/api/books/2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['title'], '1984')
+
+    def test_get_book_not_found(self):
+        """Test fetching a missing book returns 404."""
+        response = self.client.get('/api/books/missing')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()['error'], 'Not Found')
+
+    def test_add_book(self):
+        """Test adding a book persists it."""
+        response = self.client.post('/api/books', json={
+            'title': 'Dune', 'author': 'Frank Herbert', 'price': '9.5'
+        })
+        self.assertEqual(response.status_code, 201)
+        book = response.get_json()
+        self.assertEqual(book['price'], 9.5)
+        self.assertTrue(book['in_stock'])
+
+        self.assertIn(book, self.read_data_file())
+        self.assertEqual(self.client.get(f"/api/books/{book['id']}").get_json(), book)
+
+    def test_add_book_missing_fields(self):
+        """Test adding a book without required fields returns 400."""
+        response = self.client.post('/api/books', json={'title': 'Dune'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_title_and_author_must_be_text(self):
+        """Test titles and authors that are not non-empty strings return 400."""
+        for value in (None, ['Dune'], ' '):
+            response = self.client.post('/api/books', json={
+                'title': value, 'author': 'Frank Herbert', 'price': 9.5
+            })
+            self.assertEqual(response.status_code, 400)
+            response = self.client.put('/api/books/1', json={'author': value})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.read_data_file()), 3)
+        self.assertEqual(self.client.get('/api/books/1').get_json()['author'], 'Harper Lee')
+
+    def test_update_book(self):
+        """Test updating a book persists the change."""
+        response = self.client.put('/api/books/1', json={'price': 15})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['price'], 15.0)
+        self.assertEqual(response.get_json()['title'], 'To Kill a Mockingbird')
+
+        persisted = next(b for b in self.read_data_file() if b['id'] == '1')
+        self.assertEqual(persisted['price'], 15.0)
+
+    def test_update_book_not_found(self):
+        """Test updating a missing book returns 404."""
+        response = self.client.put('/api/books/missing', json={'price': 15})
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_book(self):
+        """Test deleting a book removes it from memory and disk."""
+        response = self.client.delete('/api/books/3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/books/3').status_code, 404)
+        self.assertNotIn('3', [b['id'] for b in self.read_data_file()])
+
+    def test_delete_book_not_found(self):
+        """Test deleting a missing book returns 404."""
+        response = self.client.delete('/api/books/missing')
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_books(self):
+        """Test searching by title or author."""
+        response = self.client.get('/api/books/search?query=orwell')
+        self.assertEqual([b['id'] for b in response.get_json()], ['2'])
+
+    def test_search_books_ranked(self):
+        """Test search results are ranked by match quality."""
+        for title in ('A Tale of Two Cities', 'Two', 'Twofold'):
+            self.client.post('/api/books', json={
+                'title': title, 'author': 'Someone', 'price': 5
+            })
+        response = self.client.get('/api/books/search?query=TWO')
+        titles = [b['title'] for b in response.get_json()]
+        self.assertEqual(titles, ['Two', 'A Tale of Two Cities', 'Twofold'])
+
+    def test_search_follows_writes(self):
+        """Test the search index is updated on add, update and delete."""
+        self.client.put('/api/books/2', json={'author': 'Eric Blair'})
+        self.assertEqual(self.client.get('/api/books/search?query=orwell').get_json(), [])
+        self.assertEqual(len(self.client.get('/api/books/search?query=blair').get_json()), 1)
+
+        self.client.delete('/api/books/2')
+        self.assertEqual(self.client.get('/api/books/search?query=blair').get_json(), [])
+
+    def test_search_modes(self):
+        """Test prefix and fuzzy search, and the fuzzy fallback."""
+        response = self.client.get('/api/books/search?query=orwel')
+        self.assertEqual(response.headers['X-Search-Mode'], 'substring')
+
+        response = self.client.get('/api/books/search?query=orwdll')
+        self.assertEqual([b['id'] for b in response.get_json()], ['2'])
+        self.assertEqual(response.headers['X-Search-Mode'], 'fuzzy')
+
+        response = self.client.get('/api/books/search?query=orwdll&mode=substring')
+        self.assertEqual(response.get_json(), [])
+
+        response = self.client.get('/api/books/search?query=great+gat&mode=prefix')
+        self.assertEqual([b['id'] for b in response.get_json()], ['3'])
+        self.assertEqual(response.headers['X-Search-Mode'], 'prefix')
+
+        response = self.client.get('/api/books/search?query=x&mode=regex')
+        self.assertEqual(response.status_code, 400)
+
+    def test_suggest_books(self):
+        """Test suggestions complete titles and authors and follow writes."""
+        response = self.client.get('/api/books/suggest?prefix=or')
+        self.assertEqual(response.get_json(), [
+            {'text': 'George Orwell', 'field': 'author', 'books': 1},
+        ])
+
+        self.client.post('/api/books', json={
+            'title': 'Animal Farm', 'author': 'George Orwell', 'price': 7
+        })
+        response = self.client.get('/api/books/suggest?prefix=geo&limit=1')
+        self.assertEqual(response.get_json()[0]['books'], 2)
+
+        # A title repeating a word can be deleted again
+        response = self.client.post('/api/books', json={
+            'title': 'Tora Tora Tora', 'author': 'Anon', 'price': 5
+        })
+        self.client.delete(f"/api/books/{response.get_json()['id']}")
+        response = self.client.get('/api/books/suggest?prefix=to')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([s['text'] for s in response.get_json()], ['To Kill a Mockingbird'])
+
+        for query in ('', 'prefix=', 'prefix=a&limit=0', 'prefix=a&limit=x'):
+            response = self.client.get(f'/api/books/suggest?{query}')
+            self.assertEqual(response.status_code, 400)
+
+    def test_search_books_requires_query(self):
+        """Test searching without a query returns 400."""
+        response = self.client.get('/api/books/search')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestPagination(BookstoreApiTestCase):
+    """Test cases for paging and projecting the book listing."""
+
+    def setUp(self):
+        """Add enough books to span several pages."""
+        super().setUp()
+        for i in range(7):
+            api.store.add({'id': f"b{i}", 'title': f"Book {i}", 'author': 'A',
+                           'price': float(i), 'in_stock': True})
+
+    def fetch_all_pages(self, url):
+        """Helper that follows X-Next-Cursor until the last page."""
+        pages = []
+        while True:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([b['id'] for b in response.get_json()])
+            cursor = response.headers.get('X-Next-Cursor')
+            if not cursor:
+                return pages
+            self.assertIn('rel="next"', response.headers['Link'])
+            url = f"/api/books?limit=3&cursor={cursor}"
+
+    def test_keyset_pages(self):
+        """Test pages cover the catalog in ID order without overlap."""
+        pages = self.fetch_all_pages('/api/books?limit=3')
+        self.assertEqual(pages, [['1', '2', '3'], ['b0', 'b1', 'b2'],
+                                 ['b3', 'b4', 'b5'], ['b6']])
+
+    def test_pages_stable_under_writes(self):
+        """Test a deleted or added book doesn't shift the next page."""
+        response = self.client.get('/api/books?limit=3')
+        cursor = response.headers['X-Next-Cursor']
+        self.client.delete('/api/books/1')
+        api.store.add({'id': '0', 'title': 'Zero', 'author': 'A', 'price': 0.0, 'in_stock': True})
+
+        response = self.client.get(f"/api/books?limit=3&cursor={cursor}")
+        self.assertEqual([b['id'] for b in response.get_json()], ['b0', 'b1', 'b2'])
+
+    def test_unpaged_listing_unchanged(self):
+        """Test the listing without parameters is the whole catalog."""
+        response = self.client.get('/api/books')
+        self.assertEqual(len(response.get_json()), 10)
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+    def test_field_projection(self):
+        """Test fields= returns only the requested fields."""
+        response = self.client.get('/api/books?limit=2&fields=id,price')
+        self.assertEqual(response.get_json(), [{'id': '1', 'price': 12.99},
+                                               {'id': '2', 'price': 10.99}])
+
+    def test_invalid_parameters(self):
+        """Test bad pagination parameters return 400."""
+        for query in ('limit=0', 'limit=abc', 'limit=100000',
+                      'cursor=not-a-cursor', 'fields=id,isbn'):
+            response = self.client.get(f"/api/books?{query}")
+            self.assertEqual(response.status_code, 400, query)
+            self.assertEqual(response.get_json()['error'], 'Bad Request')
+
+
+class TestFiltering(BookstoreApiTestCase):
+    """Test cases for filtering and sorting the book listing."""
+
+    def setUp(self):
+        """Add books with a spread of prices, authors and stock."""
+        super().setUp()
+        for i in range(10):
+            api.store.add({'id': f"b{i}", 'title': f"Book {i}",
+                           'author': 'Ann' if i % 2 else 'Bob',
+                           'price': float(20 - i), 'in_stock': i % 3 != 0})
+
+    def ids(self, url):
+        """Helper returning the IDs a listing returns."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return [book['id'] for book in response.get_json()]
+
+    def test_in_stock_under_price_sorted(self):
+        """Test the filters combine and sort=price orders by price."""
+        self.assertEqual(self.ids('/api/books?in_stock=true&max_price=15&sort=price'),
+                         ['2', 'b8', '1', 'b7', 'b5'])
+
+    def test_descending_and_author(self):
+        """Test sort=-field reverses the order and author is case-insensitive."""
+        self.assertEqual(self.ids('/api/books?author=ann&sort=-price&min_price=15'),
+                         ['b1', 'b3', 'b5'])
+        self.assertEqual(self.ids('/api/books?in_stock=false&sort=title'),
+                         ['b0', 'b3', 'b6', 'b9', '3'])
+
+    def test_filtered_pages(self):
+        """Test cursors page through a sorted listing without overlap."""
+        url = '/api/books?sort=price&limit=4'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            pages.append([book['price'] for book in response.get_json()])
+            cursor = response.headers.get('X-Next-Cursor')
+            url = f'/api/books?sort=price&limit=4&cursor={cursor}' if cursor else None
+        prices = [price for page in pages for price in page]
+        self.assertEqual(len(prices), 13)
+        self.assertEqual(prices, sorted(prices))
+
+    def test_index_follows_writes(self):
+        """Test updates and deletes are reflected in filtered listings."""
+        self.client.put('/api/books/b0', json={'in_stock': True, 'price': 1})
+        self.client.delete('/api/books/b1')
+        self.assertEqual(self.ids('/api/books?in_stock=true&sort=price&max_price=12'),
+                         ['b0', '2', 'b8'])
+
+    def test_invalid_filters(self):
+        """Test bad filter, sort and cursor parameters return 400."""
+        cursor = self.client.get('/api/books?limit=2').headers['X-Next-Cursor']
+        for query in ('in_stock=maybe', 'min_price=cheap', 'sort=isbn',
+                      f'sort=price&cursor={cursor}'):
+            response = self.client.get(f"/api/books?{query}")
+            self.assertEqual(response.status_code, 400, query)
+
+
+class TestStreaming(BookstoreApiTestCase):
+    """Test cases for streamed listing and search responses."""
+
+    def test_stream_json_array(self):
+        """Test a streamed JSON array matches the catalog in ID order."""
+        api.store.add({'id': '0', 'title': 'Zero', 'author': 'A', 'price': 0.0, 'in_stock': True})
+        response = self.client.get('/api/books?stream=json')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual([b['id'] for b in response.get_json()], ['0', '1', '2', '3'])
+
+    def test_stream_ndjson(self):
+        """Test NDJSON can be requested by parameter or Accept header."""
+        for kwargs in ({'query_string': {'stream': 'ndjson'}},
+                       {'headers': {'Accept': 'application/x-ndjson'}}):
+            response = self.client.get('/api/books', **kwargs)
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            lines = response.get_data(as_text=True).splitlines()
+            self.assertEqual([json.loads(line) for line in lines], api.SAMPLE_BOOKS)
+
+    def test_stream_does_not_copy_catalog(self):
+        """Test a full export walks the store page by page."""
+        with patch('store.BookStore.all') as mock_all:
+            body = self.client.get('/api/books?stream=ndjson&fields=id').get_data(as_text=True)
+            mock_all.assert_not_called()
+        self.assertEqual(body, '{"id":"1"}\n{"id":"2"}\n{"id":"3"}\n')
+
+    def test_stream_page(self):
+        """Test a streamed page keeps its pagination headers."""
+        response = self.client.get('/api/books?stream=json&limit=2')
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertIn('X-Next-Cursor', response.headers)
+
+    def test_stream_search(self):
+        """Test search results can be streamed."""
+        response = self.client.get('/api/books/search?query=the&stream=ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], ['3'])
+
+    def test_stream_empty(self):
+        """Test an empty streamed array is still valid JSON."""
+        response = self.client.get('/api/books/search?query=zzz&stream=json')
+        self.assertEqual(response.get_json(), [])
+
+    def test_invalid_stream_format(self):
+        """Test an unknown stream format returns 400."""
+        response = self.client.get('/api/books?stream=xml')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestChangeFeed(BookstoreApiTestCase):
+    """Test cases for the change feed and its event stream."""
+
+    def make_changes(self):
+        """Helper to add, update and delete a book."""
+        book_id = self.client.post('/api/books', json={
+            'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5
+        }).get_json()['id']
+        self.client.put(f'/api/books/{book_id}', json={'price': 8})
+        self.client.delete('/api/books/1')
+        return book_id
+
+    def test_poll_changes(self):
+        """Test changes are listed in order and resumed from last_seq."""
+        book_id = self.make_changes()
+        response = self.client.get('/api/books/changes?since=0')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual([(c['seq'], c['type'], c['id']) for c in body['changes']],
+                         [(1, 'add', book_id), (2, 'update', book_id), (3, 'delete', '1')])
+        self.assertEqual(body['changes'][1]['book']['price'], 8.0)
+        self.assertEqual((body['last_seq'], body['more']), (3, False))
+        self.assertEqual(response.headers['X-Change-Log-Epoch'], body['epoch'])
+
+        epoch = body['epoch']
+        body = self.client.get(f'/api/books/changes?since=1&epoch={epoch}&limit=1').get_json()
+        self.assertEqual(([c['seq'] for c in body['changes']], body['more']), ([2], True))
+        body = self.client.get(f'/api/books/changes?since=3&epoch={epoch}').get_json()
+        self.assertEqual((body['changes'], body['last_seq']), ([], 3))
+
+    def test_invalid_or_gone(self):
+        """Test bad parameters give 400 and unknown positions 410."""
+        self.assertEqual(self.client.get('/api/books/changes?since=x').status_code, 400)
+        self.assertEqual(self.client.get('/api/books/changes?limit=0').status_code, 400)
+        # A sequence number means nothing without the log it came from
+        self.assertEqual(self.client.get('/api/books/changes?since=5').status_code, 400)
+        response = self.client.get(f'/api/books/changes?since=5&epoch={api.change_log.epoch}')
+        self.assertEqual(response.status_code, 410)
+        self.assertEqual(response.get_json()['error'], 'Gone')
+        response = self.client.get('/api/books/changes?since=0&epoch=other')
+        self.assertEqual(response.status_code, 410)
+        response = self.client.get('/api/books/changes', headers={'Last-Event-ID': '2'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_disabled(self):
+        """Test the feed answers 404 when turned off, as under several workers."""
+        with patch.object(api, 'CHANGE_FEED', False):
+            self.assertEqual(self.client.get('/api/books/changes').status_code, 404)
+
+    def test_event_stream(self):
+        """Test changes are streamed as Server-Sent Events as they happen."""
+        self.make_changes()
+        epoch = api.change_log.epoch
+        with patch('app.CHANGE_POLL_INTERVAL', 0.01):
+            response = self.client.get('/api/books/changes',
+                                       headers={'Accept': 'text/event-stream',
+                                                'Last-Event-ID': f"{epoch}:2"},
+                                       buffered=False)
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            events = iter(response.response)
+            first = next(events)
+            self.assertTrue(first.startswith(f"id: {epoch}:3\nevent: delete\ndata: ".encode()))
+
+            self.client.put('/api/books/2', json={'price': 1})
+            event = next(events).decode()
+            response.close()
+        lines = event.splitlines()
+        self.assertEqual(lines[:2], [f"id: {epoch}:4", 'event: update'])
+        self.assertEqual(json.loads(lines[2][len('data: '):])['book']['price'], 1.0)
+
+
+class TestIdempotencyKeys(BookstoreApiTestCase):
+    """Test cases for Idempotency-Key support on POST /api/books."""
+
+    def setUp(self):
+        """Start with no remembered keys."""
+        super().setUp()
+        self.original_keys = api.idempotency_keys
+        self.keys_file = f"{self.data_file}.keys"
+        api.idempotency_keys = SqliteIdempotencyStore(self.keys_file)
+
+    def tearDown(self):
+        """Restore the app's key store."""
+        api.idempotency_keys.close()
+        api.idempotency_keys = self.original_keys
+        super().tearDown()
+
+    def post(self, body, key):
+        """Helper to add a book with an Idempotency-Key."""
+        return self.client.post('/api/books', json=body, headers={'Idempotency-Key': key})
+
+    def test_retry_is_replayed(self):
+        """Test a retry returns the first response without adding a book."""
+        body = {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5}
+        first = self.post(body, 'add-dune')
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first.headers)
+
+        retry = self.post(body, 'add-dune')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.get_json(), first.get_json())
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(api.store), len(api.SAMPLE_BOOKS) + 1)
+
+        # A new key adds another book
+        self.assertEqual(self.post(body, 'add-dune-again').status_code, 201)
+        self.assertEqual(len(api.store), len(api.SAMPLE_BOOKS) + 2)
+
+    def test_retry_handled_by_another_worker(self):
+        """Test a retry is replayed by another process sharing the keys."""
+        body = {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5}
+        first = self.post(body, 'add-dune')
+
+        api.idempotency_keys.close()
+        api.idempotency_keys = SqliteIdempotencyStore(self.keys_file)
+        retry = self.post(body, 'add-dune')
+        self.assertEqual(retry.get_json(), first.get_json())
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(api.store), len(api.SAMPLE_BOOKS) + 1)
+
+    def test_key_reused_for_other_book(self):
+        """Test a key sent with a different body is refused."""
+        self.post({'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5}, 'k')
+        response = self.post({'title': 'Emma', 'author': 'Jane Austen', 'price': 4}, 'k')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.get_json()['error'], 'Unprocessable Entity')
+
+    def test_failed_request_can_be_retried(self):
+        """Test a rejected request is not remembered under its key."""
+        response = self.post({'title': 'Dune', 'author': 'Frank Herbert', 'price': 'x'}, 'k')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(api.idempotency_keys), 0)
+
+        response = self.post({'title': 'Dune', 'author': 'Frank Herbert', 'price': 'x'}, 'k')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post({'title': 'Dune', 'author': 'F', 'price': 1}, '').status_code,
+                         400)
+
+    def test_retry_during_request_conflicts(self):
+        """Test a retry arriving while the first request is handled gets 409."""
+        body = {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5}
+        api.idempotency_keys.begin(('POST', '/api/books', 'k'), fingerprint(body))
+        response = self.post(body, 'k')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(api.store), len(api.SAMPLE_BOOKS))
+
+
+class TestBulkEndpoints(BookstoreApiTestCase):
+    """Test cases for the batch create, update and delete endpoints."""
+
+    def test_bulk_add(self):
+        """Test valid books are created and invalid ones reported."""
+        response = self.client.post('/api/books/bulk', json=[
+            {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5},
+            {'title': 'No Author', 'price': 1},
+            {'title': 'Emma', 'author': 'Jane Austen', 'price': 'cheap'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual((body['succeeded'], body['failed']), (1, 2))
+        self.assertEqual([r['status'] for r in body['results']], [201, 400, 400])
+        self.assertEqual(body['results'][2]['error'], 'Price must be a number')
+
+        book = body['results'][0]['book']
+        self.assertIn(book, self.read_data_file())
+
+    def test_bulk_add_single_commit(self):
+        """Test a whole batch is persisted with one storage write."""
+        books = [{'title': f"T{i}", 'author': 'A', 'price': i} for i in range(50)]
+        with patch.object(api.store.storage, 'apply') as mock_apply:
+            self.client.post('/api/books/bulk', json={'books': books})
+            self.assertEqual(mock_apply.call_count, 1)
+            self.assertEqual(len(mock_apply.call_args[0][0]), 50)
+
+    def test_bulk_update(self):
+        """Test many books are updated with per-item results."""
+        response = self.client.patch('/api/books/bulk', json=[
+            {'id': '1', 'price': 1},
+            {'id': 'missing', 'price': 2},
+            {'id': '2', 'in_stock': False},
+        ])
+        body = response.get_json()
+        self.assertEqual([r['status'] for r in body['results']], [200, 404, 200])
+        self.assertEqual(api.store.get('1')['price'], 1.0)
+        self.assertFalse(api.store.get('2')['in_stock'])
+
+    def test_bulk_delete(self):
+        """Test many books are deleted with per-item results."""
+        response = self.client.delete('/api/books/bulk', json={'ids': ['1', '3', 'nope']})
+        body = response.get_json()
+        self.assertEqual([r['status'] for r in body['results']], [200, 200, 404])
+        self.assertEqual([b['id'] for b in self.read_data_file()], ['2'])
+
+    def test_bulk_requires_list(self):
+        """Test a body that is not a list of items returns 400."""
+        for method in (self.client.post, self.client.patch, self.client.delete):
+            response = method('/api/books/bulk', json={'title': 'Dune'})
+            self.assertEqual(response.status_code, 400)
+
+    def test_bulk_size_limit(self):
+        """Test oversized batches are rejected."""
+        with patch('app.MAX_BULK_ITEMS', 2):
+            response = self.client.delete('/api/books/bulk', json=['1', '2', '3'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(api.store), 3)
+
+
+class TestConditionalRequests(BookstoreApiTestCase):
+    """Test cases for ETag and Last-Modified support."""
+
+    def test_listing_not_modified(self):
+        """Test a listing is not re-sent while the catalog is unchanged."""
+        response = self.client.get('/api/books')
+        etag = response.headers['ETag']
+
+        with patch('app.jsonify') as mock_jsonify:
+            response = self.client.get('/api/books', headers={'If-None-Match': etag})
+            mock_jsonify.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertEqual(response.get_data(), b'')
+
+    def test_listing_modified_after_write(self):
+        """Test any write gives the listing and search a new ETag."""
+        etag = self.client.get('/api/books').headers['ETag']
+        search_etag = self.client.get('/api/books/search?query=the').headers['ETag']
+        self.client.put('/api/books/1', json={'price': 1})
+
+        response = self.client.get('/api/books', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        response = self.client.get('/api/books/search?query=the',
+                                   headers={'If-None-Match': search_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_book_etag_is_per_book(self):
+        """Test a book's ETag only changes when that book changes."""
+        etag = self.client.get('/api/books/2').headers['ETag']
+        self.client.put('/api/books/1', json={'price': 1})
+        response = self.client.get('/api/books/2', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put('/api/books/2', json={'price': 1})
+        response = self.client.get('/api/books/2', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        """Test Last-Modified is honored when no ETag is sent."""
+        api.store.refresh()
+        with patch('time.time', return_value=time.time() + 2):
+            last_modified = self.client.get('/api/books').headers['Last-Modified']
+            response = self.client.get('/api/books',
+                                       headers={'If-Modified-Since': last_modified})
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get('/api/books', headers={
+                'If-Modified-Since': 'Thu, 01 Jan 1970 00:00:00 GMT'
+            })
+            self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_same_second(self):
+        """Test a write in the second a client's copy is from is not missed."""
+        since = {'If-Modified-Since': 'Thu, 01 Jan 1970 00:16:40 GMT'}
+        with patch('time.time', return_value=1000.2):
+            self.client.put('/api/books/1', json={'price': 1})
+        with patch('time.time', return_value=1000.7):
+            self.client.put('/api/books/1', json={'price': 2})
+            # Another write may still follow in this second
+            response = self.client.get('/api/books', headers=since)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('Last-Modified', response.headers)
+
+        with patch('time.time', return_value=1001.5):
+            response = self.client.get('/api/books', headers=since)
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get('/api/books')
+            self.assertEqual(response.headers['Last-Modified'], since['If-Modified-Since'])
+
+    def test_if_match(self):
+        """Test writes with a stale If-Match ETag are refused with 412."""
+        etag = self.client.get('/api/books/1').headers['ETag']
+        response = self.client.put('/api/books/1', json={'price': 1},
+                                   headers={'If-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        new_etag = response.headers['ETag']
+        self.assertNotEqual(new_etag, etag)
+
+        response = self.client.put('/api/books/1', json={'price': 2},
+                                   headers={'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.get_json()['error'], 'Precondition Failed')
+        response = self.client.delete('/api/books/1', headers={'If-Match': etag})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(api.store.get('1')['price'], 1.0)
+
+        response = self.client.delete('/api/books/1', headers={'If-Match': new_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_shared_between_workers(self):
+        """Test every store serving the same stored catalog gives the same ETag."""
+        etag = self.client.get('/api/books').headers['ETag']
+        other = BookStore(self.data_file, flush_interval=0, reload_interval=0)
+        self.assertEqual(other.catalog_tag(), api.store.catalog_tag())
+        self.client.put('/api/books/1', json={'price': 1})
+        self.assertNotEqual(other.catalog_tag(), etag)
+        self.assertEqual(other.catalog_tag(), api.store.catalog_tag())
+        other.close()
+
+        # Writes not stored yet are only known to the store that made them
+        delayed = BookStore(self.data_file, flush_interval=0, reload_interval=0)
+        with delayed.batch():
+            delayed.delete('2')
+            self.assertEqual(delayed.catalog_tag(),
+                             f"{delayed.epoch}-{delayed.catalog_state()[0]}")
+        self.assertEqual(delayed.catalog_tag(), api.store.catalog_tag())
+        delayed.close()
+
+
+class TestResponseCache(BookstoreApiTestCase):
+    """Test cases for cached, pre-serialized and compressed responses."""
+
+    def setUp(self):
+        """Add enough books for the listing to be worth compressing."""
+        super().setUp()
+        for i in range(20):
+            api.store.add({'id': f"b{i:02}", 'title': f"Book number {i}",
+                           'author': 'Prolific Author', 'price': float(i), 'in_stock': True})
+
+    def test_hot_listing_not_reserialized(self):
+        """Test a repeated listing is served without calling jsonify."""
+        first = self.client.get('/api/books?limit=5')
+        with patch('app.jsonify') as mock_jsonify:
+            second = self.client.get('/api/books?limit=5')
+            mock_jsonify.assert_not_called()
+        self.assertEqual(first.get_data(), second.get_data())
+        self.assertEqual(first.headers['X-Next-Cursor'], second.headers['X-Next-Cursor'])
+        self.assertEqual(api.response_cache.stats()['hits'], 1)
+
+    def test_query_string_is_part_of_key(self):
+        """Test different queries are cached separately."""
+        self.assertEqual(len(self.client.get('/api/books?limit=2').get_json()), 2)
+        self.assertEqual(len(self.client.get('/api/books?limit=3').get_json()), 3)
+        self.assertEqual(self.client.get('/api/books/search?query=1984').get_json()[0]['id'], '2')
+        self.assertEqual(self.client.get('/api/books/search?query=gatsby').get_json()[0]['id'], '3')
+
+    def test_invalidated_on_write(self):
+        """Test a write is visible immediately and empties the cache."""
+        self.client.get('/api/books/search?query=book')
+        self.client.delete('/api/books/b00')
+        self.assertEqual(len(api.response_cache), 0)
+        ids = [b['id'] for b in self.client.get('/api/books/search?query=book').get_json()]
+        self.assertNotIn('b00', ids)
+
+    def test_search_cache_survives_unrelated_writes(self):
+        """Test a repeated search skips the index unless a write affects it."""
+        self.client.get('/api/books/search?query=gatsby')
+        self.client.put('/api/books/2', json={'price': 20})
+        with patch.object(api.search_index, 'search', wraps=api.search_index.search) as search:
+            response = self.client.get('/api/books/search?query=Gatsby')
+            search.assert_not_called()
+            self.assertEqual([b['id'] for b in response.get_json()], ['3'])
+
+            self.client.put('/api/books/2', json={'title': 'Gatsby Returns'})
+            response = self.client.get('/api/books/search?query=gatsby')
+            search.assert_called_once()
+            self.assertEqual(sorted(b['id'] for b in response.get_json()), ['2', '3'])
+        stats = api.search_cache.stats()
+        self.assertEqual((stats['hits'], stats['invalidations']), (1, 1))
+
+    def test_gzip_negotiation(self):
+        """Test gzip is sent to clients that accept it, and compressed once."""
+        plain = self.client.get('/api/books').get_data()
+        with patch.dict('cache.COMPRESSORS', {'gzip': MagicMock(wraps=cache.COMPRESSORS['gzip'])}):
+            for _ in range(2):
+                response = self.client.get('/api/books', headers={'Accept-Encoding': 'gzip, deflate'})
+                self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+                self.assertEqual(gzip.decompress(response.get_data()), plain)
+            self.assertEqual(cache.COMPRESSORS['gzip'].call_count, 1)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+        response = self.client.get('/api/books', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_small_bodies_not_compressed(self):
+        """Test tiny responses are sent uncompressed."""
+        response = self.client.get('/api/books/search?query=1984',
+                                   headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_lru_bound(self):
+        """Test the cache never holds more than its maximum entries."""
+        api.response_cache.max_entries = 2
+        for limit in (1, 2, 3):
+            self.client.get(f"/api/books?limit={limit}")
+        self.assertEqual(len(api.response_cache), 2)
+
+
+class TestBookStore(BookstoreApiTestCase):
+    """Test cases for the resident in-memory store."""
+
+    def test_reads_are_served_from_memory(self):
+        """Test the data file is parsed once, not on every read."""
+        api.store.reload_interval = 60
+        api.store.all()
+        with patch('storage.json.load') as mock_load:
+            self.client.get('/api/books')
+            self.client.get('/api/books/1')
+            mock_load.assert_not_called()
+
+    def test_external_change_is_reloaded(self):
+        """Test the store picks up edits made to the file by someone else."""
+        api.store.all()
+        with open(self.data_file, 'w') as f:
+            json.dump([{'id': 'x', 'title': 'T', 'author': 'A',
+                        'price': 1.0, 'in_stock': True}], f)
+        os.utime(self.data_file, ns=(0, 0))
+
+        response = self.client.get('/api/books')
+        self.assertEqual([b['id'] for b in response.get_json()], ['x'])
+
+    def test_id_index_tracks_writes(self):
+        """Test the ID index follows inserts, updates and deletes in order."""
+        store = api.store
+        store.add({'id': 'new', 'title': 'N', 'author': 'A', 'price': 1.0, 'in_stock': True})
+        store.update('new', {'title': 'Renamed'})
+        self.assertEqual(store.get('new')['title'], 'Renamed')
+
+        self.assertEqual(store.delete('2')['title'], '1984')
+        self.assertIsNone(store.get('2'))
+        self.assertIsNone(store.delete('2'))
+        self.assertEqual([b['id'] for b in store.all()], ['1', '3', 'new'])
+        self.assertEqual(len(store), 3)
+
+    def test_add_refuses_existing_id(self):
+        """Test adding a book never replaces another with the same ID."""
+        with self.assertRaises(DuplicateIdError):
+            api.store.add({'id': '1', 'title': 'T', 'author': 'A', 'price': 1.0,
+                           'in_stock': True})
+        self.assertEqual(api.store.get('1')['title'], 'To Kill a Mockingbird')
+
+        # The API picks another ID instead
+        with patch.object(api, 'new_book_id', side_effect=['1', '2', 'fresh']):
+            response = self.client.post('/api/books', json={
+                'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5
+            })
+        self.assertEqual(response.get_json()['id'], 'fresh')
+        self.assertEqual(len(self.read_data_file()), 4)
+
+    def test_pages_during_deletes(self):
+        """Test paging while another thread deletes books never fails."""
+        store = BookStore(self.data_file, flush_interval=0.05)
+        store.replace([{'id': f"{i:04}", 'title': 'T', 'author': 'A', 'price': 1.0,
+                        'in_stock': True} for i in range(2000)])
+        deleter = threading.Thread(target=lambda: [store.delete(f"{i:04}")
+                                                   for i in range(2000)])
+        deleter.start()
+        while deleter.is_alive():
+            list(store.iter_sorted(chunk_size=100))
+        deleter.join()
+        self.assertEqual(store.page(), ([], False))
+        store.close()
+
+    def test_background_flush(self):
+        """Test writes are coalesced and flushed by the background thread."""
+        store = BookStore(self.data_file, default_books=api.SAMPLE_BOOKS,
+                          flush_interval=0.2)
+        store.load()
+        with patch.object(store.storage, 'apply', wraps=store.storage.apply) as mock_apply:
+            store.add({'id': 'a', 'title': 'A', 'author': 'A', 'price': 1.0, 'in_stock': True})
+            store.add({'id': 'b', 'title': 'B', 'author': 'B', 'price': 1.0, 'in_stock': True})
+            store.close()
+            self.assertEqual(mock_apply.call_count, 1)
+            self.assertEqual(len(mock_apply.call_args[0][0]), 2)
+
+        self.assertEqual([b['id'] for b in self.read_data_file()][-2:], ['a', 'b'])
+
+    def test_writers_in_other_processes(self):
+        """Test two stores on one file never overwrite each other's changes."""
+        first = BookStore(self.data_file, default_books=api.SAMPLE_BOOKS,
+                          flush_interval=0, reload_interval=60)
+        second = BookStore(self.data_file, flush_interval=0, reload_interval=60)
+        first.load()
+        second.load()
+
+        first.update('1', {'title': 'Go Set a Watchman'})
+        second.update('1', {'price': 1.0})
+        second.delete('2')
+        first.add({'id': 'a', 'title': 'A', 'author': 'A', 'price': 1.0, 'in_stock': True})
+        first.close()
+        second.close()
+
+        books = {book['id']: book for book in self.read_data_file()}
+        self.assertEqual(sorted(books), ['1', '3', 'a'])
+        self.assertEqual(books['1']['title'], 'Go Set a Watchman')
+        self.assertEqual(books['1']['price'], 1.0)
+
+    def test_threaded_writes(self):
+        """Test concurrent writes from many threads are all persisted."""
+        store = BookStore(self.data_file, default_books=api.SAMPLE_BOOKS,
+                          flush_interval=0)
+
+        def add_books(prefix):
+            for i in range(25):
+                store.add({'id': f'{prefix}-{i}', 'title': 'T', 'author': 'A',
+                           'price': 1.0, 'in_stock': True})
+                store.update('1', {'price': float(i)})
+
+        threads = [threading.Thread(target=add_books, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        store.close()
+
+        self.assertEqual(len(self.read_data_file()), 3 + 8 * 25)
+
+    def test_failed_flush_keeps_changes(self):
+        """Test changes a failed flush took are retried on the next flush."""
+        store = BookStore(self.data_file, default_books=api.SAMPLE_BOOKS,
+                          flush_interval=0.2)
+        store.load()
+        store.add({'id': 'a', 'title': 'A', 'author': 'A', 'price': 1.0, 'in_stock': True})
+        with patch.object(store.storage, 'apply', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                store.flush()
+        store.delete('1')
+        store.close()
+
+        self.assertEqual([b['id'] for b in self.read_data_file()], ['2', '3', 'a'])
+
+
+class TestMetricsEndpoint(BookstoreApiTestCase):
+    """Test cases for the /metrics endpoint."""
+
+    def test_metrics(self):
+        """Test request latency, phases and catalog gauges are exposed."""
+        self.client.get('/api/books')
+        self.client.get('/api/books/missing')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        text = response.get_data(as_text=True)
+        self.assertRegex(text, r'bookstore_requests_total\{endpoint="get_book",'
+                               r'method="GET",status="404"\} \d+')
+        self.assertIn('bookstore_request_duration_seconds_count{endpoint="get_books",'
+                      'method="GET"}', text)
+        for phase in ('storage', 'handler', 'serialization', 'injected'):
+            self.assertIn(f'bookstore_request_phase_seconds_sum{{endpoint="get_books",'
+                          f'phase="{phase}"}}', text)
+        self.assertIn('bookstore_catalog_books 3\n', text)
+        self.assertIn('bookstore_response_cache_hit_ratio ', text)
+
+    def test_storage_time_is_measured(self):
+        """Test time spent loading the catalog counts as storage time."""
+        with patch('app.REQUEST_PHASES') as phases:
+            self.client.get('/api/books')
+        observed = {call.kwargs['phase']: call.args[0]
+                    for call in phases.observe.call_args_list}
+        self.assertGreater(observed['storage'], 0)
+        self.assertGreater(observed['serialization'], 0)
+
+
+class TestProfiling(BookstoreApiTestCase):
+    """Test cases for opt-in per-request profiling."""
+
+    def setUp(self):
+        """Turn profiling on for requests that ask for it."""
+        super().setUp()
+        self.original_profiler = api.profiler
+        api.profiler = profiling.Profiler('on')
+
+    def tearDown(self):
+        """Restore the configured profiler."""
+        api.profiler = self.original_profiler
+        super().tearDown()
+
+    def test_only_requested_profiles(self):
+        """Test only flagged requests are profiled."""
+        response = self.client.get('/api/books/search?query=the')
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self.client.get('/api/profiles').get_json(), [])
+
+        response = self.client.get('/api/books/search?query=the',
+                                   headers={'X-Profile': '1'})
+        profile_id = response.headers['X-Profile-Id']
+        profiles = self.client.get('/api/profiles').get_json()
+        self.assertEqual([p['id'] for p in profiles], [profile_id])
+        self.assertEqual(profiles[0]['endpoint'], 'search_books')
+
+    def test_profile_report(self):
+        """Test a profile is returned as text or in pstats format."""
+        profile_id = self.client.get('/api/books?profile=1').headers['X-Profile-Id']
+
+        report = self.client.get(f'/api/profiles/{profile_id}')
+        self.assertEqual(report.mimetype, 'text/plain')
+        self.assertIn('get_books', report.get_data(as_text=True))
+        report = self.client.get(f'/api/profiles/{profile_id}?sort=tottime')
+        self.assertIn('Ordered by: internal time', report.get_data(as_text=True))
+
+        raw = self.client.get(f'/api/profiles/{profile_id}?format=pstats')
+        stats = marshal.loads(raw.get_data())
+        self.assertTrue(any(func[2] == 'get_books' for func in stats))
+
+        self.assertEqual(self.client.get('/api/profiles/missing').status_code, 404)
+
+    def test_sampling(self):
+        """Test a sample rate profiles a share of unflagged requests."""
+        rng = MagicMock()
+        rng.random.side_effect = [0.3, 0.05]
+        api.profiler = profiling.Profiler('0.1', rng=rng)
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/books').headers)
+        self.assertIn('X-Profile-Id', self.client.get('/api/books').headers)
+
+    def test_disabled(self):
+        """Test nothing is profiled or exposed when profiling is off."""
+        api.profiler = profiling.Profiler()
+        response = self.client.get('/api/books?profile=1')
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self.client.get('/api/profiles').status_code, 404)
+        with self.assertRaises(ValueError):
+            profiling.Profiler('sometimes')
+
+
+class TestLatencyInjection(BookstoreApiTestCase):
+    """Test cases for configurable artificial latency."""
+
+    def test_disabled_by_default(self):
+        """Test no delay is injected without configuration."""
+        sleep = MagicMock()
+        api.latency = LatencyInjector(None, sleep=sleep)
+        response = self.client.get('/api/books')
+        sleep.assert_not_called()
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertFalse(api.latency.enabled)
+
+    def test_legacy_delays(self):
+        """Test the legacy profile reproduces the old per-endpoint sleeps."""
+        sleep = MagicMock()
+        api.latency = LatencyInjector('legacy', sleep=sleep)
+        self.client.get('/api/books')
+        self.client.post('/api/books', json={'title': 'T', 'author': 'A', 'price': 1})
+        self.client.get('/api/books/search?query=t')
+        self.assertEqual(sleep.call_args_list, [call(0.2), call(0.5), call(0.3)])
+
+    def test_injected_time_reported(self):
+        """Test injected delay is reported in headers and stats."""
+        api.latency = LatencyInjector({'default': 0.25}, sleep=MagicMock())
+        response = self.client.get('/api/books/1')
+        self.assertEqual(response.headers['Server-Timing'], 'injected;dur=250.0')
+        self.assertEqual(api.latency.stats(), {'get_book': {'count': 1, 'seconds': 0.25}})
+
+    def test_distributions(self):
+        """Test distribution-based delays stay within their bounds."""
+        injector = LatencyInjector({'endpoints': {
+            'get_books': {'distribution': 'uniform', 'low': 0.1, 'high': 0.2},
+            'get_book': {'distribution': 'normal', 'mean': 0.0, 'stddev': 1.0},
+            'delete_book': None,
+        }}, sleep=MagicMock())
+        for _ in range(50):
+            self.assertTrue(0.1 <= injector.delay_for('get_books') <= 0.2)
+            self.assertGreaterEqual(injector.delay_for('get_book'), 0.0)
+        self.assertEqual(injector.delay_for('delete_book'), 0.0)
+        self.assertEqual(injector.delay_for('search_books'), 0.0)
+
+    def test_config_from_json(self):
+        """Test configuration can be given as JSON text or a file."""
+        path = os.path.join(self.tmp_dir, 'latency.json')
+        with open(path, 'w') as f:
+            json.dump(LEGACY_CONFIG, f)
+        self.assertEqual(LatencyInjector(path).delay_for('add_book'), 0.5)
+        self.assertEqual(LatencyInjector('{"default": 1}').delay_for('x'), 1.0)
+
+    def test_invalid_config(self):
+        """Test bad configuration is rejected up front."""
+        for config in ('not json', {'default': {'distribution': 'zipf'}},
+                       {'default': {'distribution': 'uniform', 'low': 1}}):
+            with self.assertRaises(ValueError):
+                LatencyInjector(config)
+
+
+if __name__ == '__main__':
+    unittest.main()
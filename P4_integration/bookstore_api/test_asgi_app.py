@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Test script for the async (ASGI) Bookstore API
+
+This script exercises the Quart routes through their test client against a
+temporary catalog file.
+"""
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+import app as api
+import asgi_app
+import profiling
+from idempotency import SqliteIdempotencyStore
+from latency import LatencyInjector
+from storage import JournalStorage
+from store import BookStore
+
+
+class TestAsgiApp(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the async routes."""
+
+    def setUp(self):
+        """Point the API at a fresh temporary catalog."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp_dir, 'books.json')
+        self.original_state = (api.store, api.search_index, api.catalog_index,
+                               api.suggest_index, api.search_cache, api.change_log,
+                               api.response_cache, api.latency)
+        api.init_store(BookStore(self.data_file, default_books=api.SAMPLE_BOOKS,
+                                 flush_interval=0, reload_interval=0))
+        api.latency = LatencyInjector()
+        self.client = asgi_app.app.test_client()
+
+    def tearDown(self):
+        """Restore the real store and remove the temporary catalog."""
+        api.store.close()
+        (api.store, api.search_index, api.catalog_index,
+         api.suggest_index, api.search_cache, api.change_log,
+         api.response_cache, api.latency) = self.original_state
+        shutil.rmtree(self.tmp_dir)
+
+    async def test_get_books(self):
+        """Test listing all books matches the sync API."""
+        response = await self.client.get('/api/books')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await response.get_json(), api.SAMPLE_BOOKS)
+        self.assertEqual(response.headers['Access-Control-Allow-Origin'], '*')
+
+    async def test_get_book_not_modified(self):
+        """Test a book's ETag is honored by If-None-Match."""
+        response = await self.client.get('/api/books/2')
+        self.assertEqual((await response.get_json())['title'], '1984')
+        etag = response.headers['ETag']
+
+        response = await self.client.get('/api/books/2', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_not_found(self):
+        """Test missing books use the shared JSON error format."""
+        response = await self.client.get('/api/books/missing')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(await response.get_json(),
+                         {'error': 'Not Found', 'message': 'Book not found'})
+
+    async def test_crud(self):
+        """Test adding, updating and deleting a book persists each change."""
+        response = await self.client.post('/api/books', json={
+            'title': 'Dune', 'author': 'Frank Herbert', 'price': '9.5'
+        })
+        self.assertEqual(response.status_code, 201)
+        book_id = (await response.get_json())['id']
+
+        response = await self.client.put(f'/api/books/{book_id}', json={'price': 8})
+        self.assertEqual((await response.get_json())['price'], 8.0)
+        saved = {book['id']: book for book in JournalStorage(self.data_file).load()}
+        self.assertEqual(saved[book_id]['price'], 8.0)
+
+        response = await self.client.delete(f'/api/books/{book_id}')
+        self.assertEqual(response.status_code, 200)
+        saved = [book['id'] for book in JournalStorage(self.data_file).load()]
+        self.assertNotIn(book_id, saved)
+
+    async def test_add_book_invalid(self):
+        """Test validation errors use the shared JSON error format."""
+        response = await self.client.post('/api/books', json={'title': 'Dune'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((await response.get_json())['error'], 'Bad Request')
+
+    async def test_bulk_add(self):
+        """Test bulk creation reports per-item results."""
+        response = await self.client.post('/api/books/bulk', json=[
+            {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5},
+            {'title': 'Untitled'}
+        ])
+        body = await response.get_json()
+        self.assertEqual((body['succeeded'], body['failed']), (1, 1))
+        self.assertEqual(len(api.store), 4)
+
+    async def test_search(self):
+        """Test search is answered from the shared index."""
+        response = await self.client.get('/api/books/search?query=gatsby')
+        books = await response.get_json()
+        self.assertEqual([book['id'] for book in books], ['3'])
+
+        response = await self.client.get('/api/books/search')
+        self.assertEqual(response.status_code, 400)
+
+        response = await self.client.get('/api/books/search?query=gatbsy')
+        books = await response.get_json()
+        self.assertEqual([book['id'] for book in books], ['3'])
+        self.assertEqual(response.headers['X-Search-Mode'], 'fuzzy')
+
+    async def test_suggest(self):
+        """Test suggestions are answered from the shared index."""
+        response = await self.client.get('/api/books/suggest?prefix=great+g')
+        self.assertEqual(await response.get_json(), [
+            {'text': 'The Great Gatsby', 'field': 'title', 'books': 1},
+        ])
+
+        response = await self.client.get('/api/books/suggest')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_changes(self):
+        """Test the change feed is shared with the sync API."""
+        await self.client.put('/api/books/3', json={'price': 5})
+        response = await self.client.get('/api/books/changes?since=0')
+        body = await response.get_json()
+        self.assertEqual([(c['type'], c['id']) for c in body['changes']], [('update', '3')])
+        self.assertEqual(body['epoch'], api.change_log.epoch)
+
+        response = await self.client.get(f"/api/books/changes?since=9&epoch={body['epoch']}")
+        self.assertEqual(response.status_code, 410)
+
+    async def test_metrics(self):
+        """Test /metrics counts async requests in the shared registry."""
+        await self.client.get('/api/books/2')
+        response = await self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        text = (await response.get_data()).decode()
+        self.assertIn('bookstore_requests_total{endpoint="get_book",method="GET",status="200"}',
+                      text)
+        self.assertIn('bookstore_catalog_books 3', text)
+
+    async def test_profiles(self):
+        """Test requests that ask for it are profiled and their profiles listed."""
+        response = await self.client.get('/api/profiles')
+        self.assertEqual(response.status_code, 404)
+
+        self.addCleanup(setattr, api, 'profiler', api.profiler)
+        api.profiler = profiling.Profiler('on')
+        response = await self.client.get('/api/books/search?query=great&profile=1')
+        profile_id = response.headers['X-Profile-Id']
+        profiles = await (await self.client.get('/api/profiles')).get_json()
+        self.assertEqual([p['id'] for p in profiles], [profile_id])
+        response = await self.client.get(f'/api/profiles/{profile_id}')
+        self.assertEqual(response.mimetype, 'text/plain')
+        response = await self.client.get('/api/profiles/missing')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_idempotent_add(self):
+        """Test retries with an Idempotency-Key replay the first response."""
+        body = {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5}
+        headers = {'Idempotency-Key': 'add-dune'}
+        original_keys = api.idempotency_keys
+        api.idempotency_keys = SqliteIdempotencyStore(f"{self.data_file}.keys")
+        try:
+            first = await self.client.post('/api/books', json=body, headers=headers)
+            retry = await self.client.post('/api/books', json=body, headers=headers)
+        finally:
+            api.idempotency_keys.close()
+            api.idempotency_keys = original_keys
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(await retry.get_json(), await first.get_json())
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(len(api.store), 4)
+
+    async def test_stream_ndjson(self):
+        """Test streamed listings produce one book per line."""
+        response = await self.client.get('/api/books?stream=ndjson&fields=id')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = (await response.get_data(as_text=True)).splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{'id': '1'}, {'id': '2'}, {'id': '3'}])
+
+    async def test_paged_listing(self):
+        """Test pagination headers match the sync API."""
+        response = await self.client.get('/api/books?limit=2')
+        self.assertEqual(len(await response.get_json()), 2)
+        cursor = response.headers['X-Next-Cursor']
+
+        response = await self.client.get(f'/api/books?limit=2&cursor={cursor}')
+        self.assertEqual([book['id'] for book in await response.get_json()], ['3'])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
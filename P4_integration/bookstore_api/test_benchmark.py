@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test script for the benchmark harness
+
+This script checks catalog generation, result statistics and short runs over
+both transports.
+"""
+import unittest
+import json
+import os
+import tempfile
+
+import app as api
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """Test cases for benchmark.py."""
+
+    def test_generate_catalog(self):
+        """Test catalogs are reproducible from the seed, with unique IDs."""
+        books = benchmark.generate_catalog(500, seed=1)
+        self.assertEqual(books, benchmark.generate_catalog(500, seed=1))
+        self.assertNotEqual(books, benchmark.generate_catalog(500, seed=2))
+        self.assertEqual(len({book['id'] for book in books}), 500)
+
+    def test_parse_mix(self):
+        """Test request mixes are parsed and validated."""
+        self.assertEqual(benchmark.parse_mix('get_book=3,search'),
+                         {'get_book': 3.0, 'search': 1.0})
+        for mix in ('fetch=1', 'search=x', 'search=0', 'get_book=-1'):
+            with self.assertRaises(ValueError):
+                benchmark.parse_mix(mix)
+
+    def test_phases_draw_different_requests(self):
+        """Test the measured run doesn't replay the warmup's requests."""
+        workload = benchmark.Workload(benchmark.generate_catalog(100), {'get_book': 1})
+        warmup = [workload.next_request(workload.rng(0, 'warmup')) for _ in range(5)]
+        measured = [workload.next_request(workload.rng(0)) for _ in range(5)]
+        self.assertNotEqual(warmup, measured)
+        self.assertEqual(measured, [workload.next_request(workload.rng(0)) for _ in range(5)])
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 0.5), 50)
+        self.assertEqual(benchmark.percentile(values, 0.99), 99)
+        self.assertEqual(benchmark.percentile([7], 0.95), 7)
+        self.assertEqual(benchmark.percentile([], 0.95), 0.0)
+
+    def test_compare(self):
+        """Test regressions beyond the tolerance are reported."""
+        baseline = {'throughput_rps': 1000, 'operations': {'search': {'p95_ms': 10}}}
+        result = {'throughput_rps': 900, 'operations': {'search': {'p95_ms': 11}}}
+        self.assertEqual(benchmark.compare(result, baseline, 0.2), [])
+        result = {'throughput_rps': 700, 'operations': {'search': {'p95_ms': 13}}}
+        self.assertEqual(len(benchmark.compare(result, baseline, 0.2)), 2)
+
+    def test_runs(self):
+        """Test short runs over both transports complete without errors."""
+        for name in ('store', 'search_index', 'catalog_index', 'suggest_index',
+                     'search_cache', 'change_log', 'response_cache', 'latency'):
+            self.addCleanup(setattr, api, name, getattr(api, name))
+
+        with tempfile.TemporaryDirectory() as directory:
+            results = os.path.join(directory, 'results.json')
+            for transport in ('inprocess', 'http'):
+                status = benchmark.main([
+                    '--books', '300', '--requests', '200', '--warmup', '20',
+                    '--threads', '2', '--transport', transport, '--json', results
+                ])
+                self.assertEqual(status, 0)
+                with open(results) as f:
+                    result = json.load(f)
+                self.assertEqual(result['requests'], 200)
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['throughput_rps'], 0)
+                self.assertEqual(set(result['operations']),
+                                 set(benchmark.parse_mix(benchmark.DEFAULT_MIX)))
+
+
+if __name__ == '__main__':
+    unittest.main()
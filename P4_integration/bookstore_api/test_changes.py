@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore change feed
+
+This script tests the change log directly, independent of the API.
+"""
+import threading
+import unittest
+
+from changes import ChangeLog, ChangeLogGone, format_event, parse_event_id, parse_since
+
+
+def make_book(book_id, title='Untitled'):
+    """Helper to build a minimal book record."""
+    return {'id': book_id, 'title': title, 'author': 'Anon',
+            'price': 1.0, 'in_stock': True}
+
+
+class TestChangeLog(unittest.TestCase):
+    """Test cases for the sequenced change log."""
+
+    def setUp(self):
+        """Start a log that follows a one-book catalog."""
+        self.log = ChangeLog(max_changes=5)
+        self.log.on_change('reload', [make_book('1')])
+
+    def test_changes_are_sequenced(self):
+        """Test each changed book gets the next sequence number."""
+        self.assertEqual(self.log.last_seq, 0)
+        self.log.on_change('add', [make_book('2'), make_book('3')])
+        self.log.on_change('update', [make_book('2', 'Retitled')])
+        self.log.on_change('delete', [make_book('3')])
+
+        changes, more = self.log.read(0, None)
+        self.assertFalse(more)
+        self.assertEqual([(c['seq'], c['type'], c['id']) for c in changes],
+                         [(1, 'add', '2'), (2, 'add', '3'), (3, 'update', '2'),
+                          (4, 'delete', '3')])
+        self.assertEqual(changes[2]['book']['title'], 'Retitled')
+        self.assertIsNone(changes[3]['book'])
+
+    def test_read_since_and_limit(self):
+        """Test reading resumes after a sequence number, a page at a time."""
+        for i in range(4):
+            self.log.on_change('add', [make_book(f"b{i}")])
+        epoch = self.log.epoch
+        changes, more = self.log.read(1, epoch, limit=2)
+        self.assertEqual([c['seq'] for c in changes], [2, 3])
+        self.assertTrue(more)
+        self.assertEqual(self.log.read(4, epoch), ([], False))
+
+    def test_gone(self):
+        """Test dropped, future and foreign sequence numbers are refused."""
+        for i in range(7):
+            self.log.on_change('add', [make_book(f"b{i}")])
+        epoch = self.log.epoch
+        with self.assertRaises(ChangeLogGone):
+            self.log.read(1, epoch)
+        self.assertEqual([c['seq'] for c in self.log.read(2, epoch)[0]], [3, 4, 5, 6, 7])
+        with self.assertRaises(ChangeLogGone):
+            self.log.read(8, epoch)
+        for other in ('elsewhere', None):
+            with self.assertRaises(ChangeLogGone):
+                self.log.read(7, other)
+        self.assertEqual(self.log.read(7, epoch), ([], False))
+
+    def test_reload_logs_differences(self):
+        """Test a reload logs what changed since the previous catalog."""
+        self.log.on_change('add', [make_book('2')])
+        self.log.on_change('reload', [make_book('1', 'Retitled'), make_book('3')])
+        changes, _ = self.log.read(1, self.log.epoch)
+        self.assertEqual(sorted((c['type'], c['id']) for c in changes),
+                         [('add', '3'), ('delete', '2'), ('update', '1')])
+
+    def test_wait(self):
+        """Test waiting returns once a change arrives, or times out."""
+        self.assertFalse(self.log.wait(0, timeout=0.01))
+        timer = threading.Timer(0.05, self.log.on_change, ('add', [make_book('2')]))
+        timer.start()
+        self.assertTrue(self.log.wait(0, timeout=5))
+        timer.join()
+
+    def test_format_event(self):
+        """Test changes are formatted as Server-Sent Events."""
+        event = format_event({'seq': 7, 'type': 'delete', 'id': '2'}, 'ab12', str)
+        self.assertEqual(event, "id: ab12:7\nevent: delete\ndata: {'seq': 7, 'type': 'delete', "
+                                "'id': '2'}\n\n")
+        self.assertEqual(parse_event_id('ab12:7'), (7, 'ab12'))
+        for value in ('7', ':7', 'ab12:x'):
+            with self.assertRaises(ValueError):
+                parse_event_id(value)
+
+    def test_parse_since(self):
+        """Test since must be a non-negative integer."""
+        self.assertEqual(parse_since(None), 0)
+        self.assertEqual(parse_since('12'), 12)
+        for value in ('x', '-1'):
+            with self.assertRaises(ValueError):
+                parse_since(value)
+
+
+if __name__ == '__main__':
+    unittest.main()
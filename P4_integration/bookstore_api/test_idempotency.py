@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore idempotency key store
+
+This script tests remembering and replaying responses directly, independent
+of the API.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from idempotency import KeyInUse, KeyReused, SqliteIdempotencyStore, parse_key
+
+
+class TestIdempotencyStore(unittest.TestCase):
+    """Test cases for the bounded, expiring key store shared between processes."""
+
+    def setUp(self):
+        """Start a small shared store with a controllable clock."""
+        self.now = 0.0
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'books.json.keys')
+        self.keys = self.open()
+
+    def tearDown(self):
+        """Close the store and remove its database."""
+        self.keys.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def open(self):
+        """Helper to open another instance of the store, as another process would."""
+        return SqliteIdempotencyStore(self.path, max_keys=2, ttl=60, running_ttl=5,
+                                      clock=lambda: self.now)
+
+    def test_replay(self):
+        """Test a completed request is replayed to retries with its key."""
+        self.assertIsNone(self.keys.begin('k1', 'body'))
+        self.keys.complete('k1', {'id': 'a'}, 201)
+        self.assertEqual(self.keys.begin('k1', 'body'), ({'id': 'a'}, 201))
+        self.assertEqual(self.keys.stats(), {'replays': 1, 'keys': 1})
+
+    def test_in_progress_and_reused(self):
+        """Test concurrent retries and different requests under one key are refused."""
+        self.keys.begin('k1', 'body')
+        with self.assertRaises(KeyInUse):
+            self.keys.begin('k1', 'body')
+        with self.assertRaises(KeyReused):
+            self.keys.begin('k1', 'other body')
+
+    def test_abandon(self):
+        """Test a failed request can be retried under its key."""
+        self.keys.begin('k1', 'body')
+        self.keys.abandon('k1')
+        self.assertIsNone(self.keys.begin('k1', 'body'))
+
+        # A completed request is not forgotten
+        self.keys.complete('k1', {}, 201)
+        self.keys.abandon('k1')
+        self.assertEqual(self.keys.begin('k1', 'body'), ({}, 201))
+
+    def test_bounded_and_expiring(self):
+        """Test the oldest keys are dropped when full, and keys expire."""
+        for key in ('k1', 'k2', 'k3'):
+            self.keys.begin(key, 'body')
+            self.keys.complete(key, {}, 201)
+        self.assertEqual(len(self.keys), 2)
+        self.assertIsNone(self.keys.begin('k1', 'body'))
+
+        self.now = 60
+        self.assertIsNone(self.keys.begin('k2', 'body'))
+        self.assertEqual(len(self.keys), 1)
+
+    def test_parse_key(self):
+        """Test keys must be non-empty and not too long."""
+        self.assertIsNone(parse_key(None))
+        self.assertEqual(parse_key(' abc '), 'abc')
+        for value in ('', '   ', 'x' * 256):
+            with self.assertRaises(ValueError):
+                parse_key(value)
+
+
+    def test_opened_on_first_use(self):
+        """Test the database file is only created once a key is used."""
+        self.assertFalse(os.path.exists(self.path))
+        self.keys.begin('k1', 'body')
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_shared_between_instances(self):
+        """Test keys begun and completed in one instance are seen by another."""
+        other = self.open()
+        self.keys.begin(('POST', '/api/books', 'k1'), 'body')
+        with self.assertRaises(KeyInUse):
+            other.begin(('POST', '/api/books', 'k1'), 'body')
+        self.keys.complete(('POST', '/api/books', 'k1'), {'id': 'a'}, 201)
+        self.assertEqual(other.begin(('POST', '/api/books', 'k1'), 'body'), ({'id': 'a'}, 201))
+        other.close()
+
+    def test_running_keys_expire_sooner(self):
+        """Test a request that never finishes only holds its key briefly."""
+        self.keys.begin('k1', 'body')
+        self.now = 5
+        other = self.open()
+        self.assertIsNone(other.begin('k1', 'body'))
+        other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore catalog indexes
+
+This script tests the filter and sort indexes directly, independent of the API.
+"""
+import random
+import unittest
+
+from indexes import CatalogIndex, parse_query, sort_value
+
+
+def make_book(i, rng):
+    """Helper to build a random book record."""
+    return {'id': f"b{i:04d}", 'title': f"Title {rng.randint(0, 50)}",
+            'author': rng.choice(['Ann', 'Bob', 'Cy']),
+            'price': float(rng.randint(1, 40)), 'in_stock': rng.random() < 0.7}
+
+
+class TestCatalogIndex(unittest.TestCase):
+    """Test cases comparing index queries with a full scan."""
+
+    def setUp(self):
+        """Build an index over a random catalog."""
+        rng = random.Random(7)
+        self.books = [make_book(i, rng) for i in range(500)]
+        self.index = CatalogIndex()
+        self.index.rebuild(self.books)
+
+    def scan(self, sort='id', descending=False, in_stock=None, min_price=None,
+             max_price=None, author=None):
+        """Helper answering a query by filtering and sorting every book."""
+        books = [book for book in self.books
+                 if (in_stock is None or book['in_stock'] == in_stock)
+                 and (min_price is None or book['price'] >= min_price)
+                 and (max_price is None or book['price'] <= max_price)
+                 and (author is None or book['author'].lower() == author.lower())]
+        books.sort(key=lambda book: (sort_value(book, sort), book['id']), reverse=descending)
+        return [book['id'] for book in books]
+
+    def pages(self, limit, **query):
+        """Helper collecting every page of a query."""
+        ids, after = [], None
+        while True:
+            books, more = self.index.query(after=after, limit=limit, **query)
+            ids.extend(book['id'] for book in books)
+            if not more:
+                return ids
+            after = (sort_value(books[-1], query.get('sort', 'id')), books[-1]['id'])
+
+    def test_matches_scan(self):
+        """Test selective and broad queries, in both orders, match a scan."""
+        queries = [
+            {},
+            {'sort': 'price', 'in_stock': True, 'max_price': 15},
+            {'sort': 'title', 'descending': True, 'author': 'ann'},
+            {'sort': 'in_stock', 'min_price': 39},
+            {'sort': 'author', 'in_stock': False, 'min_price': 5, 'max_price': 30},
+            {'sort': 'price', 'descending': True, 'author': 'Cy', 'in_stock': True},
+            {'sort': 'title', 'author': 'bob', 'min_price': 2, 'max_price': 3},
+            {'sort': 'title', 'descending': True, 'in_stock': False, 'min_price': 10,
+             'max_price': 35},
+        ]
+        for query in queries:
+            expected = self.scan(**query)
+            books, more = self.index.query(**query)
+            self.assertEqual([book['id'] for book in books], expected, query)
+            self.assertFalse(more)
+            self.assertEqual(self.pages(7, **query), expected, query)
+
+    def test_incremental_updates(self):
+        """Test adds, updates and deletes keep the indexes consistent."""
+        rng = random.Random(8)
+        for i in range(500, 600):
+            book = make_book(i, rng)
+            self.books.append(book)
+            self.index.on_change('add', [book])
+        for position in rng.sample(range(len(self.books)), 50):
+            book = dict(self.books[position], price=float(rng.randint(1, 40)),
+                        author='Dee')
+            self.books[position] = book
+            self.index.on_change('update', [book])
+        for book in rng.sample(self.books, 50):
+            self.books.remove(book)
+            self.index.on_change('delete', [book])
+
+        for query in ({'sort': 'price'}, {'author': 'dee', 'sort': 'price', 'descending': True},
+                      {'in_stock': True, 'min_price': 10, 'sort': 'title'}):
+            books, _ = self.index.query(**query)
+            self.assertEqual([book['id'] for book in books], self.scan(**query))
+
+    def test_parse_query(self):
+        """Test only listings with filter or sort parameters are queries."""
+        self.assertIsNone(parse_query({'limit': '10'}))
+        self.assertEqual(parse_query({'sort': '-price', 'in_stock': 'no'}),
+                         {'sort': 'price', 'descending': True, 'in_stock': False})
+        for args in ({'sort': 'isbn'}, {'max_price': 'x'}, {'in_stock': '2'}):
+            with self.assertRaises(ValueError):
+                parse_query(args)
+
+
+if __name__ == '__main__':
+    unittest.main()
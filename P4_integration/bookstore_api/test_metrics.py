@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test script for the metrics module
+
+This script tests the metric types, their text format and phase timing.
+"""
+import unittest
+import time
+
+import metrics
+from storage import Storage
+
+
+class TestMetrics(unittest.TestCase):
+    """Test cases for counters, histograms, gauges and phases."""
+
+    def test_histogram_text_format(self):
+        """Test buckets are cumulative and followed by +Inf, sum and count."""
+        registry = metrics.Registry()
+        histogram = registry.histogram('latency_seconds', "Latency.", ('endpoint',),
+                                       buckets=(0.1, 1.0))
+        histogram.observe(0.05, endpoint='a')
+        histogram.observe(0.5, endpoint='a')
+        histogram.observe(5, endpoint='a')
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{endpoint="a",le="0.1"} 1',
+            'latency_seconds_bucket{endpoint="a",le="1.0"} 2',
+            'latency_seconds_bucket{endpoint="a",le="+Inf"} 3',
+            'latency_seconds_sum{endpoint="a"} 5.55',
+            'latency_seconds_count{endpoint="a"} 3',
+        ])
+
+    def test_counter_and_gauge(self):
+        """Test counters accumulate per label set and gauges read a callback."""
+        registry = metrics.Registry()
+        counter = registry.counter('requests_total', "Requests.", ('status',))
+        counter.inc(status='200')
+        counter.inc(2, status='200')
+        counter.inc(status='4"4')
+        registry.gauge('books', "Books.", lambda: 7)
+
+        text = registry.render()
+        self.assertIn('requests_total{status="200"} 3\n', text)
+        self.assertIn('requests_total{status="4\\"4"} 1\n', text)
+        self.assertIn('# TYPE books gauge\nbooks 7\n', text)
+
+    def test_phases(self):
+        """Test phase time is only counted inside a request, once when nested."""
+        with metrics.phase('storage'):
+            pass
+        self.assertEqual(metrics.finish_request(), {})
+
+        metrics.start_request()
+        sleep = metrics.timed('storage', time.sleep)
+        with metrics.phase('storage'):
+            sleep(0.01)
+        metrics.add_phase('injected', 0.5)
+        timings = metrics.finish_request()
+        self.assertGreaterEqual(timings['storage'], 0.01)
+        self.assertLess(timings['storage'], 0.5)
+        self.assertEqual(timings['injected'], 0.5)
+
+    def test_instrument_storage(self):
+        """Test every storage read and write counts as storage time."""
+        class SlowStorage(Storage):
+            def changes_since(self, position):
+                time.sleep(0.01)
+
+        storage = metrics.instrument_storage(SlowStorage())
+        metrics.start_request()
+        storage.changes_since(0)
+        self.assertGreaterEqual(metrics.finish_request()['storage'], 0.01)
+
+        for name in metrics.STORAGE_METHODS:
+            self.assertTrue(hasattr(getattr(storage, name), '__wrapped__'), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
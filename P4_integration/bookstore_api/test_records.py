@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore book records
+
+This script tests the compact record type directly, independent of the API.
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from records import Book, json_default
+from store import BookStore, fingerprint
+
+BOOK = {'id': '1', 'title': 'To Kill a Mockingbird', 'author': 'Harper Lee',
+        'price': 12.99, 'in_stock': True}
+
+
+class TestBook(unittest.TestCase):
+    """Test cases for the slotted book record."""
+
+    def test_reads_like_a_dict(self):
+        """Test a record has the same fields, by attribute and by key."""
+        book = Book.from_dict(BOOK)
+        self.assertEqual(book.price, 12.99)
+        self.assertEqual(book['title'], 'To Kill a Mockingbird')
+        self.assertEqual(book, BOOK)
+        self.assertEqual(list(book), list(BOOK))
+        self.assertEqual(book.get('isbn', 'none'), 'none')
+        with self.assertRaises(KeyError):
+            book['isbn']
+
+    def test_partial_and_extra_fields_round_trip(self):
+        """Test missing fields stay missing and unknown ones are kept."""
+        data = {'id': '2', 'title': 'Untitled', 'isbn': '978-0'}
+        book = Book.from_dict(data)
+        self.assertNotIn('author', book)
+        self.assertEqual(book['isbn'], '978-0')
+        self.assertEqual(book.to_dict(), data)
+
+    def test_replace_makes_a_new_record(self):
+        """Test changes leave the original record untouched."""
+        book = Book.from_dict(BOOK)
+        changed = book.replace(price=9.99)
+        self.assertEqual((book.price, changed.price), (12.99, 9.99))
+        self.assertIsInstance(changed, Book)
+
+    def test_serialization_matches_dicts(self):
+        """Test records serialize, and fingerprint, exactly like book dicts."""
+        book = Book.from_dict(BOOK)
+        self.assertEqual(json.dumps(book, default=json_default), json.dumps(BOOK))
+        self.assertEqual(fingerprint(book), fingerprint(BOOK))
+
+    def test_compact(self):
+        """Test records are smaller than dicts and share author strings."""
+        book = Book.from_dict(BOOK)
+        self.assertLess(sys.getsizeof(book) * 2, sys.getsizeof(dict(BOOK)))
+        other = Book.from_dict(dict(BOOK, author=''.join(['Harper', ' Lee'])))
+        self.assertIs(book.author, other.author)
+
+    def test_store_holds_records(self):
+        """Test the store converts loaded and added books to records."""
+        with tempfile.TemporaryDirectory() as directory:
+            store = BookStore(os.path.join(directory, 'books.json'),
+                              default_books=[BOOK], flush_interval=0)
+            try:
+                self.assertIsInstance(store.get('1'), Book)
+                added = store.add(dict(BOOK, id='2'))
+                self.assertIs(store.get('2'), added)
+                self.assertIsInstance(store.update('2', {'price': 1.0}), Book)
+            finally:
+                store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
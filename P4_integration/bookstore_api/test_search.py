@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore search index
+
+This script tests the inverted index directly, independent of the API.
+"""
+import random
+import unittest
+
+from cache import SearchCache
+from search import SearchIndex, edit_distance
+
+
+def make_book(book_id, title, author='Anon'):
+    """Helper to build a minimal book record."""
+    return {'id': book_id, 'title': title, 'author': author,
+            'price': 1.0, 'in_stock': True}
+
+
+class TestSearchIndex(unittest.TestCase):
+    """Test cases for the inverted token index."""
+
+    def setUp(self):
+        """Build an index over a handful of books."""
+        self.index = SearchIndex()
+        self.index.rebuild([
+            make_book('1', 'To Kill a Mockingbird', 'Harper Lee'),
+            make_book('2', '1984', 'George Orwell'),
+            make_book('3', 'The Great Gatsby', 'F. Scott Fitzgerald'),
+        ])
+
+    def test_substring_matches(self):
+        """Test queries match anywhere in the title or author."""
+        self.assertEqual(self.index.search('kill a'), ['1'])
+        self.assertEqual(self.index.search('GERALD'), ['3'])
+        self.assertEqual(self.index.search('nothing here'), [])
+
+    def test_short_queries(self):
+        """Test queries shorter than a trigram still match."""
+        self.assertEqual(self.index.search('19'), ['2'])
+        self.assertEqual(sorted(self.index.search('g')), ['1', '2', '3'])
+
+    def test_title_ranks_above_author(self):
+        """Test a title match outranks an author match."""
+        self.index.add(make_book('4', 'Harper Valley', 'Someone'))
+        self.assertEqual(self.index.search('harper'), ['4', '1'])
+
+    def test_incremental_updates(self):
+        """Test add, update and remove keep posting lists consistent."""
+        self.index.on_change('update', [make_book('2', 'Animal Farm', 'George Orwell')])
+        self.assertEqual(self.index.search('1984'), [])
+        self.assertEqual(self.index.search('farm'), ['2'])
+
+        self.index.on_change('delete', [make_book('2', 'Animal Farm')])
+        self.assertEqual(self.index.search('orwell'), [])
+        self.assertEqual(len(self.index), 2)
+
+        # No empty posting lists are left behind
+        self.assertNotIn('far', self.index._grams)
+        self.assertNotIn('farm', self.index._words)
+
+    def test_prefix_search(self):
+        """Test the last term is completed and earlier ones are whole words."""
+        self.assertEqual(self.index.prefix_search('great gats'), ['3'])
+        self.assertEqual(self.index.prefix_search('mock'), ['1'])
+        self.assertEqual(self.index.prefix_search('gre gats'), [])
+        self.assertEqual(self.index.prefix_search('g', limit=1),
+                         self.index.prefix_search('g')[:1])
+
+    def test_fuzzy_search(self):
+        """Test terms match words within a few typos."""
+        self.assertEqual(self.index.fuzzy_search('gatsbi'), ['3'])
+        self.assertEqual(self.index.fuzzy_search('orwel'), ['2'])
+        self.assertEqual(self.index.fuzzy_search('mockingbrd harpr'), ['1'])
+        self.assertEqual(self.index.fuzzy_search('zzz'), [])
+
+        # Closer matches rank first
+        self.index.add(make_book('4', 'Gatsbe', 'Someone'))
+        self.assertEqual(self.index.fuzzy_search('gatsby'), ['3', '4'])
+
+    def test_vocabulary_follows_updates(self):
+        """Test words leave the vocabulary with their last book."""
+        self.index.on_change('update', [make_book('2', 'Animal Farm', 'George Orwell')])
+        self.assertEqual(self.index.fuzzy_search('farn'), ['2'])
+
+        self.index.on_change('delete', [make_book('2', 'Animal Farm')])
+        self.assertEqual(self.index.fuzzy_search('farn'), [])
+        self.assertNotIn('farm', self.index._vocab)
+        self.assertNotIn('orwell', self.index._vocab)
+
+    def test_restore_rebuilds_vocabulary(self):
+        """Test a restored index supports fuzzy and prefix search."""
+        books = [make_book('1', 'To Kill a Mockingbird', 'Harper Lee'),
+                 make_book('2', '1984', 'George Orwell')]
+        self.index.rebuild(books)
+        restored = SearchIndex()
+        restored.restore(self.index.dump(books), books)
+        self.assertEqual(restored.fuzzy_search('mockinbird'), ['1'])
+        self.assertEqual(restored.prefix_search('geo'), ['2'])
+
+
+class TestEditDistance(unittest.TestCase):
+    """Test cases for the bounded edit distance."""
+
+    def test_distances(self):
+        """Test insertions, deletions, substitutions and transpositions."""
+        self.assertEqual(edit_distance('gatsby', 'gatsby', 2), 0)
+        self.assertEqual(edit_distance('gatsby', 'gatsbi', 2), 1)
+        self.assertEqual(edit_distance('orwell', 'orwel', 2), 1)
+        self.assertEqual(edit_distance('harper', 'hapre', 2), 2)
+        self.assertEqual(edit_distance('recieve', 'receive', 2), 1)
+
+    def test_limit(self):
+        """Test distances past the limit are reported as limit + 1."""
+        self.assertEqual(edit_distance('kitten', 'sitting', 1), 2)
+        self.assertEqual(edit_distance('a', 'abcdef', 2), 3)
+
+
+class TestSearchCache(unittest.TestCase):
+    """Test cases for the search result cache and its invalidation."""
+
+    def setUp(self):
+        """Start a cache that follows a small catalog."""
+        self.now = 0.0
+        self.cache = SearchCache(max_entries=3, ttl=10, clock=lambda: self.now)
+        self.cache.on_change('reload', [
+            make_book('1', 'To Kill a Mockingbird', 'Harper Lee'),
+            make_book('2', '1984', 'George Orwell'),
+        ])
+
+    def put(self, query, mode, ids):
+        """Helper to cache a search result."""
+        self.cache.put(query, mode, ids, self.cache.generation)
+
+    def test_hits_and_misses(self):
+        """Test results are found by normalized query and counted."""
+        self.assertIsNone(self.cache.get('Orwell', 'substring'))
+        self.put('Orwell', 'substring', ['2'])
+        self.assertEqual(self.cache.get('ORWELL', 'substring'), ['2'])
+        self.assertIsNone(self.cache.get('orwell', 'fuzzy'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 2, 1))
+
+    def test_lru_and_ttl(self):
+        """Test the least recently used entry is evicted and entries expire."""
+        for query in ('a', 'b', 'c'):
+            self.put(query, 'substring', [])
+        self.cache.get('a', 'substring')
+        self.put('d', 'substring', [])
+        self.assertIsNone(self.cache.get('b', 'substring'))
+        self.assertEqual(self.cache.get('a', 'substring'), [])
+
+        self.now = 10
+        self.assertIsNone(self.cache.get('a', 'substring'))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_only_affected_searches_invalidated(self):
+        """Test a write drops just the searches it could change."""
+        self.put('orwell', 'substring', ['2'])
+        self.put('mockingbird', 'substring', ['1'])
+        self.put('farm', 'prefix', [])
+
+        # Price changes and unrelated titles leave both in place
+        self.cache.on_change('update', [dict(make_book('2', '1984', 'George Orwell'), price=9)])
+        self.cache.on_change('add', [make_book('3', 'Dune', 'Frank Herbert')])
+        self.assertEqual(self.cache.get('orwell', 'substring'), ['2'])
+        self.assertEqual(self.cache.stats()['invalidations'], 0)
+
+        # Renaming book 2 affects the search that found it and the one it now matches
+        self.cache.on_change('update', [make_book('2', 'Animal Farm', 'George Orwell')])
+        self.assertEqual(self.cache.get('orwell', 'substring'), None)
+        self.assertEqual(self.cache.get('farm', 'prefix'), None)
+        self.assertEqual(self.cache.get('mockingbird', 'substring'), ['1'])
+
+    def test_fuzzy_searches_invalidated_by_typos(self):
+        """Test a book a fuzzy search would match despite typos drops it."""
+        self.put('gatsbi', 'fuzzy', [])
+        self.cache.on_change('add', [make_book('3', 'The Great Gatsby')])
+        self.assertIsNone(self.cache.get('gatsbi', 'fuzzy'))
+
+    def test_stale_result_not_stored(self):
+        """Test a result computed before a write is not cached after it."""
+        generation = self.cache.generation
+        self.cache.on_change('add', [make_book('3', 'Keep the Aspidistra Flying')])
+        self.cache.put('aspidistra', 'substring', [], generation)
+        self.assertIsNone(self.cache.get('aspidistra', 'substring'))
+
+    def test_never_serves_stale_results(self):
+        """Test cached results always equal a fresh search after random writes."""
+        rng = random.Random(3)
+        vocabulary = ['orwell', 'orwel', 'farm', 'animal', 'tale', 'tail', 'mock', 'ox']
+        index = SearchIndex()
+        cache = SearchCache(max_entries=100)
+        books = {}
+        index.on_change('reload', [])
+        cache.on_change('reload', [])
+        searches = {'substring': index.search, 'prefix': index.prefix_search,
+                    'fuzzy': index.fuzzy_search}
+        queries = ['orwell', 'farm an', 'ta', 'o', 'taile', 'mok ox']
+
+        for step in range(300):
+            book_id = str(rng.randrange(20))
+            if book_id in books and rng.random() < 0.3:
+                event, book = 'delete', books.pop(book_id)
+            else:
+                event = 'update' if book_id in books else 'add'
+                book = make_book(book_id, ' '.join(rng.sample(vocabulary, 2)),
+                                 rng.choice(vocabulary))
+                if rng.random() < 0.3 and book_id in books:
+                    book = dict(books[book_id], price=2.0)
+                books[book_id] = book
+            for listener in (index.on_change, cache.on_change):
+                listener(event, [book])
+
+            for mode, search in searches.items():
+                query = rng.choice(queries)
+                fresh = search(query)
+                cached = cache.get(query, mode)
+                if cached is None:
+                    cache.put(query, mode, fresh, cache.generation)
+                else:
+                    self.assertEqual(cached, fresh, (mode, query))
+        self.assertGreater(cache.stats()['hits'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script for the multi-process launcher
+
+This script starts serve.py with several workers on a temporary catalog and
+checks every worker serves writes made through any other.
+"""
+import unittest
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), "serve.py needs os.fork()")
+class TestServe(unittest.TestCase):
+    """Test cases for serve.py."""
+
+    def setUp(self):
+        """Start the launcher with three workers on a free port."""
+        self.tmp_dir = tempfile.mkdtemp()
+        env = dict(os.environ, BOOKSTORE_LATENCY='off')
+        self.process = subprocess.Popen(
+            [sys.executable, 'serve.py', '--port', '0', '--workers', '3',
+             '--storage', 'sqlite:///' + os.path.join(self.tmp_dir, 'books.db')],
+            cwd=HERE, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True
+        )
+        banner = self.process.stdout.readline()
+        self.base_url = banner.split()[4]
+
+    def tearDown(self):
+        """Stop the launcher and its workers."""
+        self.process.send_signal(signal.SIGTERM)
+        self.process.wait(10)
+        self.process.stdout.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def request(self, method, path, data=None):
+        """Helper to make a JSON request and decode the response."""
+        body = json.dumps(data).encode() if data is not None else None
+        request = Request(self.base_url + path, data=body, method=method,
+                          headers={'Content-Type': 'application/json'})
+        with urlopen(request, timeout=10) as response:
+            return json.load(response)
+
+    def test_workers_share_writes(self):
+        """Test a write through one worker is served by all of them."""
+        self.assertEqual(len(self.request('GET', '/api/books')), 3)
+        book = self.request('POST', '/api/books',
+                            {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5})
+
+        # Connections are spread over the workers; each must see the new book
+        for _ in range(12):
+            self.assertEqual(self.request('GET', f"/api/books/{book['id']}"), book)
+            self.assertEqual(len(self.request('GET', '/api/books')), 4)
+
+    def test_listing_etag_is_shared(self):
+        """Test every worker gives the listing the same ETag."""
+        self.request('POST', '/api/books',
+                     {'title': 'Dune', 'author': 'Frank Herbert', 'price': 9.5})
+        etags = set()
+        for _ in range(12):
+            with urlopen(self.base_url + '/api/books', timeout=10) as response:
+                etags.add(response.headers['ETag'])
+        self.assertEqual(len(etags), 1)
+
+    def test_change_feed_off(self):
+        """Test the per-worker change feed is not served by several workers."""
+        with self.assertRaises(HTTPError) as raised:
+            self.request('GET', '/api/books/changes')
+        self.assertEqual(raised.exception.code, 404)
+        raised.exception.close()
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), "serve.py needs os.fork()")
+class TestServeStartupFailure(unittest.TestCase):
+    """Test cases for workers that can't start."""
+
+    def test_gives_up(self):
+        """Test the launcher backs off and exits when workers keep dying."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        env = dict(os.environ, BOOKSTORE_LATENCY='no-such-profile')
+        result = subprocess.run(
+            [sys.executable, 'serve.py', '--port', '0', '--workers', '2',
+             '--storage', 'sqlite:///' + os.path.join(tmp_dir, 'books.db')],
+            cwd=HERE, env=env, capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(result.returncode, 1)
+        self.assertIn('restarting in 0.5s', result.stderr)
+        self.assertIn('giving up', result.stderr)
+
+    def test_change_feed_needs_one_worker(self):
+        """Test asking for the change feed with several workers is refused."""
+        env = dict(os.environ, BOOKSTORE_CHANGE_FEED='on')
+        result = subprocess.run(
+            [sys.executable, 'serve.py', '--port', '0', '--workers', '2'],
+            cwd=HERE, env=env, capture_output=True, text=True, timeout=60
+        )
+        self.assertEqual(result.returncode, 2)
+        self.assertIn('--workers 1', result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore storage backends
+
+This script tests the JSON, snapshot and SQLite backends and the book store
+running on top of them.
+"""
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+import threading
+
+from search import SearchIndex
+import snapshot
+from storage import (
+    FileLock, JournalStorage, JsonStorage, SnapshotStorage, SqliteStorage,
+    copy_catalog, open_storage
+)
+from store import BookStore
+
+SAMPLE_BOOKS = [
+    {'id': '1', 'title': 'To Kill a Mockingbird', 'author': 'Harper Lee',
+     'price': 12.99, 'in_stock': True},
+    {'id': '2', 'title': '1984', 'author': 'George Orwell',
+     'price': 10.99, 'in_stock': True},
+    {'id': '3', 'title': 'The Great Gatsby', 'author': 'F. Scott Fitzgerald',
+     'price': 11.5, 'in_stock': False},
+]
+
+
+class StorageTestCase(unittest.TestCase):
+    """Shared fixtures for storage tests."""
+
+    def setUp(self):
+        """Create a temporary directory for storage files."""
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the temporary directory."""
+        shutil.rmtree(self.tmp_dir)
+
+    def path(self, name):
+        """Helper to build a path inside the temporary directory."""
+        return os.path.join(self.tmp_dir, name)
+
+
+class TestFileLock(StorageTestCase):
+    """Test cases for the cross-process write lock."""
+
+    def test_excludes_other_lock_files(self):
+        """Test a second lock on the same file waits for the first."""
+        first = FileLock(self.path('books.json.lock'))
+        second = FileLock(self.path('books.json.lock'))
+        acquired = threading.Event()
+
+        def take_second():
+            with second:
+                acquired.set()
+
+        with first:
+            with first:
+                thread = threading.Thread(target=take_second)
+                thread.start()
+                self.assertFalse(acquired.wait(0.1))
+            self.assertFalse(acquired.wait(0.1))
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        first.close()
+        second.close()
+
+
+class TestChangeCounter(StorageTestCase):
+    """Test cases for the shared change counter."""
+
+    def test_writes_are_seen_by_other_instances(self):
+        """Test every write bumps the count seen through another instance."""
+        storage = JournalStorage(self.path('books.json'), SAMPLE_BOOKS)
+        other = JournalStorage(self.path('books.json'))
+        storage.load()
+        count = other.change_count()
+
+        storage.apply([('delete', '1')], lambda: [])
+        self.assertEqual(other.change_count(), count + 1)
+        storage.close()
+        other.close()
+
+
+class TestJsonStorage(StorageTestCase):
+    """Test cases for the JSON file backend."""
+
+    def test_seeds_missing_file(self):
+        """Test a missing file is created with the default books."""
+        storage = JsonStorage(self.path('books.json'), SAMPLE_BOOKS)
+        self.assertEqual(storage.load(), SAMPLE_BOOKS)
+        self.assertTrue(os.path.exists(self.path('books.json')))
+
+    def test_apply_rewrites_everything(self):
+        """Test a batch of changes rewrites the whole file."""
+        storage = JsonStorage(self.path('books.json'))
+        storage.apply([('delete', '1')], lambda: SAMPLE_BOOKS[1:])
+        self.assertEqual(storage.load(), SAMPLE_BOOKS[1:])
+
+
+class TestJournalStorage(StorageTestCase):
+    """Test cases for the JSON snapshot plus append-only journal backend."""
+
+    def setUp(self):
+        """Create a journaled catalog seeded with the sample books."""
+        super().setUp()
+        self.storage = JournalStorage(self.path('books.json'), SAMPLE_BOOKS)
+        self.storage.load()
+
+    def read_snapshot(self):
+        """Helper to read the snapshot file without replaying the journal."""
+        return JsonStorage(self.path('books.json')).load()
+
+    def test_apply_appends_to_journal(self):
+        """Test changes are appended to the log, not written to the snapshot."""
+        added = {'id': '4', 'title': 'Dune', 'author': 'Frank Herbert',
+                 'price': 9.5, 'in_stock': True}
+        with patch.object(JsonStorage, 'save') as mock_save:
+            self.storage.apply([('put', added), ('delete', '1')], lambda: [])
+            mock_save.assert_not_called()
+
+        with open(self.storage.log_path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+        self.assertEqual(self.read_snapshot(), SAMPLE_BOOKS)
+
+        # Startup replays the journal on top of the snapshot, then compacts
+        reloaded = JournalStorage(self.path('books.json')).load()
+        self.assertEqual(reloaded, SAMPLE_BOOKS[1:] + [added])
+        self.assertEqual(self.read_snapshot(), reloaded)
+        self.assertEqual(os.path.getsize(self.storage.log_path), 0)
+
+    def test_compaction(self):
+        """Test the journal is folded into the snapshot once it is long."""
+        self.storage.compact_every = 2
+        books = [dict(book) for book in SAMPLE_BOOKS]
+        books[0]['price'] = 1.0
+        self.storage.apply([('put', books[0])], lambda: books)
+        self.assertEqual(self.read_snapshot(), SAMPLE_BOOKS)
+
+        self.storage.apply([('delete', '3')], lambda: books[:2])
+        self.assertEqual(self.read_snapshot(), books[:2])
+        self.assertEqual(os.path.getsize(self.storage.log_path), 0)
+
+    def test_reload_does_not_compact(self):
+        """Test only the first load compacts a short journal."""
+        self.storage.apply([('delete', '2')], lambda: [])
+        with patch.object(JsonStorage, 'save') as mock_save:
+            books = self.storage.load()
+            mock_save.assert_not_called()
+        self.assertEqual([b['id'] for b in books], ['1', '3'])
+        self.assertEqual(self.read_snapshot(), SAMPLE_BOOKS)
+
+        # ...unless it has grown long
+        self.storage.compact_every = 1
+        self.storage.load()
+        self.assertEqual(self.read_snapshot(), books)
+        self.assertEqual(os.path.getsize(self.storage.log_path), 0)
+
+    def test_changes_since(self):
+        """Test another instance reads just the journal's new entries."""
+        other = JournalStorage(self.path('books.json'))
+        other.load()
+        position = other.position()
+        self.storage.apply([('delete', '2')], lambda: [])
+        changes, position = other.changes_since(position)
+        self.assertEqual(changes, [('delete', '2')])
+        self.assertEqual(other.changes_since(position), ([], position))
+
+        # Compaction folds the journal away, so the entries can't be told
+        self.storage.save(SAMPLE_BOOKS)
+        self.assertIsNone(other.changes_since(position))
+        other.close()
+
+    def test_torn_append_is_ignored(self):
+        """Test a partially written final entry is dropped on load."""
+        self.storage.apply([('delete', '2')], lambda: [])
+        with open(self.storage.log_path, 'a') as f:
+            f.write('{"op": "delete", "id": "1"')
+
+        books = JournalStorage(self.path('books.json')).load()
+        self.assertEqual([b['id'] for b in books], ['1', '3'])
+
+    def test_replay_is_idempotent(self):
+        """Test replaying a journal already folded into the snapshot is harmless."""
+        self.storage.apply([('delete', '2')], lambda: [])
+        with open(self.storage.log_path) as f:
+            journal = f.read()
+        JsonStorage(self.path('books.json')).save([SAMPLE_BOOKS[0], SAMPLE_BOOKS[2]])
+
+        # Simulate a crash between writing the snapshot and truncating the log
+        with open(self.storage.log_path, 'w') as f:
+            f.write(journal)
+        books = JournalStorage(self.path('books.json')).load()
+        self.assertEqual([b['id'] for b in books], ['1', '3'])
+
+
+class TestSnapshotStorage(StorageTestCase):
+    """Test cases for the columnar snapshot backend."""
+
+    def test_round_trip(self):
+        """Test books, including ones that don't fit the columns, load unchanged."""
+        books = SAMPLE_BOOKS + [
+            {'id': '4', 'title': 'Dune', 'author': 'Frank Herbert', 'price': 9},
+            {'id': '5', 'title': 'Ubik \u00e9\U0001f600', 'author': 'Harper Lee',
+             'price': 7.5, 'in_stock': True, 'isbn': '978-0'},
+        ]
+        storage = SnapshotStorage(self.path('books.snap'), books)
+        storage.load()
+        loaded = SnapshotStorage(self.path('books.snap')).load()
+        self.assertEqual(loaded, books)
+        self.assertIs(loaded[0]['author'], loaded[4]['author'])
+        storage.close()
+
+    def test_journal(self):
+        """Test changes are journaled and folded into the snapshot on load."""
+        storage = SnapshotStorage(self.path('books.snap'), SAMPLE_BOOKS)
+        storage.load()
+        storage.apply([('delete', '1')], lambda: [])
+        self.assertEqual(SnapshotStorage(self.path('books.snap')).load(), SAMPLE_BOOKS[1:])
+        self.assertEqual(snapshot.read(self.path('books.snap'))[0], SAMPLE_BOOKS[1:])
+        storage.close()
+
+    def test_extras_only_while_current(self):
+        """Test checkpointed extra data is dropped once changes follow it."""
+        storage = SnapshotStorage(self.path('books.snap'), SAMPLE_BOOKS)
+        storage.checkpoint(SAMPLE_BOOKS, {'search': b'data'})
+        other = SnapshotStorage(self.path('books.snap'))
+        other.load()
+        self.assertEqual(other.load_extra('search'), b'data')
+
+        storage.apply([('delete', '1')], lambda: [])
+        self.assertIsNone(storage.load_extra('search'))
+        other.load()
+        self.assertIsNone(other.load_extra('search'))
+        storage.close()
+        other.close()
+
+    def test_malformed(self):
+        """Test a file that isn't a snapshot is reported as such."""
+        with open(self.path('books.snap'), 'wb') as f:
+            f.write(b'[{"id": "1"}]')
+        with self.assertRaises(snapshot.SnapshotError):
+            SnapshotStorage(self.path('books.snap')).load()
+
+        data = snapshot.encode(SAMPLE_BOOKS)
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.decode(data[:len(data) // 2])
+
+
+class TestStoreOnSnapshot(StorageTestCase):
+    """Test cases for the book store saving its indexes with a snapshot."""
+
+    def open_store(self):
+        """Helper to open a store over the snapshot with a search index."""
+        store = BookStore(SnapshotStorage(self.path('books.snap'), SAMPLE_BOOKS),
+                          flush_interval=0)
+        index = SearchIndex()
+        store.add_index('search', index)
+        return store, index
+
+    def test_index_restored_instead_of_rebuilt(self):
+        """Test a checkpointed search index is loaded, not rebuilt, on startup."""
+        store, index = self.open_store()
+        store.add({'id': '4', 'title': 'Dune', 'author': 'Frank Herbert',
+                   'price': 9.5, 'in_stock': True})
+        expected = index.search('he')
+        store.close()
+
+        store, index = self.open_store()
+        with patch.object(SearchIndex, 'rebuild') as mock_rebuild:
+            self.assertEqual(len(store), 4)
+            mock_rebuild.assert_not_called()
+        self.assertEqual(index.search('he'), expected)
+
+        # An unchanged catalog is not rewritten on close
+        with patch.object(SnapshotStorage, 'checkpoint') as mock_checkpoint:
+            store.close()
+            mock_checkpoint.assert_not_called()
+
+    def test_index_rebuilt_after_journaled_changes(self):
+        """Test the saved index is not used once the journal has changes."""
+        store, _ = self.open_store()
+        store.refresh()
+        store.close()
+        storage = SnapshotStorage(self.path('books.snap'))
+        storage.apply([('delete', '3')], lambda: [])
+        storage.close()
+
+        store, index = self.open_store()
+        self.assertEqual(len(store), 2)
+        self.assertEqual(index.search('gatsby'), [])
+        store.close()
+
+    def test_follows_other_stores_journal(self):
+        """Test another store's writes are replayed from the journal, not reloaded."""
+        store, index = self.open_store()
+        other, _ = self.open_store()
+        self.assertEqual(len(store), 3)
+        other.refresh()
+        with patch.object(store, 'load') as mock_load, \
+                patch.object(SearchIndex, 'rebuild') as mock_rebuild:
+            other.add({'id': '4', 'title': 'Dune', 'author': 'Frank Herbert',
+                       'price': 9.5, 'in_stock': True})
+            other.delete('3')
+            self.assertEqual(len(store), 3)
+            self.assertIsNone(store.get('3'))
+            mock_load.assert_not_called()
+            mock_rebuild.assert_not_called()
+        self.assertEqual(index.search('dune'), ['4'])
+        other.close()
+        store.close()
+
+
+class TestSqliteStorage(StorageTestCase):
+    """Test cases for the SQLite backend."""
+
+    def setUp(self):
+        """Open a fresh database seeded with the sample books."""
+        super().setUp()
+        self.storage = SqliteStorage(self.path('books.db'), SAMPLE_BOOKS)
+
+    def tearDown(self):
+        """Close the database."""
+        self.storage.close()
+        super().tearDown()
+
+    def test_seeds_empty_database(self):
+        """Test a new database is seeded with the default books."""
+        self.assertEqual(self.storage.load(), SAMPLE_BOOKS)
+
+        # Only once: a catalog emptied later stays empty
+        self.storage.apply([('delete', book['id']) for book in SAMPLE_BOOKS], lambda: [])
+        reopened = SqliteStorage(self.path('books.db'), SAMPLE_BOOKS)
+        self.assertEqual(reopened.load(), [])
+        reopened.close()
+
+    def test_wal_mode(self):
+        """Test the database runs in write-ahead logging mode."""
+        mode = self.storage._conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+
+    def test_apply_row_changes(self):
+        """Test puts and deletes are applied as row operations in order."""
+        self.storage.load()
+        updated = dict(SAMPLE_BOOKS[0], price=20.0)
+        added = {'id': '4', 'title': 'Dune', 'author': 'Frank Herbert',
+                 'price': 9.5, 'in_stock': False}
+        self.storage.apply([('put', updated), ('delete', '2'), ('put', added)], lambda: [])
+        self.assertEqual(self.storage.load(), [updated, SAMPLE_BOOKS[2], added])
+
+    def test_changes_since(self):
+        """Test the rows changed since a position are read back."""
+        self.storage.load()
+        other = SqliteStorage(self.path('books.db'))
+        position = other.position()
+        added = {'id': '4', 'title': 'Dune', 'author': 'Frank Herbert',
+                 'price': 9.5, 'in_stock': True}
+        self.storage.apply([('put', added), ('delete', '1')], lambda: [])
+        changes, position = other.changes_since(position)
+        self.assertEqual(changes, [('put', added), ('delete', '1')])
+        self.assertEqual(other.changes_since(position), ([], position))
+
+        # Trimmed entries and full rewrites can't be told
+        self.storage.KEEP_CHANGES = 1
+        self.storage.apply([('delete', '2'), ('delete', '3')], lambda: [])
+        self.assertIsNone(other.changes_since(position))
+        position = other.position()
+        self.storage.save(SAMPLE_BOOKS)
+        self.assertIsNone(other.changes_since(position))
+        other.close()
+
+    def test_version_tracks_external_commits(self):
+        """Test the data version changes only on other connections' writes."""
+        self.storage.load()
+        version = self.storage.version()
+        self.storage.apply([('delete', '1')], lambda: [])
+        self.assertEqual(self.storage.version(), version)
+
+        other = SqliteStorage(self.path('books.db'))
+        other.apply([('delete', '2')], lambda: [])
+        other.close()
+        self.assertNotEqual(self.storage.version(), version)
+
+
+class TestStoreOnSqlite(StorageTestCase):
+    """Test cases for the book store on the SQLite backend."""
+
+    def test_writes_are_row_operations(self):
+        """Test store writes never rewrite the whole table."""
+        store = BookStore(SqliteStorage(self.path('books.db'), SAMPLE_BOOKS),
+                          flush_interval=0)
+        store.refresh()
+        with patch.object(store.storage, 'save') as mock_save:
+            store.add({'id': '4', 'title': 'Dune', 'author': 'Frank Herbert',
+                       'price': 9.5, 'in_stock': True})
+            store.update('1', {'price': 1.0})
+            store.delete('2')
+            mock_save.assert_not_called()
+        store.close()
+
+        reopened = SqliteStorage(self.path('books.db'))
+        self.assertEqual([b['id'] for b in reopened.load()], ['1', '3', '4'])
+        self.assertEqual(reopened.load()[0]['price'], 1.0)
+        reopened.close()
+
+    def test_reloads_external_changes(self):
+        """Test the store picks up commits made by another process."""
+        store = BookStore(SqliteStorage(self.path('books.db'), SAMPLE_BOOKS),
+                          flush_interval=0, reload_interval=0)
+        self.assertEqual(len(store), 3)
+
+        other = SqliteStorage(self.path('books.db'))
+        other.apply([('delete', '3')], lambda: [])
+        other.close()
+        self.assertIsNone(store.get('3'))
+        store.close()
+
+    def test_failing_listener_loses_nothing(self):
+        """Test a listener's error neither loses the write nor other listeners."""
+        store = BookStore(SqliteStorage(self.path('books.db'), SAMPLE_BOOKS),
+                          flush_interval=0)
+        store.refresh()
+        seen = []
+
+        def failing(event, books):
+            if event == 'add':
+                raise RuntimeError('listener failed')
+
+        store.add_listener(failing)
+        store.add_listener(lambda event, books: seen.append(event))
+        with self.assertLogs('store', 'ERROR'):
+            store.add({'id': '4', 'title': 'Dune', 'author': 'Frank Herbert',
+                       'price': 9.5, 'in_stock': True})
+        self.assertEqual(seen, ['reload', 'add'])
+        store.close()
+
+        reopened = SqliteStorage(self.path('books.db'))
+        self.assertEqual([b['id'] for b in reopened.load()], ['1', '2', '3', '4'])
+        reopened.close()
+
+    def test_rejected_change_is_dropped(self):
+        """Test a book the database can't hold doesn't block later flushes."""
+        store = BookStore(SqliteStorage(self.path('books.db'), SAMPLE_BOOKS),
+                          flush_interval=0)
+        store.refresh()
+        with self.assertLogs('store', 'ERROR'):
+            store.update('1', {'title': None})
+        self.assertEqual(store.get('1')['title'], 'To Kill a Mockingbird')
+        store.delete('2')
+        store.close()
+
+        reopened = SqliteStorage(self.path('books.db'))
+        self.assertEqual(reopened.load(), [SAMPLE_BOOKS[0], SAMPLE_BOOKS[2]])
+        reopened.close()
+
+    def test_sees_other_processes_writes_at_once(self):
+        """Test a write by another store is served without waiting to poll."""
+        store = BookStore(SqliteStorage(self.path('books.db'), SAMPLE_BOOKS),
+                          flush_interval=0, reload_interval=60)
+        other = BookStore(SqliteStorage(self.path('books.db')),
+                          flush_interval=0, reload_interval=60)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(len(other), 3)
+
+        events = []
+        store.add_listener(lambda event, books: events.append(
+            (event, [book['id'] for book in books])))
+        with patch.object(store, 'load') as mock_load:
+            other.update('1', {'price': 1.0})
+            self.assertEqual(store.get('1')['price'], 1.0)
+            self.assertFalse(store.refresh_due())
+            other.delete('2')
+            self.assertIsNone(store.get('2'))
+            mock_load.assert_not_called()
+        self.assertEqual(events[1:], [('update', ['1']), ('delete', ['2'])])
+        other.close()
+        store.close()
+
+
+class TestOpenStorage(StorageTestCase):
+    """Test cases for choosing and migrating between backends."""
+
+    def test_open_storage(self):
+        """Test the backend is chosen from the location."""
+        for location, cls in ((self.path('a.json'), JournalStorage),
+                              (self.path('a.db'), SqliteStorage),
+                              (self.path('a.snap'), SnapshotStorage),
+                              ('sqlite:///' + self.path('b'), SqliteStorage)):
+            storage = open_storage(location)
+            self.assertIsInstance(storage, cls)
+            storage.close()
+
+    def test_copy_catalog(self):
+        """Test a JSON catalog can be imported into SQLite."""
+        JsonStorage(self.path('books.json')).save(SAMPLE_BOOKS)
+        count = copy_catalog(self.path('books.json'), self.path('books.db'))
+        self.assertEqual(count, 3)
+        storage = SqliteStorage(self.path('books.db'))
+        self.assertEqual(storage.load(), SAMPLE_BOOKS)
+        storage.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
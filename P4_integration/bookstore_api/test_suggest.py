@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script for the Bookstore suggestion index
+
+This script tests autocomplete suggestions directly, independent of the API.
+"""
+import random
+import unittest
+
+from suggest import MAX_SUGGESTIONS, SuggestIndex
+
+
+def make_book(book_id, title, author='Anon'):
+    """Helper to build a minimal book record."""
+    return {'id': book_id, 'title': title, 'author': author,
+            'price': 1.0, 'in_stock': True}
+
+
+class TestSuggestIndex(unittest.TestCase):
+    """Test cases for the prefix suggestion index."""
+
+    def setUp(self):
+        """Build an index over a handful of books."""
+        self.index = SuggestIndex()
+        self.index.on_change('reload', [
+            make_book('1', 'The Great Gatsby', 'F. Scott Fitzgerald'),
+            make_book('2', 'Tender Is the Night', 'F. Scott Fitzgerald'),
+            make_book('3', 'Great Expectations', 'Charles Dickens'),
+        ])
+
+    def texts(self, prefix, limit=10):
+        """Helper to list the suggested texts for a prefix."""
+        return [s['text'] for s in self.index.suggest(prefix, limit)]
+
+    def test_prefix_matches_word_starts(self):
+        """Test a prefix matches the start of any word, across words too."""
+        self.assertEqual(self.texts('gre'), ['Great Expectations', 'The Great Gatsby'])
+        self.assertEqual(self.texts('GREAT GAT'), ['The Great Gatsby'])
+        self.assertEqual(self.texts('reat'), [])
+        self.assertEqual(self.texts('  '), [])
+
+    def test_popular_first(self):
+        """Test suggestions shared by more books rank first."""
+        suggestions = self.index.suggest('t')
+        self.assertEqual(suggestions[0], {'text': 'Tender Is the Night',
+                                          'field': 'title', 'books': 1})
+        self.assertEqual(self.index.suggest('f'), [
+            {'text': 'F. Scott Fitzgerald', 'field': 'author', 'books': 2},
+        ])
+        self.assertEqual(self.texts('t', limit=1), ['Tender Is the Night'])
+
+    def test_incremental_updates(self):
+        """Test kept suggestions follow adds, updates and deletes."""
+        self.assertEqual(self.texts('gre'), ['Great Expectations', 'The Great Gatsby'])
+        self.index.on_change('add', [make_book('4', 'Great Expectations', 'Someone')])
+        self.index.on_change('update', [make_book('1', 'Greatness', 'F. Scott Fitzgerald')])
+        self.assertEqual(self.texts('gre'), ['Great Expectations', 'Greatness'])
+        self.assertEqual(self.index.suggest('great e')[0]['books'], 2)
+
+        self.index.on_change('delete', [make_book('4', 'Great Expectations')])
+        self.index.on_change('delete', [make_book('3', 'Great Expectations')])
+        self.assertEqual(self.texts('gre'), ['Greatness'])
+        self.assertNotIn('expectations', self.index._vocab)
+
+    def test_repeated_words(self):
+        """Test a phrase repeating a word can be added and deleted again."""
+        self.index.on_change('add', [make_book('4', 'Tora Tora Tora')])
+        self.assertEqual(self.texts('tor'), ['Tora Tora Tora'])
+        self.index.on_change('delete', [make_book('4', 'Tora Tora Tora')])
+        self.assertEqual(self.texts('to'), [])
+        self.assertNotIn('tora', self.index._vocab)
+        self.assertEqual(self.index._vocab, sorted(self.index._word_phrases))
+        self.assertEqual(self.texts('gre'), ['Great Expectations', 'The Great Gatsby'])
+
+    def test_reload_rebuilds_lazily(self):
+        """Test a reload is only indexed when suggestions are next asked for."""
+        self.index.on_change('reload', [make_book('9', 'Dune', 'Frank Herbert')])
+        self.assertTrue(self.index._stale)
+        self.assertEqual(self.texts('d'), ['Dune'])
+        self.assertFalse(self.index._stale)
+
+    def test_matches_rebuild_after_random_changes(self):
+        """Test incremental maintenance agrees with a fresh index."""
+        rng = random.Random(7)
+        titles = ['Alpha', 'Alpha Beta', 'Beta', 'Gamma Alpha', 'Alps', 'Beta Beta']
+        books = {}
+        for i in range(MAX_SUGGESTIONS * 3):
+            book = make_book(str(i), f"{rng.choice(titles)} {i % 60}")
+            books[book['id']] = book
+        self.index.on_change('reload', list(books.values()))
+        prefixes = ['a', 'al', 'alp', 'b', 'gamma a', '1']
+        for prefix in prefixes:
+            self.index.suggest(prefix, MAX_SUGGESTIONS)
+
+        for i in range(300):
+            book_id = str(rng.randrange(MAX_SUGGESTIONS * 4))
+            if book_id in books and rng.random() < 0.3:
+                self.index.on_change('delete', [books.pop(book_id)])
+            else:
+                book = make_book(book_id, f"{rng.choice(titles)} {rng.randrange(60)}")
+                event = 'update' if book_id in books else 'add'
+                books[book_id] = book
+                self.index.on_change(event, [book])
+
+        fresh = SuggestIndex()
+        fresh.on_change('reload', list(books.values()))
+        for prefix in prefixes:
+            self.assertEqual(self.index.suggest(prefix, MAX_SUGGESTIONS),
+                             fresh.suggest(prefix, MAX_SUGGESTIONS), prefix)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ import requests
 import json
 from tabulate import tabulate
 import sys
+import uuid
 from colorama import Fore, Style, init
 
 # Initialize colorama
@@ -58,22 +59,98 @@ def format_book_table(books):
 
 # API client functions
 
+# Cached GET responses, revalidated with If-None-Match:
+# (url, params) -> (etag, headers, data)
+_response_cache = {}
+MAX_CACHED_RESPONSES = 256
+
+# Times to send an add request before giving up on a timeout
+ADD_BOOK_ATTEMPTS = 3
+
+def cached_get(url, params=None, timeout=10):
+    """
+    Send a GET request, reusing the cached copy if the server says it is current.
+
+    Parameters:
+        url (str): The URL to fetch
+        params (dict): Query parameters
+        timeout (int): Request timeout in seconds
+
+    Returns:
+        tuple: (data, headers) of the fresh or cached response
+
+    Raises:
+        requests.exceptions.RequestException: On network or HTTP errors
+        ValueError: If the response is not valid JSON
+    """
+    key = (url, tuple(sorted((params or {}).items())))
+    cached = _response_cache.get(key)
+    headers = {'If-None-Match': cached[0]} if cached else {}
+
+    response = requests.get(url, params=params, headers=headers, timeout=timeout)
+    if cached and response.status_code == 304:
+        return cached[2], cached[1]
+
+    response.raise_for_status()
+    data = response.json()
+    etag = response.headers.get('ETag')
+    if etag:
+        if len(_response_cache) >= MAX_CACHED_RESPONSES:
+            _response_cache.clear()
+        _response_cache[key] = (etag, dict(response.headers), data)
+    return data, response.headers
+
 def get_all_books():
     """Retrieve all books from the API."""
     try:
-        response = requests.get(BOOKS_ENDPOINT)
-        response.raise_for_status()
-        books = response.json()
+        books, _ = cached_get(BOOKS_ENDPOINT)
         return books
     except requests.exceptions.RequestException as e:
         print_error(f"Failed to retrieve books: {e}")
         return []
 
+def iter_books(page_size=100, fields=None):
+    """
+    Retrieve books one page at a time.
+
+    Parameters:
+        page_size (int): The number of books to request per page
+        fields (list): Only fetch these fields of each book, e.g. ["id", "title"]
+
+    Yields:
+        list: Each page of books, in book ID order
+    """
+    params = {'limit': page_size}
+    if fields:
+        params['fields'] = ','.join(fields)
+
+    while True:
+        try:
+            page, headers = cached_get(BOOKS_ENDPOINT, params=dict(params))
+        except requests.exceptions.RequestException as e:
+            print_error(f"Failed to retrieve books: {e}")
+            return
+        except ValueError:
+            print_error("Received invalid response from server")
+            return
+
+        if page:
+            yield page
+
+        cursor = headers.get('X-Next-Cursor')
+        if not cursor:
+            return
+        params['cursor'] = cursor
+
 def display_all_books():
-    """Display all books in a formatted table."""
+    """Display all books in a formatted table, one page at a time."""
     print_info("Fetching all books...")
-    books = get_all_books()
-    print(format_book_table(books))
+    found = False
+    for page in iter_books():
+        found = True
+        print(format_book_table(page))
+    if not found:
+        print(format_book_table([]))
 
 # TODO: Implement the get_book_by_id function
 def get_book_by_id(book_id):
@@ -192,12 +269,23 @@ def add_book():
 
 
     try:
-        # Send POST request with JSON data
-        response = requests.post(
-            BOOKS_ENDPOINT,
-            json=data,  # Automatically sets Content-Type to application/json
-            timeout=10  # 10-second timeout
-        )
+        # Send POST request with JSON data. The same Idempotency-Key goes
+        # with every retry, so a request that timed out after the server
+        # added the book doesn't add it again
+        headers = {'Idempotency-Key': str(uuid.uuid4())}
+        for attempt in range(ADD_BOOK_ATTEMPTS):
+            try:
+                response = requests.post(
+                    BOOKS_ENDPOINT,
+                    json=data,  # Automatically sets Content-Type to application/json
+                    headers=headers,
+                    timeout=10  # 10-second timeout
+                )
+                break
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+                if attempt == ADD_BOOK_ATTEMPTS - 1:
+                    raise
+                print_info("No response from the server, retrying...")
         
         # Check for HTTP errors
         response.raise_for_status()
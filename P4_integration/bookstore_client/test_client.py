@@ -13,8 +13,10 @@ import io
 import sys
 
 # Import client module
+import client
 from client import (
     get_all_books,
+    iter_books,
     get_book_by_id,
     add_book,
     update_book,
@@ -46,6 +48,7 @@ class TestBookstoreClient(unittest.TestCase):
         ]
         
         self.single_book = self.sample_books[0]
+        client._response_cache.clear()
     
     @patch('client.requests.get')
     def test_get_all_books(self, mock_get):
@@ -63,6 +66,39 @@ class TestBookstoreClient(unittest.TestCase):
         self.assertEqual(result, self.sample_books)
         mock_get.assert_called_once()
     
+    @patch('client.requests.get')
+    def test_get_all_books_revalidates(self, mock_get):
+        """Test get_all_books reuses its cached copy on 304 Not Modified."""
+        first = MagicMock(status_code=200, headers={'ETag': '"v1"'})
+        first.json.return_value = self.sample_books
+        not_modified = MagicMock(status_code=304, headers={'ETag': '"v1"'})
+        mock_get.side_effect = [first, not_modified]
+
+        self.assertEqual(get_all_books(), self.sample_books)
+        self.assertEqual(get_all_books(), self.sample_books)
+
+        self.assertEqual(mock_get.call_args_list[1][1]['headers'],
+                         {'If-None-Match': '"v1"'})
+        not_modified.json.assert_not_called()
+
+    @patch('client.requests.get')
+    def test_iter_books(self, mock_get):
+        """Test iter_books follows the pagination cursor."""
+        first_page = MagicMock()
+        first_page.json.return_value = self.sample_books[:1]
+        first_page.headers = {'X-Next-Cursor': 'abc'}
+        last_page = MagicMock()
+        last_page.json.return_value = self.sample_books[1:]
+        last_page.headers = {}
+        mock_get.side_effect = [first_page, last_page]
+
+        pages = list(iter_books(page_size=1))
+
+        self.assertEqual(pages, [self.sample_books[:1], self.sample_books[1:]])
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args_list[1][1]['params'],
+                         {'limit': 1, 'cursor': 'abc'})
+
     @patch('client.requests.get')
     def test_get_book_by_id(self, mock_get):
         """Test the get_book_by_id function."""
@@ -140,6 +176,23 @@ class TestBookstoreClient(unittest.TestCase):
         _, kwargs = mock_post.call_args
         self.assertEqual(kwargs['json'], expected_data)
     
+    @patch('builtins.input')
+    @patch('client.requests.post')
+    def test_add_book_retries_with_same_key(self, mock_post, mock_input):
+        """Test a timed-out add is retried with the same Idempotency-Key."""
+        mock_input.side_effect = ["Retry Book", "Retry Author", "9.99", "yes"]
+        mock_response = MagicMock()
+        mock_response.json.return_value = {"id": "7", "title": "Retry Book"}
+        mock_response.raise_for_status.return_value = None
+        mock_post.side_effect = [requests.exceptions.Timeout("timed out"), mock_response]
+
+        result = add_book()
+
+        self.assertEqual(result["id"], "7")
+        self.assertEqual(mock_post.call_count, 2)
+        keys = [kwargs['headers']['Idempotency-Key'] for _, kwargs in mock_post.call_args_list]
+        self.assertEqual(keys[0], keys[1])
+    
     @patch('builtins.input')
     @patch('client.requests.post')
     def test_add_book_error(self, mock_post, mock_input):